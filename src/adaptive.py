@@ -0,0 +1,329 @@
+"""
+Adaptive sequential sampling.
+
+Runs trials like `engine.run_ollama_trials`, but treats the replicates of each
+condition (model, role, pot, offer, prompts and sampling options; everything but
+the seed) as a sample and stops sending them once the condition's estimate is
+precise enough:
+
+    receivers  - acceptance rate, Wilson score interval
+    proposers  - mean offer fraction (offer / pot), normal interval
+
+Replicates are dispatched round-robin across conditions, so every condition
+gets early observations, and each result updates its condition as soon as it
+comes back. A condition's remaining replicates are skipped once it has at least
+`min_replicates` parsed decisions and its interval half-width is at most
+`precision`. Skipped trials are recorded with llm_status="skipped" so they show
+up in the saved results, and `run_adaptive_trials` returns a per-condition report.
+
+Results answered without a new LLM call (response cache hits and coalesced
+duplicates, `llm_cache_hit`) repeat an earlier answer to the same seeded
+request, so they are not counted as observations.
+"""
+
+import math
+import threading
+from statistics import NormalDist
+from pathlib import Path
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+import ollama
+import pandas as pd
+
+import engine
+from adaptive_concurrency import AdaptiveConcurrency
+from dead_letter import DeadLetterFile
+from decisions import detect_decision
+from endpoint_pool import EndpointPool
+from journal import TrialJournal
+from metrics import TrialMetrics
+from response_cache import ResponseCache
+from result_records import ResultTable
+from retries import RetryPolicy
+
+# Columns that define a condition; replicates differ only in the seed.
+CONDITION_COLUMNS = ["model", "role", "pot", "offer", "system-prompt", "base-prompt"] + [
+    col for col in engine.OPTION_INPUT_COLUMNS if col != "seed"
+]
+
+SKIPPED_STATUS = "skipped"
+CONVERGED_REASON = "converged"
+
+
+def _key_value(value: Any) -> Hashable:
+    """Normalizes a condition value so input rows and journaled results compare equal."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    return str(value)
+
+
+def _is_cache_hit(result: Dict[str, Any]) -> bool:
+    hit = result.get("llm_cache_hit")
+    return isinstance(hit, (bool, np.bool_)) and bool(hit)
+
+
+def _outcome(result: Dict[str, Any]) -> Optional[float]:
+    """A trial's observation: 1/0 for an accepting/rejecting receiver, offer/pot for a proposer."""
+    if result.get("llm_status") != "ok":
+        return None
+    role = str(result.get("role") or "").strip().lower()
+    decision = detect_decision(role, str(result.get("llm_response") or ""))
+    if decision is None:
+        return None
+    if role == "receiver":
+        return 1.0 if decision.value == "accept" else 0.0
+    try:
+        pot = float(result.get("pot"))
+    except (TypeError, ValueError):
+        return None
+    return float(decision.value) / pot if pot > 0 else None
+
+
+class ConditionStats:
+    """Running estimate for one condition: count, mean and variance (Welford), plus skips."""
+
+    def __init__(self, role: str):
+        self.role = role
+        self.observed = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.run = 0
+        self.unparsed = 0
+        self.cached = 0
+        self.skipped = 0
+        self.converged = False
+
+    def add(self, value: float) -> None:
+        self.observed += 1
+        delta = value - self.mean
+        self.mean += delta / self.observed
+        self._m2 += delta * (value - self.mean)
+
+    def interval(self, z: float) -> Tuple[float, float]:
+        """Confidence interval for the estimate; (nan, nan) with no observations."""
+        n = self.observed
+        if n == 0:
+            return math.nan, math.nan
+        if self.role == "receiver":
+            # Wilson score interval, which stays sensible near 0 and 1
+            center = (self.mean + z * z / (2 * n)) / (1 + z * z / n)
+            half = z * math.sqrt(self.mean * (1 - self.mean) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+            return center - half, center + half
+        if n < 2:
+            return -math.inf, math.inf
+        half = z * math.sqrt(self._m2 / (n - 1) / n)
+        return self.mean - half, self.mean + half
+
+
+class SequentialSampler:
+    """
+    Tracks every condition's estimate and decides, at dispatch time, whether a
+    trial still needs to run.
+
+    Args:
+        precision (float): Target half-width of the confidence interval, in
+                           acceptance-rate or offer-fraction units (e.g. 0.05).
+        confidence (float): Confidence level of the interval.
+        min_replicates (int): Parsed decisions a condition needs before it can stop.
+        condition_columns (List[str]): Columns that define a condition.
+    """
+
+    def __init__(self, precision: float = 0.05, confidence: float = 0.95, min_replicates: int = 10,
+                 condition_columns: Optional[List[str]] = None):
+        if precision <= 0:
+            raise ValueError(f"precision must be > 0, got {precision}")
+        self.precision = precision
+        self.confidence = confidence
+        self.min_replicates = min_replicates
+        self.condition_columns = list(condition_columns or CONDITION_COLUMNS)
+        self._z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self._lock = threading.Lock()
+        self.conditions: Dict[Tuple, ConditionStats] = {}
+        self._labels: Dict[Tuple, Dict[str, Any]] = {}
+        self._journals_loaded: Set[Path] = set()
+        # Trials an earlier run skipped as converged; a resumed run decides them again
+        self.converged_skips: Set[str] = set()
+
+    def key(self, row: Dict[str, Any]) -> Tuple:
+        return tuple(_key_value(row.get(col)) for col in self.condition_columns)
+
+    def _stats(self, row: Dict[str, Any]) -> ConditionStats:
+        """The condition's stats; call with the lock held."""
+        key = self.key(row)
+        stats = self.conditions.get(key)
+        if stats is None:
+            stats = self.conditions[key] = ConditionStats(str(row.get("role") or "").strip().lower())
+            self._labels[key] = {col: row.get(col) for col in self.condition_columns if col in row}
+        return stats
+
+    def record(self, result: Dict[str, Any], ran: bool = True) -> None:
+        """Folds one finished trial into its condition; `ran` is False for results loaded from a journal."""
+        value = _outcome(result)
+        with self._lock:
+            stats = self._stats(result)
+            if ran:
+                stats.run += 1
+            if _is_cache_hit(result):
+                stats.cached += 1
+                return
+            if value is None:
+                stats.unparsed += 1
+                return
+            stats.add(value)
+            if stats.role in ("receiver", "proposer") and stats.observed >= self.min_replicates:
+                low, high = stats.interval(self._z)
+                stats.converged = (high - low) / 2 <= self.precision
+
+    def load_journal(self, journal: TrialJournal) -> None:
+        """Counts the results already in `journal` towards their conditions, once per journal file."""
+        if journal.path in self._journals_loaded:
+            return
+        self._journals_loaded.add(journal.path)
+        for _, result in journal.iter_entries():
+            if result.get("llm_status") != SKIPPED_STATUS:
+                self.record(result, ran=False)
+            elif result.get("llm_skip_reason") == CONVERGED_REASON:
+                self.converged_skips.add(str(result.get("trial-id")))
+
+    def should_run(self, row: Dict[str, Any]) -> bool:
+        """False once the row's condition has converged; the skip is counted."""
+        with self._lock:
+            stats = self._stats(row)
+            if stats.converged:
+                stats.skipped += 1
+                return False
+            return True
+
+    def report(self) -> pd.DataFrame:
+        """
+        One row per condition: its columns, trials run and skipped, parsed
+        observations, repeated (cached) answers left out of them, estimate (acceptance rate or mean offer fraction), the
+        interval and whether it converged.
+        """
+        rows = []
+        with self._lock:
+            for key, stats in self.conditions.items():
+                low, high = stats.interval(self._z)
+                rows.append({**self._labels[key],
+                             "estimate_kind": "acceptance_rate" if stats.role == "receiver" else "mean_offer_fraction",
+                             "trials_run": stats.run, "trials_skipped": stats.skipped,
+                             "observations": stats.observed, "unparsed": stats.unparsed, "cached": stats.cached,
+                             "estimate": stats.mean if stats.observed else math.nan,
+                             "ci_low": low, "ci_high": high, "ci_half_width": (high - low) / 2,
+                             "converged": stats.converged})
+        return pd.DataFrame(rows)
+
+
+def interleave_conditions(trials_df: pd.DataFrame, condition_columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Reorders trials round-robin across conditions: the first replicate of every
+    condition, then the second, and so on. Index labels are kept.
+    """
+    columns = [c for c in (condition_columns or CONDITION_COLUMNS) if c in trials_df.columns]
+    if not columns or trials_df.empty:
+        return trials_df
+    condition = trials_df.groupby(columns, sort=False, dropna=False, observed=True).ngroup()
+    replicate = condition.groupby(condition).cumcount()
+    order = np.lexsort((np.arange(len(trials_df)), replicate.to_numpy()))
+    return trials_df.iloc[order]
+
+
+def run_adaptive_trials(trials_with_prompts_df: pd.DataFrame,
+                        precision: float = 0.05,
+                        confidence: float = 0.95,
+                        min_replicates: int = 10,
+                        concurrency: int = 1,
+                        model_concurrency: Optional[Dict[str, int]] = None,
+                        host: Optional[str] = None,
+                        cache: Optional[ResponseCache] = None,
+                        journal: Optional[TrialJournal] = None,
+                        pool: Optional[EndpointPool] = None,
+                        metrics: Optional[TrialMetrics] = None,
+                        early_stop_tail: Optional[int] = None,
+                        sampler: Optional[SequentialSampler] = None,
+                        limiter: Optional[AdaptiveConcurrency] = None,
+                        retry: Optional[RetryPolicy] = None,
+                        dead_letter: Optional[DeadLetterFile] = None) -> Tuple[Optional[pd.DataFrame], pd.DataFrame]:
+    """
+    Runs trials with adaptive stopping per condition.
+
+    Args:
+        trials_with_prompts_df (pd.DataFrame): The output of build_prompts_df.
+        precision (float): Target confidence-interval half-width per condition.
+        confidence (float): Confidence level of the intervals.
+        min_replicates (int): Parsed decisions a condition needs before it can stop.
+        concurrency, model_concurrency, host, cache, pool, metrics, early_stop_tail, limiter,
+        retry, dead_letter:
+            As for run_ollama_trials.
+        journal (TrialJournal, optional): As for run_ollama_trials. Results already
+                                          in it count towards their conditions, so a
+                                          resumed (or chunked) run keeps its estimates.
+                                          Trials it holds as skipped are decided again;
+                                          their new entry replaces the skipped one.
+        sampler (SequentialSampler, optional): Carry condition estimates across calls;
+                                               overrides precision/confidence/min_replicates.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: The results in input order (None when a
+            journal is given), skipped trials included with llm_status="skipped";
+            and the per-condition report from SequentialSampler.report.
+    """
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be >= 1, got {concurrency}")
+    if sampler is None:
+        sampler = SequentialSampler(precision, confidence, min_replicates)
+
+    df = trials_with_prompts_df
+    if not pd.api.types.is_integer_dtype(df.index):
+        df = df.reset_index(drop=True)
+    client: engine.OllamaClient = pool if pool is not None else ollama.Client(host=host, timeout=engine._timeout(retry))
+
+    results = ResultTable(df)
+    done = set()
+    if journal is not None:
+        sampler.load_journal(journal)
+        # A converged skip isn't a result: run it if its condition needs more trials now
+        done = journal.completed_ids() - sampler.converged_skips
+        store: engine.ResultSink = journal.append
+    else:
+        store = results.append
+
+    def sink(pos: int, result: Dict[str, Any]) -> None:
+        sampler.record(result)
+        if metrics is not None:
+            metrics.record(result)
+        if dead_letter is not None and engine.is_dead_letter(result):
+            dead_letter.append(result)
+        store(pos, result)
+
+    def pending(trials: Iterable[engine.Trial]) -> Iterator[engine.Trial]:
+        # Checked lazily, as each trial is about to be dispatched
+        for pos, row, options in trials:
+            if str(row.get("trial-id")) in done:
+                continue
+            if sampler.should_run(row):
+                yield pos, row, options
+            else:
+                store(pos, {**row, "llm_status": SKIPPED_STATUS, "llm_skip_reason": CONVERGED_REASON})
+
+    trials = pending(engine._iter_trials(interleave_conditions(df, sampler.condition_columns)))
+    if limiter is not None:
+        limiter.bind(pool)
+        engine._run_trials_concurrently(client, trials, sink, concurrency, model_concurrency, cache, early_stop_tail,
+                                        limiter, retry)
+    elif concurrency == 1 and not model_concurrency:
+        engine._run_trials_sequentially(client, trials, sink, cache, early_stop_tail, retry)
+    else:
+        engine._run_trials_concurrently(client, trials, sink, concurrency, model_concurrency, cache, early_stop_tail,
+                                        retry=retry)
+
+    report = sampler.report()
+    if journal is not None:
+        return None, report
+    return results.to_frame(), report
+
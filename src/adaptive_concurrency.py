@@ -0,0 +1,248 @@
+"""
+Adaptive request concurrency.
+
+Instead of a fixed number of requests in flight, `AdaptiveConcurrency` keeps a
+limit per (endpoint, model) and moves it with what the server reports, using a
+gradient algorithm (after Netflix's Gradient2):
+
+    wait      = client wall time - prompt_eval_duration - eval_duration
+                (time a request spent anywhere but computing: network, Ollama's
+                queue for a free slot, model loads)
+    gradient  = clamp(tolerance * baseline wait / short-term wait, 0.5, 1)
+    limit     = (1 - smoothing) * limit + smoothing * (limit * gradient + sqrt(limit))
+
+While requests are not queueing, the wait stays at its long-term level, the
+gradient is 1 and the limit grows by about sqrt(limit) per sample. Once the
+server runs out of parallel slots (OLLAMA_NUM_PARALLEL), requests start queueing,
+the short-term wait rises above the baseline (a slow-rising floor of recent
+waits) and the limit shrinks towards
+what the server can process. The wait does not depend on num_predict or prompt
+length, so rows with very different sizes still give comparable samples. Failed
+requests (timeouts, 5xx, dropped connections) halve the limit.
+
+The executor asks the controller for a slot before dispatching each trial, so
+when every limit is full it stops pulling trials (and so stops converting input
+rows and building requests) until a request finishes. `timeline()` records how
+each limit moved over the run, for tuning servers.
+"""
+
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from endpoint_pool import EndpointPool
+
+DEFAULT_ENDPOINT = "default"
+
+
+class GradientLimit:
+    """
+    Concurrency limit of one (endpoint, model). Samples are averaged over a window
+    of about one round of in-flight requests, and the limit moves once per window,
+    so it reacts to the load it set rather than to the previous round's.
+
+    Args:
+        initial (float): Starting limit.
+        min_limit (int): Lowest the limit goes.
+        max_limit (int): Highest the limit goes.
+        smoothing (float): Weight of each new estimate in the limit.
+        tolerance (float): How much the short-term wait may exceed the baseline
+                           wait before the limit shrinks.
+        long_window (int): Windows over which the baseline wait follows a rise.
+        min_window (int): Fewest samples per window.
+        slack_s (float): Added to every wait, so jitter in waits of a few
+                         milliseconds does not read as queueing.
+        backoff (float): Factor applied to the limit on a failed request.
+    """
+
+    def __init__(self, initial: float = 4, min_limit: int = 1, max_limit: int = 64,
+                 smoothing: float = 0.2, tolerance: float = 1.5, long_window: int = 500,
+                 min_window: int = 5, slack_s: float = 0.005, backoff: float = 0.5):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.smoothing = smoothing
+        self.tolerance = tolerance
+        self.long_window = long_window
+        self.min_window = min_window
+        self.slack_ns = slack_s * 1e9
+        self.backoff = backoff
+        self.short_ns: Optional[float] = None
+        self.long_ns: Optional[float] = None
+        self.samples = 0
+        self._window_ns = 0.0
+        self._window_count = 0
+        self._window_in_flight = 0.0
+
+    def _clamp(self, limit: float) -> float:
+        return min(max(limit, self.min_limit), self.max_limit)
+
+    def on_sample(self, wait_ns: float, in_flight: float) -> bool:
+        """
+        Folds in the wait of a finished request; `in_flight` is the load it ran under.
+        Returns True when this closed a window (and so the limit may have moved).
+        """
+        self.samples += 1
+        self._window_ns += max(wait_ns, 0.0) + self.slack_ns
+        self._window_count += 1
+        self._window_in_flight = max(self._window_in_flight, in_flight)
+        if self._window_count < max(self.min_window, int(self.limit)):
+            return False
+        short = self._window_ns / self._window_count
+        in_flight = self._window_in_flight
+        self._window_ns, self._window_count, self._window_in_flight = 0.0, 0, 0.0
+
+        self.short_ns = short
+        if self.long_ns is None:
+            self.long_ns = short
+            return True
+        if short < self.long_ns:
+            self.long_ns += (short - self.long_ns) * 0.5
+        else:
+            # Rising only slowly keeps it near the unloaded wait, so sustained queueing
+            # is not mistaken for the new normal; a server that really got slower is
+            # followed over about long_window windows
+            self.long_ns += (short - self.long_ns) / self.long_window
+        if in_flight < self.limit / 2:
+            # Not enough traffic to tell whether a higher limit would help
+            return True
+        gradient = max(0.5, min(1.0, self.tolerance * self.long_ns / short))
+        estimate = self.limit * gradient + math.sqrt(self.limit)
+        self.limit = self._clamp((1 - self.smoothing) * self.limit + self.smoothing * estimate)
+        return True
+
+    def on_error(self) -> None:
+        self.limit = self._clamp(self.limit * self.backoff)
+
+
+def _wait_ns(result: Dict[str, Any]) -> Optional[float]:
+    """The non-compute time of a finished request, or None if it has no server timings."""
+    wall = result.get("llm_client_wall_ns")
+    prompt = result.get("llm_prompt_eval_duration_ns")
+    evaluation = result.get("llm_eval_duration_ns")
+    if wall is None or prompt is None or evaluation is None:
+        return None
+    return float(wall) - float(prompt) - float(evaluation)
+
+
+class AdaptiveConcurrency:
+    """
+    Gradient concurrency limits per (endpoint, model), shared by every trial of a run.
+
+    Args:
+        initial (int): Starting limit per endpoint and model.
+        min_limit (int): Lowest limit per endpoint and model.
+        max_limit (int): Highest limit per endpoint and model.
+        **limit_options: Passed to GradientLimit (smoothing, tolerance, slack_s, ...).
+    """
+
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 64,
+                 **limit_options: Any):
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit_options = limit_options
+        self.endpoints: List[str] = [DEFAULT_ENDPOINT]
+        self._cond = threading.Condition()
+        self._limits: Dict[Tuple[str, str], GradientLimit] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._timeline: List[Dict[str, Any]] = []
+        self._start = time.perf_counter()
+
+    def bind(self, pool: Optional[EndpointPool] = None) -> None:
+        """
+        Sets the endpoints requests can go to: the pool's, which then routes by these
+        limits, or the single default host.
+        """
+        with self._cond:
+            self.endpoints = [e.url for e in pool.endpoints] if pool is not None else [DEFAULT_ENDPOINT]
+        if pool is not None:
+            pool.capacity = self.limit
+
+    @property
+    def max_in_flight(self) -> int:
+        """Most requests that can ever be in flight for one model."""
+        return self.max_limit * len(self.endpoints)
+
+    def _limit(self, endpoint: str, model: str) -> GradientLimit:
+        key = (endpoint, model)
+        limit = self._limits.get(key)
+        if limit is None:
+            limit = self._limits[key] = GradientLimit(self.initial, self.min_limit, self.max_limit,
+                                                      **self.limit_options)
+            self._record(key, limit)
+        return limit
+
+    def limit(self, endpoint: str, model: Optional[str]) -> float:
+        """Current limit of one endpoint for one model."""
+        with self._cond:
+            return self._limit(endpoint, model or "").limit
+
+    def _model_limit(self, model: str) -> int:
+        return max(1, int(sum(self._limit(endpoint, model).limit for endpoint in self.endpoints)))
+
+    def model_limit(self, model: Optional[str]) -> int:
+        """Requests the model may have in flight across all endpoints."""
+        with self._cond:
+            return self._model_limit(model or "")
+
+    # --- Slots ---
+
+    def acquire(self, model: Optional[str]) -> None:
+        """Blocks until the model has a free slot on some endpoint, then takes it."""
+        model = model or ""
+        with self._cond:
+            while self._in_flight.get(model, 0) >= self._model_limit(model):
+                self._cond.wait()
+            self._in_flight[model] = self._in_flight.get(model, 0) + 1
+
+    def release(self, model: Optional[str], result: Dict[str, Any]) -> None:
+        """Frees the slot of a finished trial and updates its endpoint's limit from the result."""
+        model = model or ""
+        endpoint = str(result.get("llm_endpoint") or DEFAULT_ENDPOINT)
+        wait_ns = _wait_ns(result)
+        with self._cond:
+            key = (endpoint, model)
+            limit = self._limit(endpoint, model)
+            # The load the request ran under: the model's requests in flight, of which
+            # the pool routes each endpoint about its share of the limits
+            share = limit.limit / max(sum(self._limit(e, model).limit for e in self.endpoints), 1.0)
+            in_flight = self._in_flight[model] * min(share, 1.0)
+            self._in_flight[model] -= 1
+            if not result.get("llm_cache_hit"):
+                if result.get("llm_status") != "ok":
+                    limit.on_error()
+                    self._record(key, limit, error=True)
+                elif wait_ns is not None and limit.on_sample(wait_ns, in_flight):
+                    self._record(key, limit)
+            self._cond.notify_all()
+
+    # --- Reporting ---
+
+    def _record(self, key: Tuple[str, str], limit: GradientLimit, error: bool = False) -> None:
+        """Appends the limit's state to the timeline: on creation, per window and per error."""
+        self._timeline.append({"elapsed_s": time.perf_counter() - self._start, "endpoint": key[0], "model": key[1],
+                               "limit": limit.limit, "in_flight": self._in_flight.get(key[1], 0),
+                               "short_wait_s": limit.short_ns / 1e9 if limit.short_ns is not None else None,
+                               "long_wait_s": limit.long_ns / 1e9 if limit.long_ns is not None else None,
+                               "error": error})
+
+    def timeline(self) -> pd.DataFrame:
+        """How the limits moved: elapsed seconds, endpoint, model, limit, in-flight, waits and errors."""
+        with self._cond:
+            return pd.DataFrame(self._timeline)
+
+    def snapshot(self) -> pd.DataFrame:
+        """Current limit and smoothed waits per endpoint and model."""
+        with self._cond:
+            return pd.DataFrame([{"endpoint": endpoint, "model": model, "limit": limit.limit,
+                                  "samples": limit.samples,
+                                  "short_wait_s": limit.short_ns / 1e9 if limit.short_ns is not None else None,
+                                  "long_wait_s": limit.long_ns / 1e9 if limit.long_ns is not None else None}
+                                 for (endpoint, model), limit in self._limits.items()])
+
+    def write_timeline(self, path) -> None:
+        self.timeline().to_csv(path, index=False)
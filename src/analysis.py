@@ -0,0 +1,195 @@
+"""
+Batch decision extraction over result tables.
+
+Turns the raw `llm_response` text into structured columns:
+
+    decision        - receivers: "accept" / "reject"; proposers: "offer" when an
+                      amount was found. Missing when the response can't be parsed.
+    proposed_offer  - proposers: the dollar amount they offered; receivers: the
+                      offer they were responding to (the `offer` input).
+    offer_fraction  - proposed_offer / pot.
+
+The patterns are the ones the decisions module compiles for streaming early-stop,
+run here through Arrow's vectorized regex kernels over a whole chunk at a time,
+with the same rule as decisions.detect_decision: an explicit marker, else the
+last loose match. Saved results (CSV, a
+Parquet dataset written by save_results, or a journal) are processed chunk by
+chunk, so analysis memory does not grow with the size of the run.
+"""
+
+import re
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from decisions import PROPOSER_LAST_RE, PROPOSER_MARKER_RE, RECEIVER_LAST_RE, RECEIVER_MARKER_RE
+from journal import TrialJournal
+from result_store import ParquetResultStore
+
+# Columns read from saved results; everything else is left on disk.
+ANALYSIS_INPUT_COLUMNS = ["experiment-id", "trial-id", "model", "role", "pot", "offer", "llm_status", "llm_response"]
+DECISION_COLUMNS = ["decision", "proposed_offer", "offer_fraction"]
+STRING_OUTPUT_COLUMNS = ["experiment-id", "trial-id", "model", "role", "llm_status", "decision"]
+
+
+def _arrow_pattern(pattern: "re.Pattern") -> str:
+    """The pattern source for Arrow's RE2 engine, carrying over case-insensitivity."""
+    return ("(?i)" if pattern.flags & re.IGNORECASE else "") + pattern.pattern
+
+
+def _extract_groups(texts, pattern: "re.Pattern", groups: List[str]) -> Dict[str, np.ndarray]:
+    """Runs `pattern` over an Arrow string array; each group comes back as an object array, None where unmatched."""
+    import pyarrow.compute as pc
+
+    found = pc.extract_regex(texts, _arrow_pattern(pattern))
+    out = {}
+    for group in groups:
+        # Unmatched rows are null; an optional group that did not take part is ""
+        values = pc.if_else(pc.equal(found.field(group), ""), None, found.field(group))
+        out[group] = values.to_numpy(zero_copy_only=False)
+    return out
+
+
+def _extract_decision_groups(texts, marker: "re.Pattern", loose: "re.Pattern",
+                             groups: List[str]) -> Dict[str, np.ndarray]:
+    """Each row's groups from its marker match, or from its last loose match where it has no marker."""
+    found = _extract_groups(texts, marker, groups)
+    fallback = _extract_groups(texts, loose, groups)
+    unmarked = np.logical_and.reduce([pd.isna(found[group]) for group in groups])
+    for group in groups:
+        found[group] = np.where(unmarked, fallback[group], found[group])
+    return found
+
+
+def extract_decisions(results_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds `decision`, `proposed_offer` and `offer_fraction` to a results table.
+
+    Args:
+        results_df (pd.DataFrame): Results with at least `role`, `pot` and
+                                   `llm_response` (and `offer` for receivers).
+
+    Returns:
+        pd.DataFrame: A shallow copy of results_df with the decision columns.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    out = results_df.copy(deep=False)
+    n = len(out)
+    responses = pa.array(out["llm_response"].astype(object).where(out["llm_response"].notna(), "").to_numpy(),
+                         pa.string())
+    role = pc.utf8_lower(pc.utf8_trim_whitespace(pa.array(out["role"].astype(str).to_numpy(), pa.string())))
+    is_receiver = pc.equal(role, "receiver").to_numpy(zero_copy_only=False)
+    is_proposer = pc.equal(role, "proposer").to_numpy(zero_copy_only=False)
+
+    decision = np.full(n, None, dtype=object)
+    proposed = np.full(n, np.nan)
+
+    if is_receiver.any():
+        found = _extract_decision_groups(responses.filter(is_receiver), RECEIVER_MARKER_RE, RECEIVER_LAST_RE,
+                                         ["decision"])
+        decision[is_receiver] = pd.Series(found["decision"], dtype=object).str.lower().to_numpy()
+        if "offer" in out.columns:
+            proposed[is_receiver] = pd.to_numeric(out["offer"], errors="coerce").to_numpy(dtype=float)[is_receiver]
+
+    if is_proposer.any():
+        found = _extract_decision_groups(responses.filter(is_proposer), PROPOSER_MARKER_RE, PROPOSER_LAST_RE,
+                                         ["dollars", "amount"])
+        amount = pd.to_numeric(pd.Series(found["dollars"]).fillna(pd.Series(found["amount"])),
+                               errors="coerce").to_numpy(dtype=float)
+        proposed[is_proposer] = amount
+        decision[np.flatnonzero(is_proposer)[~np.isnan(amount)]] = "offer"
+
+    pot = pd.to_numeric(out["pot"], errors="coerce").to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.where(pot > 0, proposed / pot, np.nan)
+
+    out["decision"] = pd.Categorical(decision, categories=["accept", "reject", "offer"])
+    out["proposed_offer"] = proposed
+    out["offer_fraction"] = fraction
+    return out
+
+
+def iter_result_chunks(results_path: Union[Path, TrialJournal],
+                       columns: Optional[List[str]] = None,
+                       chunksize: int = 100_000) -> Iterator[pd.DataFrame]:
+    """
+    Streams saved results in chunks of at most `chunksize` rows.
+
+    Args:
+        results_path (Path | TrialJournal): A results CSV, a Parquet dataset directory
+                                            (or single .parquet file), or a journal.
+        columns (List[str], optional): Columns to read; missing ones come back empty.
+        chunksize (int): Rows per chunk.
+
+    Yields:
+        pd.DataFrame: The results, chunk by chunk.
+    """
+    if isinstance(results_path, TrialJournal):
+        for chunk in results_path.iter_chunks(chunksize):
+            yield chunk.reindex(columns=columns) if columns else chunk
+        return
+
+    path = Path(results_path)
+    if path.is_dir():
+        yield from ParquetResultStore(path).iter_chunks(columns, chunksize)
+    elif path.suffix.lower() == ".parquet":
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path)
+        names = [c for c in columns if c in parquet.schema_arrow.names] if columns else None
+        for batch in parquet.iter_batches(batch_size=chunksize, columns=names):
+            df = batch.to_pandas()
+            yield df.reindex(columns=columns) if columns else df
+    elif path.suffix.lower() == ".csv":
+        header = pd.read_csv(path, nrows=0).columns
+        usecols = [c for c in columns if c in header] if columns else None
+        for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize):
+            yield chunk.reindex(columns=columns) if columns else chunk
+    else:
+        raise ValueError(f"Unsupported results file '{path}'; expected .csv, .parquet or a dataset directory")
+
+
+def extract_decisions_file(results_path: Union[Path, TrialJournal],
+                           output_path: Path,
+                           chunksize: int = 100_000) -> int:
+    """
+    Runs extract_decisions over saved results chunk by chunk and writes one row per
+    trial (ids, model, role, pot, offer, status and the decision columns; the raw
+    response text is dropped) to a .csv or .parquet file.
+
+    Returns:
+        int: Number of trials written.
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    keep = [c for c in ANALYSIS_INPUT_COLUMNS if c != "llm_response"] + DECISION_COLUMNS
+    parquet = output_path.suffix.lower() == ".parquet"
+    writer = None
+    rows = 0
+    try:
+        for chunk in iter_result_chunks(results_path, ANALYSIS_INPUT_COLUMNS, chunksize):
+            decided = extract_decisions(chunk)[keep]
+            if parquet:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                # Fixed dtypes, so a chunk with no parsed decisions has the same schema
+                decided = decided.astype({col: "string" for col in STRING_OUTPUT_COLUMNS} |
+                                         {"pot": "float64", "offer": "float64"})
+                table = pa.Table.from_pandas(decided, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, table.schema, compression="zstd")
+                writer.write_table(table)
+            else:
+                decided.to_csv(output_path, mode="w" if rows == 0 else "a", header=rows == 0, index=False)
+            rows += len(decided)
+    finally:
+        if writer is not None:
+            writer.close()
+    if rows == 0 and not parquet:
+        pd.DataFrame(columns=keep).to_csv(output_path, index=False)
+    return rows
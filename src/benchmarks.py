@@ -0,0 +1,1093 @@
+"""
+Benchmarks for the experiment pipeline.
+
+Run from the src/ directory, e.g.:
+    python benchmarks.py concurrency --trials 400 --latency 0.02
+    python benchmarks.py pipeline --sizes 1000 10000 --baseline ../data/benchmarks/pipeline-<stamp>.json
+
+The `pipeline` benchmark times every stage of main.run_pipeline at several trial
+counts and writes the results as JSON; with --baseline it flags stages whose
+throughput or memory regressed against an earlier results file.
+
+Every benchmark runs against the local fake Ollama server in fake_ollama.py,
+so no real model or GPU is needed.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+import engine
+import input_table_gen
+import scheduler
+from endpoint_pool import EndpointPool
+from fake_ollama import FakeOllamaServer
+from metrics import TrialMetrics
+
+BENCHMARK_DIR = Path(__file__).parent.parent / "data" / "benchmarks"
+
+
+def make_trials_df(num_trials: int, models: Sequence[str] = ("phi3:latest",)) -> pd.DataFrame:
+    """Builds a synthetic trials DataFrame that is ready for run_ollama_trials."""
+    models = list(models)
+    return pd.DataFrame({
+        "trial-id": [f"trial_{i+1}" for i in range(num_trials)],
+        "role": ["receiver"] * num_trials,
+        "pot": [100] * num_trials,
+        "offer": [50.0] * num_trials,
+        "model": [models[i % len(models)] for i in range(num_trials)],
+        "system-prompt": ["You are a rational agent."] * num_trials,
+        "final-prompt": [f"Trial {i+1}: the pot is $100 and you are offered $50." for i in range(num_trials)],
+        "temperature": [0.8] * num_trials,
+        "seed": [42] * num_trials,
+        "num_predict": [512] * num_trials,
+    })
+
+
+# --- Concurrency ---
+
+def bench_concurrency(num_trials: int = 200,
+                      levels: Sequence[int] = (1, 2, 4, 8, 16),
+                      latency_s: float = 0.02) -> pd.DataFrame:
+    """
+    Times run_ollama_trials at several concurrency levels against a fake server
+    with a fixed per-request latency.
+
+    Returns:
+        pd.DataFrame: One row per level with seconds, trials/sec and speedup vs. level 1.
+    """
+    trials_df = make_trials_df(num_trials)
+    rows: List[dict] = []
+    with FakeOllamaServer(latency_s=latency_s) as server:
+        for level in levels:
+            start = time.perf_counter()
+            results = engine.run_ollama_trials(trials_df, concurrency=level, host=server.url)
+            elapsed = time.perf_counter() - start
+            if (results["llm_status"] != "ok").any():
+                raise RuntimeError(f"Benchmark trials failed at concurrency={level}")
+            if list(results["trial-id"]) != list(trials_df["trial-id"]):
+                raise RuntimeError(f"Results out of order at concurrency={level}")
+            rows.append({"concurrency": level, "seconds": elapsed, "trials_per_sec": num_trials / elapsed})
+
+    out = pd.DataFrame(rows)
+    out["speedup"] = out["trials_per_sec"] / out["trials_per_sec"].iloc[0]
+    return out
+
+
+def bench_adaptive_concurrency(num_trials: int = 800,
+                               latency_s: float = 0.02,
+                               num_parallel: int = 4,
+                               fixed: Sequence[int] = (1, 4, 16),
+                               max_limit: int = 32) -> pd.DataFrame:
+    """
+    Runs the same trials against a fake server that processes `num_parallel`
+    requests at once, with each fixed concurrency and with AdaptiveConcurrency
+    (starting at 1). Too little concurrency leaves slots idle; too much only
+    queues requests on the server, raising latency without adding throughput.
+
+    Returns:
+        pd.DataFrame: One row per setting: seconds, trials/s, client latency
+                      percentiles and, for the adaptive run, its mean and final limit.
+    """
+    from adaptive_concurrency import AdaptiveConcurrency
+
+    trials = make_trials_df(num_trials)
+    rows = []
+    for setting in [*fixed, "adaptive"]:
+        limiter = AdaptiveConcurrency(initial=1, max_limit=max_limit) if setting == "adaptive" else None
+        with FakeOllamaServer(latency_s=latency_s, num_parallel=num_parallel) as server:
+            start = time.perf_counter()
+            results = engine.run_ollama_trials(trials, concurrency=setting if limiter is None else 1,
+                                               host=server.url, limiter=limiter)
+            elapsed = time.perf_counter() - start
+        wall_s = results["llm_client_wall_ns"] / 1e9
+        row = {"concurrency": setting, "seconds": elapsed, "trials_per_s": num_trials / elapsed,
+               "client_wall_p50_s": wall_s.quantile(0.5), "client_wall_p95_s": wall_s.quantile(0.95),
+               "errors": int((results["llm_status"] != "ok").sum())}
+        if limiter is not None:
+            timeline = limiter.timeline()
+            row["mean_limit"] = timeline["limit"].mean()
+            row["final_limit"] = limiter.snapshot()["limit"].iloc[0]
+            print(timeline[["elapsed_s", "limit", "in_flight", "short_wait_s", "long_wait_s"]].iloc[::10].to_string(index=False))
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+# --- Model scheduling ---
+
+def bench_scheduler(num_trials: int = 120,
+                    models: Sequence[str] = ("phi3:latest", "llama2:7b", "openchat:7b"),
+                    latency_s: float = 0.02,
+                    load_delay_s: float = 0.2,
+                    concurrency: int = 4) -> pd.DataFrame:
+    """
+    Compares file-order execution with model-grouped scheduling on interleaved
+    models, against a fake server that keeps two models resident.
+
+    Returns:
+        pd.DataFrame: One row per mode with seconds, model loads and total load time.
+    """
+    trials_df = make_trials_df(num_trials, models)
+    runners = {
+        "file_order": lambda url: engine.run_ollama_trials(trials_df, concurrency, host=url),
+        "scheduled": lambda url: scheduler.run_scheduled_trials(trials_df, concurrency, host=url),
+    }
+    rows: List[dict] = []
+    for mode, run in runners.items():
+        with FakeOllamaServer(latency_s=latency_s, load_delay_s=load_delay_s, max_loaded_models=2) as server:
+            start = time.perf_counter()
+            results = run(server.url)
+            elapsed = time.perf_counter() - start
+            if list(results["trial-id"]) != list(trials_df["trial-id"]):
+                raise RuntimeError(f"Results out of order in mode={mode}")
+            rows.append({"mode": mode, "seconds": elapsed, "model_loads": server.load_count,
+                         "trial_load_s": results["llm_load_duration_ns"].sum() / 1e9})
+    return pd.DataFrame(rows)
+
+
+def bench_prefix_cache(replicates: int = 4,
+                       models: Sequence[str] = ("phi3:latest", "llama2:7b"),
+                       latency_s: float = 0.002,
+                       prompt_tokens_per_s: float = 2_000.0,
+                       num_parallel: int = 4,
+                       concurrency: int = 4) -> pd.DataFrame:
+    """
+    Runs a shuffled factorial design (both roles, several pots and offers) through
+    the scheduler in input order and in prefix order, against a fake server that
+    keeps one evaluated prompt per parallel slot, and compares prompt evaluation.
+
+    Returns:
+        pd.DataFrame: One row per mode with seconds, the estimated share of prompt tokens
+                      shared with the previous trial, prompt tokens the server reused
+                      and evaluated, total llm_prompt_eval_duration_ns in seconds, and
+                      the prompt-eval time saved against input order.
+    """
+    with tempfile.TemporaryDirectory(prefix="prefix-bench-") as tmp:
+        design_path = Path(tmp) / "design.csv"
+        input_table_gen.generate_factorial_design(design_path, pots=(10, 100, 1000),
+                                                  offer_fractions=(0.1, 0.2, 0.3, 0.4, 0.5),
+                                                  models=list(models), replicates=replicates)
+        input_df = engine.load_input_data(design_path)
+    # Researchers randomize trial order, which interleaves roles and conditions
+    input_df = input_df.sample(frac=1.0, random_state=0).reset_index(drop=True)
+    trials_df = engine.build_prompts_df(input_df, preview=False)
+    orders = {"input_order": None, "prefix_order": scheduler.plan_prefix_order(trials_df)}
+
+    rows: List[dict] = []
+    responses: Dict[str, pd.Series] = {}
+    for mode, order in orders.items():
+        reuse = scheduler.prefix_reuse(trials_df, order)
+        with FakeOllamaServer(latency_s=latency_s, prompt_tokens_per_s=prompt_tokens_per_s,
+                              num_parallel=num_parallel, prompt_cache_slots=num_parallel,
+                              max_loaded_models=len(models)) as server:
+            start = time.perf_counter()
+            results = scheduler.run_scheduled_trials(trials_df, concurrency, host=server.url,
+                                                     order_by_prefix=order is not None)
+            elapsed = time.perf_counter() - start
+            if list(results["trial-id"]) != list(trials_df["trial-id"]):
+                raise RuntimeError(f"Results out of order in mode={mode}")
+            responses[mode] = results["llm_response"]
+            rows.append({"mode": mode, "trials": len(results), "seconds": elapsed,
+                         "estimated_shared": reuse["shared_tokens"] / max(reuse["prompt_tokens"], 1),
+                         "tokens_cached": server.prompt_tokens_cached,
+                         "tokens_evaluated": int(results["llm_prompt_eval_count"].sum()),
+                         "prompt_eval_s": results["llm_prompt_eval_duration_ns"].sum() / 1e9})
+    if not responses["input_order"].equals(responses["prefix_order"]):
+        raise RuntimeError("Prefix order changed the responses")
+    out = pd.DataFrame(rows)
+    out["prompt_eval_saved_s"] = out["prompt_eval_s"].iloc[0] - out["prompt_eval_s"]
+    return out
+
+
+# --- Multi-endpoint load balancing ---
+
+def bench_endpoints(num_trials: int = 300,
+                    num_endpoints: int = 3,
+                    models: Sequence[str] = ("phi3:latest", "llama2:7b"),
+                    latency_s: float = 0.02,
+                    load_delay_s: float = 0.2,
+                    concurrency: int = 12,
+                    kill_after_s: float = 0.5) -> pd.DataFrame:
+    """
+    Runs interleaved-model trials through an EndpointPool over several fake servers,
+    stops one server part-way through, and checks that every trial still succeeds.
+
+    Returns:
+        pd.DataFrame: One row per endpoint with trials served, model loads on that
+                      server, failures seen by the pool and whether it was stopped.
+    """
+    trials_df = make_trials_df(num_trials, models)
+    servers = [FakeOllamaServer(latency_s=latency_s, load_delay_s=load_delay_s).start()
+               for _ in range(num_endpoints)]
+    victim = servers[0]
+    try:
+        with EndpointPool([s.url for s in servers], max_connections=concurrency, health_interval_s=0.5) as pool:
+            killer = threading.Timer(kill_after_s, victim.kill)
+            killer.start()
+            start = time.perf_counter()
+            results = engine.run_ollama_trials(trials_df, concurrency, pool=pool)
+            elapsed = time.perf_counter() - start
+            killer.join()
+            stats = {e["url"]: e for e in pool.stats()}
+    finally:
+        for server in servers[1:]:
+            server.stop()
+
+    if (results["llm_status"] != "ok").any():
+        raise RuntimeError(f"{(results['llm_status'] != 'ok').sum()} trials failed despite failover")
+    served = results["llm_endpoint"].value_counts()
+    print(f"{num_trials} trials in {elapsed:.2f}s across {num_endpoints} endpoints")
+    return pd.DataFrame([{"endpoint": s.url, "stopped": s is victim, "trials": int(served.get(s.url, 0)),
+                          "model_loads": s.load_count, "pool_failures": stats[s.url]["failures"]}
+                         for s in servers])
+
+
+# --- Multi-process queue ---
+
+# Columns that legitimately differ between two runs of the same trials.
+TIMING_COLUMN_PATTERN = r"duration|_ns$|created_at|endpoint"
+
+
+def describe_differences(expected: pd.DataFrame, actual: pd.DataFrame) -> List[str]:
+    """
+    How two runs' results differ, timing columns aside: missing or extra columns,
+    column order, row count, and per column the rows that differ (first few shown).
+    An empty list means they match.
+    """
+    problems = []
+    missing = [c for c in expected.columns if c not in actual.columns]
+    extra = [c for c in actual.columns if c not in expected.columns]
+    if missing:
+        problems.append(f"missing columns: {missing}")
+    if extra:
+        problems.append(f"extra columns: {extra}")
+    if not missing and not extra and list(expected.columns) != list(actual.columns):
+        problems.append("columns in a different order")
+    if len(expected) != len(actual):
+        problems.append(f"{len(actual)} rows instead of {len(expected)}")
+        return problems
+    timing = expected.columns.str.contains(TIMING_COLUMN_PATTERN)
+    for col in expected.columns[~timing]:
+        if col not in actual.columns:
+            continue
+        a, b = expected[col].reset_index(drop=True), actual[col].reset_index(drop=True)
+        differs = (a != b) & ~(a.isna() & b.isna())
+        if differs.any():
+            rows = list(differs[differs].index[:5])
+            problems.append(f"{col}: {int(differs.sum())} rows differ, e.g. rows {rows} "
+                            f"({a[rows[0]]!r} vs {b[rows[0]]!r})")
+    return problems
+
+
+def bench_queue(replicates: int = 50,
+                num_workers: int = 3,
+                concurrency: int = 4,
+                latency_s: float = 0.05,
+                lease_s: float = 2.0,
+                kill_after_s: float = 0.2) -> pd.DataFrame:
+    """
+    Runs the same sweep once through main.run_pipeline and once through trial_queue
+    worker processes, each with its own fake Ollama server, killing one worker
+    part-way through so its batch has to be taken over when the lease expires.
+    Checks the merged output matches the single-process output (timing columns aside)
+    and raises, listing the differences, if it doesn't.
+
+    Returns:
+        pd.DataFrame: One row per run mode with seconds and rows, plus queue status.
+    """
+    import main
+    from trial_queue import TrialQueue
+
+    rows: List[dict] = []
+    with tempfile.TemporaryDirectory(prefix="queue-bench-") as tmp:
+        tmp = Path(tmp)
+        input_path = tmp / "sweep.csv"
+        input_table_gen.generate_factorial_design(input_path, pots=(10, 100), offer_fractions=(0.3, 0.5),
+                                                  models=("phi3:latest",), seeds=None, replicates=replicates)
+
+        # Single process, as main.py runs it
+        use_cache, main.USE_RESPONSE_CACHE = main.USE_RESPONSE_CACHE, False
+        host = os.environ.get("OLLAMA_HOST")
+        try:
+            with FakeOllamaServer(latency_s=latency_s) as server:
+                os.environ["OLLAMA_HOST"] = server.url
+                start = time.perf_counter()
+                main.run_pipeline(input_path, tmp / "single.csv", metrics_port=None)
+                rows.append({"mode": "single process", "seconds": time.perf_counter() - start})
+        finally:
+            main.USE_RESPONSE_CACHE = use_cache
+            if host is None:
+                os.environ.pop("OLLAMA_HOST", None)
+            else:
+                os.environ["OLLAMA_HOST"] = host
+
+        # Worker processes sharing one queue file
+        queue_path = tmp / "sweep.sqlite"
+        with TrialQueue(queue_path) as trial_queue:
+            trial_queue.enqueue(input_path, batch_size=25)
+        servers = [FakeOllamaServer(latency_s=latency_s).start() for _ in range(num_workers)]
+        try:
+            start = time.perf_counter()
+            workers = [subprocess.Popen([sys.executable, "-m", "trial_queue", "worker", "--queue", str(queue_path),
+                                         "--host", s.url, "--concurrency", str(concurrency),
+                                         "--lease-s", str(lease_s), "--no-cache", "--worker-id", f"worker-{i}"],
+                                        cwd=Path(__file__).parent, stdout=subprocess.DEVNULL)
+                       for i, s in enumerate(servers)]
+            with TrialQueue(queue_path) as trial_queue:
+                # Kill worker-0 while it holds a batch
+                while "worker-0" not in trial_queue.active_leases().values():
+                    time.sleep(0.05)
+            time.sleep(kill_after_s)
+            workers[0].kill()
+            for worker in workers[1:]:
+                worker.wait()
+            elapsed = time.perf_counter() - start
+        finally:
+            for server in servers:
+                server.stop()
+        with TrialQueue(queue_path) as trial_queue:
+            status = trial_queue.status()
+            trial_queue.merge(tmp / "queued.csv")
+        rows.append({"mode": f"{num_workers} workers (1 killed)", "seconds": elapsed, **status})
+
+        single = pd.read_csv(tmp / "single.csv")
+        queued = pd.read_csv(tmp / "queued.csv")
+        differences = describe_differences(single, queued)
+        for row, df in zip(rows, (single, queued)):
+            row["rows"] = len(df)
+            row["matches_single_process"] = not differences
+    if differences:
+        raise RuntimeError("Queued output does not match the single-process run:\n  " + "\n  ".join(differences))
+    return pd.DataFrame(rows)
+
+
+# --- Prompt construction ---
+
+PROPOSER_TEMPLATE = ("You are the proposer in an ultimatum game. The total pot is ${pot}. "
+                     "State your offer to the receiver and justify your reasoning.")
+RECEIVER_TEMPLATE = ("You are the receiver in an ultimatum game. The total pot is ${pot}. "
+                     "The proposer has offered you ${offer}. If you accept, you will receive ${offer} "
+                     "and the proposer will receive ${remainder}. Decide whether to accept or reject.")
+
+
+def make_prompt_inputs(num_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Builds a factorial-style input table with both roles, several pots and offers."""
+    rng = np.random.default_rng(seed)
+    roles = rng.choice(np.array(["proposer", "receiver"], dtype=object), size=num_rows)
+    pots = rng.choice(np.array([10, 100, 1000]), size=num_rows)
+    offers = np.round(pots * rng.choice(np.linspace(0.0, 1.0, 11), size=num_rows), 2)
+    templates = np.array([PROPOSER_TEMPLATE, RECEIVER_TEMPLATE], dtype=object)[(roles == "receiver").astype(np.intp)]
+    return pd.DataFrame({"role": roles, "pot": pots, "offer": offers, "base-prompt": templates})
+
+
+def bench_prompts(sizes: Sequence[int] = (10**5, 10**6, 10**7), legacy_max_rows: int = 10**5) -> pd.DataFrame:
+    """
+    Times the batched format_prompts against the row-wise apply it replaced. The
+    legacy path is only timed (and compared byte for byte) up to legacy_max_rows.
+
+    Returns:
+        pd.DataFrame: One row per size with seconds and rows/sec for each path.
+    """
+    rows: List[dict] = []
+    for size in sizes:
+        inputs = make_prompt_inputs(size)
+        start = time.perf_counter()
+        prompts = engine.format_prompts(inputs)
+        batched_s = time.perf_counter() - start
+        row = {"rows": size, "batched_s": batched_s, "batched_rows_per_sec": size / batched_s,
+               "legacy_s": np.nan, "identical": None}
+        if size <= legacy_max_rows:
+            start = time.perf_counter()
+            legacy = inputs.apply(engine._format_prompt_row, axis=1)
+            row["legacy_s"] = time.perf_counter() - start
+            row["identical"] = bool((legacy.to_numpy() == prompts.to_numpy()).all())
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+# --- Retries and dead letters ---
+
+def bench_retries(num_trials: int = 400,
+                  error_rate: float = 0.2,
+                  hang_rate: float = 0.02,
+                  timeout_s: float = 0.5,
+                  budget_ratio: float = 0.2,
+                  concurrency: int = 16) -> pd.DataFrame:
+    """
+    Runs trials against a flaky fake server (HTTP 500s and requests that hang
+    for a minute) without and with a RetryPolicy, then re-feeds the dead-letter
+    file of the retried run to a healthy server on its own.
+
+    Returns:
+        pd.DataFrame: One row per run: seconds, ok and failed trials, failures by
+                      kind, retries spent and trials dead-lettered.
+    """
+    from dead_letter import DeadLetterFile
+    from retries import RetryBudget, RetryPolicy
+
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="retry-bench-") as tmp:
+        # Real input rows (with base-prompt), so the dead-letter file is a valid input file
+        design_path = Path(tmp) / "design.parquet"
+        input_table_gen.generate_factorial_design(design_path, pots=(10, 100), offer_fractions=(0.2, 0.5),
+                                                  models=("phi3:latest",), seeds=None,
+                                                  replicates=max(num_trials // 8, 1))
+        trials = engine.build_prompts_df(pd.read_parquet(design_path), preview=False)
+        dead_letter_path = Path(tmp) / "OUT.dead-letter.csv"
+        for mode in ("no_retries", "retries", "refeed"):
+            if mode == "refeed":
+                if not dead_letter_path.exists():
+                    break
+                retry, server_options = RetryPolicy(timeout_s=timeout_s), {}
+                inputs = engine.build_prompts_df(engine.load_input_data(dead_letter_path), preview=False)
+            else:
+                retry = None
+                if mode == "retries":
+                    retry = RetryPolicy(base_delay_s=0.05, max_delay_s=1.0, timeout_s=timeout_s,
+                                        budget=RetryBudget(ratio=budget_ratio))
+                server_options = {"error_rate": error_rate, "hang_rate": hang_rate}
+                inputs = trials
+            with FakeOllamaServer(latency_s=0.01, hang_s=60.0, **server_options) as server, \
+                    DeadLetterFile(Path(tmp) / f"{mode}.dead-letter.csv" if mode != "retries"
+                                   else dead_letter_path) as dead_letter:
+                if retry is None:
+                    # Without a policy a hung request would stall forever; give the client the same timeout
+                    client_retry = RetryPolicy(max_attempts=1, timeout_s=timeout_s)
+                else:
+                    client_retry = retry
+                start = time.perf_counter()
+                results = engine.run_ollama_trials(inputs, concurrency, host=server.url,
+                                                   retry=client_retry, dead_letter=dead_letter)
+                elapsed = time.perf_counter() - start
+            kinds = results.get("llm_error_kind", pd.Series(dtype=object)).value_counts()
+            rows.append({"run": mode, "trials": len(results), "seconds": elapsed,
+                         "ok": int((results["llm_status"] == "ok").sum()),
+                         "failed": int((results["llm_status"] == "error").sum()),
+                         "failed_transient": int(kinds.get("transient", 0)),
+                         "failed_timeout": int(kinds.get("timeout", 0)),
+                         "retries": int((results["llm_attempts"] - 1).clip(lower=0).sum()),
+                         "budget_denied": client_retry.budget.stats()["denied"],
+                         "dead_lettered": dead_letter.count})
+    return pd.DataFrame(rows)
+
+
+# --- Paired games ---
+
+def bench_games(num_games: int = 100,
+                receiver_models: Sequence[str] = ("phi3:latest", "llama3:8b"),
+                latency_s: float = 0.05,
+                concurrency: int = 8) -> pd.DataFrame:
+    """
+    Runs proposer -> receiver games in two phases (every proposer, then every
+    receiver with the parsed offers) and pipelined by games.run_paired_games,
+    against a fake server with lognormal latency, and checks both give the same
+    paired outcomes.
+
+    Returns:
+        pd.DataFrame: One row per mode: seconds, games, receivers skipped and
+                      whether the paired outcomes match the phased run.
+    """
+    import games
+
+    rows = []
+    paired = {}
+    with tempfile.TemporaryDirectory(prefix="games-bench-") as tmp:
+        design_path = Path(tmp) / "games.parquet"
+        input_table_gen.generate_game_design(design_path, pots=(10, 100), proposer_models=("phi3:latest",),
+                                             receiver_models=receiver_models,
+                                             replicates=max(num_games // 2, 1))
+        trials = engine.build_prompts_df(pd.read_parquet(design_path), preview=False)
+        for mode in ("phased", "pipelined"):
+            with FakeOllamaServer(latency_s=latency_s, latency_distribution="lognormal", latency_spread=0.8,
+                                  max_loaded_models=len(receiver_models) + 1) as server:
+                start = time.perf_counter()
+                if mode == "phased":
+                    proposers = engine.run_ollama_trials(trials[trials["role"] == "proposer"], concurrency,
+                                                         host=server.url)
+                    outcomes = {games.game_key(r["game-id"]): games.proposer_outcome(r)
+                                for r in proposers.to_dict(orient="records")}
+                    receivers = trials[trials["role"] == "receiver"].copy()
+                    for col in games.PROPOSER_COLUMNS + ["offer"]:
+                        receivers[col] = [outcomes[g][col] for g in receivers["game-id"]]
+                    receivers = receivers[receivers["offer"].notna()]
+                    receivers["final-prompt"] = engine.format_prompts(receivers)
+                    receivers = engine.run_ollama_trials(receivers, concurrency, host=server.url)
+                    results = pd.DataFrame(proposers.to_dict(orient="records") +
+                                           receivers.to_dict(orient="records"))
+                else:
+                    results = games.run_paired_games(trials, concurrency, host=server.url)
+                elapsed = time.perf_counter() - start
+            paired[mode] = games.pair_games(results).sort_values("receiver_trial_id").reset_index(drop=True)
+            rows.append({"mode": mode, "games": int(trials["game-id"].nunique()), "trials": len(results),
+                         "seconds": elapsed,
+                         "receivers_skipped": int((results["llm_status"] == games.SKIPPED_STATUS).sum()),
+                         "accept_rate": float((paired[mode]["decision"] == "accept").mean())})
+    compare = ["game-id", "offer", "decision", "proposer_payoff", "receiver_payoff"]
+    for row in rows:
+        row["matches_phased"] = paired[row["mode"]][compare].equals(paired["phased"][compare])
+    return pd.DataFrame(rows)
+
+
+# --- Streaming early stop ---
+
+def bench_early_stop(num_trials: int = 200,
+                     tails: Sequence[Optional[int]] = (None, 32, 8, 0),
+                     response_tokens: int = 300,
+                     eval_tokens_per_s: float = 2_000.0,
+                     concurrency: int = 8) -> pd.DataFrame:
+    """
+    Runs proposer and receiver trials against a fake server that writes long
+    responses, once waiting for full responses (tail None) and once per early-stop
+    tail, and compares time and tokens generated.
+
+    Returns:
+        pd.DataFrame: One row per tail with seconds, tokens the server generated,
+                      summed llm_tokens_saved and the share of trials cut at a decision.
+    """
+    trials = make_prompt_inputs(num_trials)
+    trials["final-prompt"] = engine.format_prompts(trials)
+    trials["trial-id"] = [f"trial_{i+1}" for i in range(num_trials)]
+    trials["model"] = "phi3:latest"
+    trials["num_predict"] = 512
+    rows: List[dict] = []
+    for tail in tails:
+        with FakeOllamaServer(latency_s=0.005, response_tokens=response_tokens,
+                              eval_tokens_per_s=eval_tokens_per_s) as server:
+            start = time.perf_counter()
+            results = engine.run_ollama_trials(trials, concurrency, host=server.url, early_stop_tail=tail)
+            elapsed = time.perf_counter() - start
+            if (results["llm_status"] != "ok").any():
+                raise RuntimeError(f"Trials failed with early_stop_tail={tail}")
+            server_tokens = server.tokens_generated
+        cut = results["llm_truncation_reason"].eq("decision") if "llm_truncation_reason" in results else False
+        rows.append({"tail": "full" if tail is None else tail, "seconds": elapsed, "server_tokens": server_tokens,
+                     "tokens_saved": int(results.get("llm_tokens_saved", pd.Series(0)).sum()),
+                     "truncated_share": float(np.mean(cut))})
+    return pd.DataFrame(rows)
+
+
+# --- Decision extraction ---
+
+def make_result_rows(num_rows: int, seed: int = 0) -> pd.DataFrame:
+    """Synthetic results with varied, realistic decision phrasings and some unparseable answers."""
+    rng = np.random.default_rng(seed)
+    inputs = make_prompt_inputs(num_rows, seed)
+    is_receiver = (inputs["role"] == "receiver").to_numpy()
+    receiver_texts = np.array([
+        "Decision: ACCEPT. The offer is fair enough given the pot.",
+        "**Decision:** Reject. Taking less than a third would set a bad precedent.",
+        "After weighing it up, I will accept the offer because something beats nothing.",
+        "I reject this offer; it is insulting.",
+        "Let me think about whether the split is reasonable before deciding.",
+    ], dtype=object)
+    # (before amount, after amount) pairs
+    proposer_parts = [
+        ("I offer $", " to the receiver, keeping the rest."),
+        ("My offer is $", ". This should be acceptable."),
+        ("Offer: $", " - a fair split that the receiver will likely accept."),
+        ("I propose to give you ", " dollars out of the pot."),
+        ("There are many ways to split this pot; fairness matters.", ""),
+    ]
+    choice = rng.integers(0, 5, size=num_rows)
+    amounts = pd.Series(np.round(inputs["pot"].to_numpy() * rng.uniform(0.2, 0.6, size=num_rows)).astype(int).astype(str))
+    amounts[choice == 4] = ""
+    before = pd.Series(np.array([b for b, _ in proposer_parts], dtype=object)[choice])
+    after = pd.Series(np.array([a for _, a in proposer_parts], dtype=object)[choice])
+    proposer = before + amounts + after
+    responses = np.where(is_receiver, receiver_texts[choice], proposer.to_numpy())
+    inputs["llm_response"] = responses
+    inputs["trial-id"] = [f"trial_{i+1}" for i in range(num_rows)]
+    return inputs
+
+
+def bench_decisions(sizes: Sequence[int] = (10**4, 10**5, 10**6), per_row_max_rows: int = 10**5) -> pd.DataFrame:
+    """
+    Times batch decision extraction at several sizes to show it scales linearly,
+    against per-row detect_decision calls up to per_row_max_rows (and checks both
+    agree), plus streaming extraction from a saved Parquet dataset.
+
+    Returns:
+        pd.DataFrame: One row per size with seconds and ns/row per path.
+    """
+    import analysis
+    from decisions import detect_decision
+
+    rows: List[dict] = []
+    with tempfile.TemporaryDirectory(prefix="decisions-bench-") as tmp:
+        for size in sizes:
+            results = make_result_rows(size)
+            start = time.perf_counter()
+            decided = analysis.extract_decisions(results)
+            batch_s = time.perf_counter() - start
+            row = {"rows": size, "batch_s": batch_s, "batch_ns_per_row": batch_s / size * 1e9,
+                   "parsed_share": float(decided["decision"].notna().mean()),
+                   "per_row_s": np.nan, "agree": None, "file_s": np.nan}
+            if size <= per_row_max_rows:
+                start = time.perf_counter()
+                per_row = [detect_decision(r, t) for r, t in zip(results["role"], results["llm_response"])]
+                row["per_row_s"] = time.perf_counter() - start
+                values = [d.value if d is not None else None for d in per_row]
+                expected = decided["decision"].astype(object).where(decided["role"] == "receiver",
+                                                                    decided["proposed_offer"])
+                row["agree"] = all((v is None and pd.isna(e)) or (v is not None and not pd.isna(e)
+                                   and (v == e or float(v) == e)) for v, e in zip(values, expected))
+
+            dataset = Path(tmp) / f"results-{size}.parquet"
+            results["model"] = "phi3:latest"
+            engine.save_results(results, dataset)
+            start = time.perf_counter()
+            analysis.extract_decisions_file(dataset, Path(tmp) / f"decisions-{size}.parquet")
+            row["file_s"] = time.perf_counter() - start
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+# --- Option resolution ---
+
+def bench_options(sizes: Sequence[int] = (10**4, 10**5, 10**6), legacy_max_rows: int = 10**5) -> pd.DataFrame:
+    """
+    Times column-wise option resolution against building options row by row.
+
+    Returns:
+        pd.DataFrame: One row per size with seconds per path and distinct option sets.
+    """
+    rows: List[dict] = []
+    for size in sizes:
+        rng = np.random.default_rng(size)
+        trials = make_trials_df(size)
+        trials["temperature"] = rng.choice([0.0, 0.4, 0.8, 1.2], size=size)
+        trials["stop_sequence"] = rng.choice(np.array(["", "Offer:|Decision:"], dtype=object), size=size)
+        trials["use_mmap"] = True
+        start = time.perf_counter()
+        codes, option_sets = engine.resolve_option_sets(trials)
+        row = {"rows": size, "resolve_s": time.perf_counter() - start, "option_sets": len(option_sets),
+               "per_row_s": np.nan}
+        if size <= legacy_max_rows:
+            start = time.perf_counter()
+            for record in trials.to_dict(orient="records"):
+                engine._build_options(record)
+            row["per_row_s"] = time.perf_counter() - start
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+# --- Result memory ---
+
+def _fake_result_columns(rng: np.random.Generator, i: int) -> Dict[str, Any]:
+    """llm_* columns shaped like a successful _run_single_trial result."""
+    eval_ns, prompt_ns = (int(x) for x in rng.integers(10**8, 10**10, size=2))
+    return {"llm_status": "ok", "llm_model": "phi3:latest", "llm_created_at": f"2025-01-01T00:00:{i:09d}Z",
+            "llm_response": f"Decision: ACCEPT. Response {i} with the reasoning that follows.",
+            "llm_done": True, "llm_done_reason": "stop", "llm_eval_count": int(rng.integers(20, 400)),
+            "llm_eval_duration_ns": eval_ns, "llm_prompt_eval_count": 120, "llm_prompt_eval_duration_ns": prompt_ns,
+            "llm_load_duration_ns": 0, "llm_total_duration_ns": eval_ns + prompt_ns, "llm_cache_hit": False,
+            "llm_attempts": 1, "llm_client_wall_ns": eval_ns + prompt_ns + 10**6, "llm_queue_wait_ns": 0}
+
+
+def bench_result_memory(sizes: Sequence[int] = (10**4, 10**5), dict_max_rows: int = 10**5) -> pd.DataFrame:
+    """
+    Peak memory and time to collect in-memory results and build the results
+    DataFrame: a dict per trial (the previous run_ollama_trials path) against a
+    ResultTable. Results are synthetic, so no server is involved.
+
+    Returns:
+        pd.DataFrame: One row per size and path: seconds, peak MiB and bytes per trial.
+    """
+    from result_records import ResultTable
+
+    rows: List[dict] = []
+    with tempfile.TemporaryDirectory(prefix="result-memory-bench-") as tmp:
+        for size in sizes:
+            design_path = Path(tmp) / f"design-{size}.parquet"
+            input_table_gen.generate_factorial_design(design_path, pots=(10, 100), offer_fractions=(0.2, 0.5),
+                                                      models=("phi3:latest",), seeds=None,
+                                                      replicates=max(size // 6, 1))
+            trials = engine.build_prompts_df(engine.load_input_data(design_path), preview=False)
+            for path in ("dicts", "result_table"):
+                if path == "dicts" and len(trials) > dict_max_rows:
+                    continue
+                rng = np.random.default_rng(0)
+                tracemalloc.start()
+                start = time.perf_counter()
+                if path == "dicts":
+                    results: Dict[int, Dict[str, Any]] = {}
+                    for pos, row, _ in engine._iter_trials(trials):
+                        result = dict(row)
+                        result.update(_fake_result_columns(rng, pos))
+                        results[pos] = result
+                    frame = pd.DataFrame([results[pos] for pos in sorted(results)])
+                else:
+                    table = ResultTable(trials)
+                    for pos, row, _ in engine._iter_trials(trials):
+                        result = dict(row)
+                        result.update(_fake_result_columns(rng, pos))
+                        table.append(pos, result)
+                    frame = table.to_frame()
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                rows.append({"rows": len(trials), "path": path, "seconds": elapsed, "peak_mb": peak / 2**20,
+                             "bytes_per_trial": peak / len(trials), "frame_mb": frame.memory_usage(deep=True).sum() / 2**20})
+                del frame
+    return pd.DataFrame(rows)
+
+
+# --- Factorial design generation ---
+
+def bench_design(sizes: Sequence[int] = (10**5, 10**6, 10**7), suffix: str = ".parquet") -> pd.DataFrame:
+    """
+    Times generate_factorial_design for designs of roughly the given sizes
+    (replicates of a roles x models x 3 pots x 11 offers x 4 temperatures grid).
+
+    Returns:
+        pd.DataFrame: One row per size with rows written, seconds, rows/sec, file size
+                      and the process peak RSS afterwards.
+    """
+    offer_fractions = np.linspace(0.0, 1.0, 11)
+    models = input_table_gen.MODELS
+    grid_rows = len(models) * 3 * 4 * (1 + len(offer_fractions))
+    rows: List[dict] = []
+    with tempfile.TemporaryDirectory(prefix="design-bench-") as tmp:
+        for size in sizes:
+            path = Path(tmp) / f"design-{size}{suffix}"
+            start = time.perf_counter()
+            written = input_table_gen.generate_factorial_design(
+                path, pots=(10, 100, 1000), offer_fractions=offer_fractions,
+                models=models, temperatures=(0.0, 0.4, 0.8, 1.2), seeds=None,
+                replicates=max(1, size // grid_rows))
+            elapsed = time.perf_counter() - start
+            rows.append({"rows": written, "seconds": elapsed, "rows_per_sec": written / elapsed,
+                         "file_mb": path.stat().st_size / 2**20,
+                         "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024})
+            path.unlink()
+    return pd.DataFrame(rows)
+
+
+# --- Run planning ---
+
+def bench_planner(replicates: int = 4, shards: int = 4, concurrency: int = 4) -> pd.DataFrame:
+    """
+    Learns a CostModel from one run, plans a second sheet in which one model answers
+    at length (num_predict 256) and the other briefly (16), runs it, and compares the
+    plan with what happened. Also splits the sheet into shards by row count and by
+    planned cost and measures how unequal the shards' actual client time is.
+
+    Returns:
+        pd.DataFrame: The planned-vs-actual report, plus one row per sharding with the
+                      largest shard's actual time over the mean (1.0 is perfectly even).
+    """
+    import planner
+
+    def _sheet(path: Path) -> pd.DataFrame:
+        input_table_gen.generate_factorial_design(path, pots=(10, 100, 1000), offer_fractions=(0.1, 0.3, 0.5),
+                                                  models=["phi3:latest", "llama2:7b"], replicates=replicates)
+        input_df = engine.load_input_data(path)
+        input_df["num_predict"] = np.where(input_df["model"] == "llama2:7b", 256, 16)
+        return engine.build_prompts_df(input_df, preview=False)
+
+    server_args = dict(latency_s=0.002, prompt_tokens_per_s=20_000.0, eval_tokens_per_s=2_000.0, response_tokens=200)
+    with tempfile.TemporaryDirectory(prefix="planner-bench-") as tmp:
+        history_df = _sheet(Path(tmp) / "history.csv")
+        trials_df = _sheet(Path(tmp) / "sheet.csv")
+        with FakeOllamaServer(**server_args) as server:
+            history = engine.run_ollama_trials(history_df, concurrency, host=server.url)
+        cost_model = planner.CostModel(history)
+        plan = cost_model.estimate(trials_df)
+        with FakeOllamaServer(**server_args) as server:
+            start = time.perf_counter()
+            results = engine.run_ollama_trials(trials_df, concurrency, host=server.url)
+            wall_s = time.perf_counter() - start
+
+    report = planner.planned_vs_actual(trials_df[["trial-id", "model"]].join(plan), results, concurrency, wall_s)
+    actual_s = results["llm_client_wall_ns"].to_numpy() / 1e9
+    by_rows = np.arange(len(trials_df)) * shards // len(trials_df)
+    by_cost = planner.assign_shards(trials_df, plan["plan_seconds"], shards)
+    report["shard_imbalance"] = np.nan
+    for name, shard in (("shards_by_rows", by_rows), ("shards_by_cost", by_cost)):
+        per_shard = np.bincount(shard, weights=actual_s, minlength=shards)
+        report.loc[len(report)] = {"model": name, "trials": len(trials_df), "actual_s": actual_s.sum(),
+                                   "shard_imbalance": per_shard.max() / per_shard.mean()}
+    return report
+
+
+# --- Adaptive sampling ---
+
+def bench_adaptive(replicates: int = 1000, precision: float = 0.05, concurrency: int = 8) -> pd.DataFrame:
+    """
+    Runs a replicated design (2 pots x proposers and receivers at 2 offers) once in
+    full and once with adaptive stopping, and compares LLM calls, time, and each
+    condition's adaptive estimate against the estimate from every replicate.
+
+    Returns:
+        pd.DataFrame: The adaptive per-condition report with the full-run estimate
+                      and a summary printed alongside.
+    """
+    import adaptive
+
+    with tempfile.TemporaryDirectory(prefix="adaptive-bench-") as tmp:
+        path = Path(tmp) / "design.parquet"
+        input_table_gen.generate_factorial_design(path, pots=(10, 100), offer_fractions=(0.2, 0.5),
+                                                  models=("phi3:latest",), seeds=None, replicates=replicates)
+        trials = engine.build_prompts_df(pd.read_parquet(path), preview=False)
+
+    runs = {}
+    for mode in ("full", "adaptive"):
+        with FakeOllamaServer(latency_s=0.005) as server:
+            start = time.perf_counter()
+            if mode == "full":
+                results = engine.run_ollama_trials(trials, concurrency, host=server.url)
+            else:
+                results, report = adaptive.run_adaptive_trials(trials, precision=precision,
+                                                               concurrency=concurrency, host=server.url)
+            runs[mode] = {"seconds": time.perf_counter() - start, "calls": server.request_count, "results": results}
+
+    # Every replicate's estimate, per condition, from the full run
+    full = adaptive.SequentialSampler(precision)
+    for result in runs["full"]["results"].to_dict(orient="records"):
+        full.record(result)
+    report["full_estimate"] = [full.conditions[full.key(row)].mean
+                               for row in report[full.condition_columns].to_dict(orient="records")]
+    report["abs_error"] = (report["estimate"] - report["full_estimate"]).abs()
+    print(f"full: {runs['full']['calls']} calls in {runs['full']['seconds']:.2f}s; "
+          f"adaptive: {runs['adaptive']['calls']} calls in {runs['adaptive']['seconds']:.2f}s, "
+          f"{int(report['trials_skipped'].sum())} trials skipped "
+          f"({runs['full']['calls'] / max(runs['adaptive']['calls'], 1):.1f}x fewer calls)")
+    return report[["role", "pot", "offer", "trials_run", "trials_skipped", "estimate", "ci_half_width",
+                   "full_estimate", "abs_error", "converged"]]
+
+
+# --- End-to-end pipeline ---
+
+# Fake server profile for the pipeline benchmark: a lognormal base latency plus
+# token-rate costs, roughly a small model on a fast GPU scaled down 20x.
+PIPELINE_SERVER = {
+    "latency_s": 0.004,
+    "latency_distribution": "lognormal",
+    "latency_spread": 0.5,
+    "prompt_tokens_per_s": 40_000.0,
+    "eval_tokens_per_s": 4_000.0,
+    "response_tokens": 24,
+    "error_rate": 0.01,
+    "load_delay_s": 0.1,
+}
+
+
+def _rss_mb() -> float:
+    """Current resident set size in MB (Linux; NaN elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        return math.nan
+
+
+def _time_stage(stage: str, rows: int, func: Callable[[], Any], trace_memory: bool) -> Dict[str, Any]:
+    """Runs one stage, returning its timing/memory record and the stage's return value."""
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    value = func()
+    elapsed = time.perf_counter() - start
+    record = {"stage": stage, "rows": rows, "seconds": elapsed, "rows_per_sec": rows / elapsed if elapsed else math.nan,
+              "rss_mb": _rss_mb(), "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+              "peak_alloc_mb": math.nan}
+    if trace_memory:
+        record["peak_alloc_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return {"record": record, "value": value}
+
+
+def bench_pipeline(sizes: Sequence[int] = (100, 1_000, 10_000),
+                   concurrency: int = 16,
+                   server_options: Optional[Dict[str, Any]] = None,
+                   trace_memory: bool = False) -> pd.DataFrame:
+    """
+    Times each stage of main.run_pipeline at several trial counts against a fake
+    server: generating the input (a factorial design of about `size` trials, since
+    generate_sample_input_file always writes 10 rows), load_input_data,
+    build_prompts_df, run_ollama_trials and save_results (CSV and Parquet).
+
+    Args:
+        sizes (Sequence[int]): Approximate trial counts.
+        concurrency (int): Requests in flight during run_ollama_trials.
+        server_options (Dict[str, Any], optional): FakeOllamaServer arguments;
+                                                   defaults to PIPELINE_SERVER.
+        trace_memory (bool): Also record each stage's peak Python allocation with
+                             tracemalloc (slower; changes the timings).
+
+    Returns:
+        pd.DataFrame: One row per (size, stage) with seconds, rows/sec and memory,
+                      plus latency percentiles and error counts for the run stage.
+    """
+    server_options = dict(PIPELINE_SERVER if server_options is None else server_options)
+    offer_fractions = np.linspace(0.0, 1.0, 11)
+    models = input_table_gen.MODELS
+    grid_rows = len(models) * 3 * 4 * (1 + len(offer_fractions))
+    rows: List[Dict[str, Any]] = []
+    with tempfile.TemporaryDirectory(prefix="pipeline-bench-") as tmp:
+        for size in sizes:
+            input_path = Path(tmp) / f"in-{size}.csv"
+            stages: List[Dict[str, Any]] = []
+
+            def _stage(stage: str, n: int, func: Callable[[], Any]) -> Any:
+                timed = _time_stage(stage, n, func, trace_memory)
+                stages.append(timed["record"])
+                return timed["value"]
+
+            written = _stage("generate_input", size, lambda: input_table_gen.generate_factorial_design(
+                input_path, pots=(10, 100, 1000), offer_fractions=offer_fractions, models=models,
+                temperatures=(0.0, 0.4, 0.8, 1.2), seeds=None, replicates=max(1, math.ceil(size / grid_rows)),
+                fraction=min(1.0, size / grid_rows)))
+            stages[-1]["rows"] = written
+            input_df = _stage("load_input_data", written, lambda: engine.load_input_data(input_path))
+            trials_df = _stage("build_prompts_df", written, lambda: engine.build_prompts_df(input_df, preview=False))
+
+            metrics = TrialMetrics()
+            with FakeOllamaServer(**server_options) as server:
+                results = _stage("run_ollama_trials", written, lambda: engine.run_ollama_trials(
+                    trials_df, concurrency, host=server.url, metrics=metrics))
+            snap = metrics.snapshot()
+            stages[-1].update({
+                "errors": int((results["llm_status"] != "ok").sum()),
+                "client_wall_p50_s": float(snap["client_wall_p50_s"].mean()),
+                "client_wall_p95_s": float(snap["client_wall_p95_s"].mean()),
+                "client_wall_p99_s": float(snap["client_wall_p99_s"].mean()),
+                "overhead_p50_s": float(snap["overhead_p50_s"].mean()),
+            })
+
+            _stage("save_results_csv", written, lambda: engine.save_results(results, Path(tmp) / f"out-{size}.csv"))
+            _stage("save_results_parquet", written,
+                   lambda: engine.save_results(results, Path(tmp) / f"out-{size}.parquet"))
+            for record in stages:
+                record["size"] = size
+            rows.extend(stages)
+            del input_df, trials_df, results
+
+    columns = ["size", "stage", "rows", "seconds", "rows_per_sec", "rss_mb", "peak_rss_mb", "peak_alloc_mb",
+               "errors", "client_wall_p50_s", "client_wall_p95_s", "client_wall_p99_s", "overhead_p50_s"]
+    return pd.DataFrame(rows).reindex(columns=columns)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_benchmark_results(results: pd.DataFrame, output_path: Path, config: Dict[str, Any]) -> Path:
+    """
+    Writes benchmark results as JSON: {"meta": {...}, "results": [one object per row]}.
+    `meta` records the time, git commit, Python/pandas/numpy versions and the config.
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    document = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "config": config,
+        },
+        "results": json.loads(results.to_json(orient="records")),
+    }
+    output_path.write_text(json.dumps(document, indent=2), encoding="utf-8")
+    return output_path
+
+
+def compare_benchmark_results(current: pd.DataFrame, baseline_path: Path, tolerance: float = 0.2) -> pd.DataFrame:
+    """
+    Compares stage results with an earlier results file, matching on (size, stage).
+    A stage regresses if its rows/sec dropped, or its memory grew, by more than
+    `tolerance` (a fraction). Memory is the peak Python allocation where both runs
+    traced it (--trace-memory), and the process's peak RSS otherwise.
+
+    Returns:
+        pd.DataFrame: Per (size, stage): throughput and memory ratios vs. the baseline,
+                      which memory column was compared, and a `regressed` flag.
+    """
+    baseline = pd.DataFrame(json.loads(Path(baseline_path).read_text(encoding="utf-8"))["results"])
+    merged = current.merge(baseline, on=["size", "stage"], suffixes=("", "_baseline"))
+    merged["throughput_ratio"] = merged["rows_per_sec"] / merged["rows_per_sec_baseline"]
+    alloc_ratio = merged["peak_alloc_mb"] / merged["peak_alloc_mb_baseline"]
+    rss_ratio = merged["peak_rss_mb"] / merged["peak_rss_mb_baseline"]
+    traced = alloc_ratio.notna()
+    merged["memory_basis"] = np.where(traced, "peak_alloc_mb", "peak_rss_mb")
+    merged["memory_ratio"] = alloc_ratio.where(traced, rss_ratio)
+    merged["regressed"] = (merged["throughput_ratio"] < 1 - tolerance) | (merged["memory_ratio"] > 1 + tolerance)
+    return merged[["size", "stage", "rows_per_sec", "rows_per_sec_baseline", "throughput_ratio",
+                   "peak_alloc_mb", "peak_alloc_mb_baseline", "peak_rss_mb", "peak_rss_mb_baseline",
+                   "memory_basis", "memory_ratio", "regressed"]]
+
+
+def run_pipeline_benchmark(args: argparse.Namespace) -> pd.DataFrame:
+    """CLI entry for `pipeline`: runs bench_pipeline, saves the JSON and compares with a baseline."""
+    results = bench_pipeline(args.sizes, args.concurrency, trace_memory=args.trace_memory)
+    output = args.output or BENCHMARK_DIR / f"pipeline-{datetime.now():%Y%m%d-%H%M%S}.json"
+    config = {"sizes": list(args.sizes), "concurrency": args.concurrency, "trace_memory": args.trace_memory,
+              "server": PIPELINE_SERVER}
+    print(f"Results written to {write_benchmark_results(results, output, config)}")
+    if args.baseline:
+        comparison = compare_benchmark_results(results, args.baseline, args.tolerance)
+        print(comparison)
+        if comparison["regressed"].any():
+            print(f"REGRESSION in: {', '.join(comparison.loc[comparison['regressed'], 'stage'].unique())}")
+    return results
+
+
+BENCHMARKS = {
+    "concurrency": lambda args: bench_concurrency(args.trials, latency_s=args.latency),
+    "scheduler": lambda args: bench_scheduler(args.trials, latency_s=args.latency),
+    "prefix_cache": lambda args: bench_prefix_cache(concurrency=args.concurrency),
+    "adaptive": lambda args: bench_adaptive(concurrency=args.concurrency),
+    "adaptive_concurrency": lambda args: bench_adaptive_concurrency(args.trials * 4, latency_s=args.latency),
+    "decisions": lambda args: bench_decisions(),
+    "early_stop": lambda args: bench_early_stop(args.trials),
+    "games": lambda args: bench_games(args.trials // 2, latency_s=args.latency, concurrency=args.concurrency),
+    "endpoints": lambda args: bench_endpoints(args.trials, latency_s=args.latency),
+    "prompts": lambda args: bench_prompts(),
+    "queue": lambda args: bench_queue(),
+    "retries": lambda args: bench_retries(args.trials * 2),
+    "options": lambda args: bench_options(),
+    "result_memory": lambda args: bench_result_memory(),
+    "planner": lambda args: bench_planner(),
+    "pipeline": run_pipeline_benchmark,
+    "design": lambda args: bench_design(),
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run pipeline benchmarks against a fake Ollama server.")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--trials", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02, help="Fake server latency per request (s).")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 10_000],
+                        help="Trial counts for the pipeline benchmark.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight for the pipeline and adaptive benchmarks.")
+    parser.add_argument("--trace-memory", action="store_true", help="Record peak allocations per stage.")
+    parser.add_argument("--output", type=Path, help="Pipeline results JSON (default: data/benchmarks/).")
+    parser.add_argument("--baseline", type=Path, help="Earlier pipeline results JSON to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed fractional regression.")
+    args = parser.parse_args()
+
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(BENCHMARKS[args.benchmark](args))
@@ -1,6 +1,27 @@
 import streamlit as st
 from datetime import datetime
-from main import run_pipeline
+from pathlib import Path
+import analysis
+import jobs
+import metrics
+from main import METRICS_FILE_PATH
+
+# Experiments run at the same time; the rest wait in the queue. Each one already
+# keeps OLLAMA_CONCURRENCY requests in flight, so 1 suits a single Ollama server.
+JOB_WORKERS = 1
+# Journal rows per cached read when following a job's partial results.
+PARTIAL_RESULTS_CHUNK_ROWS = 1_000
+
+
+@st.cache_resource
+def job_manager() -> jobs.JobManager:
+    """One job table and worker pool for the whole server, shared by every session."""
+    return jobs.JobManager(workers=JOB_WORKERS)
+
+
+# Full journal chunks never change, so each is read once; the growing tail
+# raises IncompleteChunk, which st.cache_data does not keep.
+cached_journal_chunk = st.cache_data(max_entries=10_000, show_spinner=False)(jobs.read_journal_chunk)
 
 
 # --- Page Configuration ---
@@ -18,21 +39,109 @@ st.write(f"Dashboard launched on: {formatted_time}")
 
 st.divider()
 
-# Add a form for experiment parameters
-with st.form("experiment_params"):
-    input_file = st.file_uploader("Input File")
+# --- Submit an Experiment ---
+# The run happens on a background worker, so the page stays responsive and other
+# users can queue their own experiments meanwhile.
+with st.form("experiment_params", clear_on_submit=True):
+    input_file = st.file_uploader("Input File", type=["csv", "parquet", "xlsx"])
     output_name = st.text_input("Output File Name")
 
     if st.form_submit_button("Run Pipeline"):
-        with st.spinner("Running experiment pipeline..."):
-            run_pipeline()  # Later modify to accept parameters
-
-# --- Placeholder Message ---
-st.header("🚧 Core Application - Under Development 🚧")
-st.info(
-    "The core experimental logic is currently being developed and tested. "
-    "This user interface will be connected once the backend is complete."
-)
-st.warning(
-    "To run an experiment, please use the command line entry point for now."
-)
+        if input_file is None:
+            st.error("Choose an input file first.")
+        else:
+            job_id = job_manager().submit(input_file.name, input_file.getvalue(), output_name)
+            st.session_state["selected_job"] = job_id
+            st.success(f"Queued job {job_id}.")
+
+
+# --- Jobs ---
+@st.fragment(run_every="2s")
+def jobs_panel():
+    st.header("🧪 Experiment Jobs")
+    manager = job_manager()
+    table = manager.list_jobs()
+    if table.empty:
+        st.caption("No jobs yet; submit an experiment above.")
+        return
+
+    st.dataframe(
+        table[["job_id", "name", "status", "progress", "done_trials", "total_trials",
+               "submitted_at", "started_at", "finished_at", "error"]],
+        hide_index=True, use_container_width=True,
+        column_config={"progress": st.column_config.ProgressColumn("progress", min_value=0.0, max_value=1.0)},
+    )
+
+    job_ids = table["job_id"].tolist()
+    selected = st.session_state.get("selected_job")
+    job_id = st.selectbox("Job", job_ids, index=job_ids.index(selected) if selected in job_ids else 0)
+    st.session_state["selected_job"] = job_id
+    job = manager.get(job_id)
+    paths = jobs.job_paths(Path(job["output_path"]))
+
+    if job["status"] == "queued" and st.button("Cancel job"):
+        manager.cancel(job_id)
+    if job["total_trials"]:
+        st.progress(min(job["done_trials"] / job["total_trials"], 1.0),
+                    text=f"{job['done_trials']} / {job['total_trials']} trials ({job['status']})")
+    if job["error"]:
+        st.error(job["error"])
+
+    # Partial results as they stream into the job's journal
+    partial = jobs.read_partial_results(paths["journal"], PARTIAL_RESULTS_CHUNK_ROWS, cached_journal_chunk)
+    if not partial.empty:
+        decided = analysis.extract_decisions(partial.reindex(columns=analysis.ANALYSIS_INPUT_COLUMNS))
+        counts = decided["decision"].value_counts()
+        cols = st.columns(4)
+        cols[0].metric("Results so far", len(decided))
+        for col, decision in zip(cols[1:], ("accept", "reject", "offer")):
+            col.metric(decision.capitalize(), int(counts.get(decision, 0)))
+        shown = [c for c in analysis.ANALYSIS_INPUT_COLUMNS + analysis.DECISION_COLUMNS if c in decided.columns]
+        st.dataframe(decided[shown].tail(200), hide_index=True, use_container_width=True)
+
+    output_path = Path(job["output_path"])
+    if job["status"] == "succeeded" and output_path.exists():
+        st.download_button("Download results", output_path.read_bytes(), file_name=output_path.name,
+                           mime="text/csv")
+    st.session_state["metrics_path"] = str(paths["metrics"])
+
+
+jobs_panel()
+
+# --- Live Metrics ---
+# Reads the metrics file the pipeline rewrites during a run: the selected job's,
+# or the command-line run's.
+@st.fragment(run_every="5s")
+def live_metrics_panel():
+    st.header("📈 Live Run Metrics")
+    metrics_path = Path(st.session_state.get("metrics_path", METRICS_FILE_PATH))
+    df = metrics.read_metrics_file(metrics_path)
+    if df.empty:
+        st.caption(f"No metrics yet; they appear in {metrics_path} once a run starts.")
+        return
+
+    totals = st.columns(4)
+    totals[0].metric("Trials", int(df["trials_total"].sum()))
+    totals[1].metric("Errors", int(df["trial_errors_total"].sum()))
+    totals[2].metric("Cache hits", int(df["cache_hits_total"].sum()))
+    totals[3].metric("Generated tokens", int(df["eval_tokens_total"].sum()))
+
+    # Where the time goes, per model and endpoint (seconds)
+    latency_cols = {
+        "client_wall_seconds_p0.5": "client p50",
+        "client_wall_seconds_p0.95": "client p95",
+        "client_wall_seconds_p0.99": "client p99",
+        "server_total_seconds_p0.5": "server p50",
+        "server_total_seconds_p0.95": "server p95",
+        "overhead_seconds_p0.5": "overhead p50",
+        "queue_wait_seconds_p0.5": "queue wait p50",
+        "load_seconds_p0.95": "load p95",
+        "eval_tokens_per_second": "tokens/s",
+    }
+    shown = df[["model", "endpoint"] + [c for c in latency_cols if c in df.columns]]
+    st.dataframe(shown.rename(columns=latency_cols), hide_index=True, use_container_width=True)
+    st.caption(f"Updated every 5 s from {metrics_path}. Overhead = client wall time minus "
+               f"Ollama's total_duration (network, server-side queueing, client code).")
+
+
+live_metrics_panel()
@@ -0,0 +1,90 @@
+"""
+Dead-letter file for trials that could not be completed.
+
+When a trial fails with a retryable error (connection, 5xx, timeout) after its
+last attempt, or once the run's retry budget is spent, its input row is appended
+here as well as being saved with llm_status="error". The file is an ordinary
+input CSV: the trial's input columns, its trial-id, and why it failed
+(`dead_letter_error`, `dead_letter_kind`, `dead_letter_attempts`,
+`dead_letter_at`). Once the server is healthy again, run it through the pipeline
+on its own to fill the gaps:
+
+    run_pipeline(input_path=DATA_DIR / "X-OUT.dead-letter.csv", output_path=DATA_DIR / "X-RETRY.csv")
+
+Rows are flushed as they are written, so the file is complete even if the run
+is interrupted.
+"""
+
+import csv
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Columns of a result that are not part of the trial's input.
+_DERIVED_COLUMNS = {"final-prompt"}
+DEAD_LETTER_COLUMNS = ["dead_letter_error", "dead_letter_kind", "dead_letter_attempts", "dead_letter_at"]
+
+
+def input_columns(result: Dict[str, Any]) -> Dict[str, Any]:
+    """The input row of a trial's result: everything but the llm_*, sched_*, dead_letter_* and prompt columns."""
+    return {k: v for k, v in result.items()
+            if not k.startswith(("llm_", "sched_", "dead_letter_")) and k not in _DERIVED_COLUMNS}
+
+
+class DeadLetterFile:
+    """
+    Thread-safe CSV of failed trials, appended to across runs.
+
+    Args:
+        path (Path): CSV file; created with a header on the first failure.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._file = None
+        self._writer: Optional[csv.DictWriter] = None
+        self.count = 0
+
+    def _open(self, columns: List[str]) -> csv.DictWriter:
+        if self._writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            header = None
+            if self.path.exists() and self.path.stat().st_size > 0:
+                with open(self.path, newline="", encoding="utf-8") as f:
+                    header = next(csv.reader(f), None)
+            self._file = open(self.path, "a", newline="", encoding="utf-8")
+            # Columns a later run adds are dropped rather than breaking the existing header
+            self._writer = csv.DictWriter(self._file, fieldnames=header or columns, extrasaction="ignore")
+            if header is None:
+                self._writer.writeheader()
+        return self._writer
+
+    def append(self, result: Dict[str, Any]) -> None:
+        """Records a failed trial's input row and failure."""
+        row = input_columns(result)
+        row.update({
+            "dead_letter_error": result.get("llm_error"),
+            "dead_letter_kind": result.get("llm_error_kind"),
+            "dead_letter_attempts": result.get("llm_attempts"),
+            "dead_letter_at": datetime.now(timezone.utc).isoformat(),
+        })
+        with self._lock:
+            writer = self._open(list(row))
+            writer.writerow(row)
+            self._file.flush()
+            self.count += 1
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._writer = None
+
+    def __enter__(self) -> "DeadLetterFile":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
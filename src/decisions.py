@@ -0,0 +1,106 @@
+"""
+Decision detection in model responses.
+
+A receiver's decision is accept/reject; a proposer's is the dollar amount
+offered. The patterns are compiled once at import and shared by the streaming
+early-stop in engine.py (which runs them on the partial response as tokens
+arrive) and by anything that parses finished responses.
+
+An explicit marker ("Decision: Reject", "Offer: $40") wins wherever it appears.
+Without one, a finished response is read by its last loose match, since models
+tend to weigh the options before settling ("If I accept, ... I reject the
+offer."). A streaming response is only cut on a marker: a loose match in the
+middle of the reasoning may not be the final word.
+"""
+
+import re
+from typing import NamedTuple, Optional
+
+# "Decision: Accept", "**Decision:** REJECT".
+RECEIVER_MARKER_RE = re.compile(
+    r"\bdecision\W{0,6}(?P<decision>accept|reject)(?:s|ed)?\b",
+    re.IGNORECASE,
+)
+
+# Also "I accept", "I will reject", "I choose to accept", or a response that opens
+# with the word itself.
+RECEIVER_DECISION_RE = re.compile(
+    r"(?:\bdecision\W{0,6}"
+    r"|\bI\s+(?:will\s+|would\s+|shall\s+|choose\s+to\s+|decide\s+to\s+|have\s+decided\s+to\s+)?"
+    r"|^\W*)"
+    r"(?P<decision>accept|reject)(?:s|ed)?\b",
+    re.IGNORECASE,
+)
+
+# "Offer: $40", "**My offer:** 40 dollars", "Decision: offer $40".
+PROPOSER_MARKER_RE = re.compile(
+    r"\b(?:decision|offer)\W{0,3}:\W{0,3}(?:(?:I\s+)?offer\w*\s+)?"
+    r"(?:\$\s*(?P<dollars>\d+(?:\.\d+)?)|(?P<amount>\d+(?:\.\d+)?)\s*dollars?\b)",
+    re.IGNORECASE,
+)
+
+# Also "I offer $40", "My offer is $40.50", "I propose to give you $40",
+# "I will give the receiver 40 dollars".
+PROPOSER_OFFER_RE = re.compile(
+    r"\b(?:offer|propos\w*|give)\b[^$\d\n]{0,40}?"
+    r"(?:\$\s*(?P<dollars>\d+(?:\.\d+)?)|(?P<amount>\d+(?:\.\d+)?)\s*dollars?\b)",
+    re.IGNORECASE,
+)
+
+
+def last_match(pattern: "re.Pattern") -> "re.Pattern":
+    """The pattern behind a greedy `.*`, so its first match is the text's last one (works in RE2 too)."""
+    return re.compile(r"(?s:.*)" + pattern.pattern, pattern.flags)
+
+
+RECEIVER_LAST_RE = last_match(RECEIVER_DECISION_RE)
+PROPOSER_LAST_RE = last_match(PROPOSER_OFFER_RE)
+
+
+class Decision(NamedTuple):
+    """A detected decision and the character offset in the text where it ends."""
+    value: str
+    end: int
+
+
+def _receiver_value(match: "re.Match") -> str:
+    return match.group("decision").lower()
+
+
+def _proposer_value(match: "re.Match") -> str:
+    return match.group("dollars") or match.group("amount")
+
+
+# role -> (marker pattern, last-loose-match pattern, value of a match)
+DECISION_PATTERNS = {
+    "receiver": (RECEIVER_MARKER_RE, RECEIVER_LAST_RE, _receiver_value),
+    "proposer": (PROPOSER_MARKER_RE, PROPOSER_LAST_RE, _proposer_value),
+}
+
+
+def detect_decision(role: Optional[str], text: str, final: bool = True) -> Optional[Decision]:
+    """
+    Finds the decision for `role` in (possibly partial) response text.
+
+    Args:
+        role (str): "proposer" or "receiver"; other roles never match.
+        text (str): The response so far.
+        final (bool): False while the text is still streaming. Only an explicit
+                      marker counts then, and not one that runs to the end of the
+                      partial text, since the word or number may still be growing
+                      ("$4" before "0", "accept" before "able").
+
+    Returns:
+        Decision: The decision ("accept"/"reject", or the offered amount as a
+                  string) and where it ends in `text`, or None if not found yet.
+    """
+    patterns = DECISION_PATTERNS.get(str(role).strip().lower() if role else "")
+    if patterns is None:
+        return None
+    marker, loose, value = patterns
+    match = marker.search(text)
+    if match is None and final:
+        match = loose.match(text)
+    if match is None or (not final and match.end() >= len(text)):
+        return None
+    return Decision(value(match), match.end())
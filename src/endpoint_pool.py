@@ -0,0 +1,304 @@
+"""
+Load balancing across several Ollama servers.
+
+`EndpointPool` holds one persistent `ollama.Client` (and so one pooled, keep-alive
+HTTP connection pool) per configured endpoint and exposes the same `generate`
+call as a single client, so it can be passed to `run_ollama_trials` or
+`run_scheduled_trials` in place of a host.
+
+Each request goes to the healthy endpoint with the lowest routing cost: the
+number of requests it already has in flight, plus `load_penalty` if it does not
+have the model loaded, minus the endpoint's concurrency limit for the model when
+an adaptive limiter sets `capacity` (so servers with more slots take more).
+Which models are loaded comes from each server's /api/ps, refreshed by a
+background health check, and from the requests the pool itself has sent. If an
+endpoint refuses the connection, drops it, or returns a 5xx, the request is
+retried on another endpoint; after `failure_threshold` such failures in a row the
+endpoint is marked unhealthy, and the health check brings it back once it answers
+again. Timeouts don't fail over: a slow server is not a dead one, so they are
+raised and left to the caller's retry policy.
+
+The returned responses (or stream chunks) carry an `endpoint` key, recorded as
+`llm_endpoint`.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set, Union
+
+import httpx
+import ollama
+
+
+class Endpoint:
+    """State of one Ollama server in the pool."""
+
+    def __init__(self, url: str, client: ollama.Client):
+        self.url = url
+        self.client = client
+        self.healthy = True
+        self.outstanding = 0
+        self.served = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        # Models believed resident, least recently used first. The server evicts
+        # beyond its own limit, which we learn from the most models /api/ps listed.
+        self.loaded_models: "OrderedDict[str, None]" = OrderedDict()
+        self.model_capacity = 1
+        self.in_flight: Dict[str, int] = {}
+
+    def touch_model(self, model: str) -> None:
+        """Records that `model` was just used here, forgetting the least recent beyond capacity."""
+        self.loaded_models[model] = None
+        self.loaded_models.move_to_end(model)
+        while len(self.loaded_models) > self.model_capacity:
+            self.loaded_models.popitem(last=False)
+
+
+class NoHealthyEndpointError(ConnectionError):
+    """Raised when every endpoint in the pool is down (or already failed this request)."""
+
+
+def _is_endpoint_failure(error: Exception) -> bool:
+    """
+    True for errors that say the server is unreachable or broken, not that the request
+    is bad. Timeouts are not: the request may just be slow, and the retry policy owns them.
+    """
+    if isinstance(error, (httpx.TimeoutException, TimeoutError)):
+        return False
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code >= 500
+    return isinstance(error, (ConnectionError, httpx.TransportError))
+
+
+class EndpointPool:
+    """
+    Routes generate calls across several Ollama servers.
+
+    Args:
+        hosts (Sequence[str]): Endpoint URLs, e.g. ["http://gpu-1:11434", "http://gpu-2:11434"].
+        max_connections (int): Connections kept per endpoint; set it at least to the
+                               number of requests you run in flight.
+        load_penalty (float): Extra routing cost of an endpoint that does not have the
+                              model loaded, in outstanding requests. Higher values keep
+                              a model on the endpoints that already serve it.
+        health_interval_s (float): Seconds between background health checks. 0 disables them.
+        timeout (float, optional): HTTP timeout per request in seconds.
+        failure_threshold (int): Failures in a row (connection errors or 5xx) after which
+                                 an endpoint is marked unhealthy until the health check
+                                 sees it answer again.
+    """
+
+    def __init__(self, hosts: Sequence[str],
+                 max_connections: int = 16,
+                 load_penalty: float = 4.0,
+                 health_interval_s: float = 10.0,
+                 timeout: Optional[float] = None,
+                 failure_threshold: int = 3):
+        if not hosts:
+            raise ValueError("EndpointPool needs at least one host")
+        if failure_threshold < 1:
+            raise ValueError(f"failure_threshold must be >= 1, got {failure_threshold}")
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.endpoints: List[Endpoint] = [
+            Endpoint(url, ollama.Client(host=url, timeout=timeout, limits=limits)) for url in hosts
+        ]
+        self.load_penalty = load_penalty
+        self.health_interval_s = health_interval_s
+        self.failure_threshold = failure_threshold
+        # (url, model) -> requests the endpoint can take for the model; set by run_ollama_trials
+        self.capacity: Optional[Callable[[str, Optional[str]], float]] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+
+        self.check_health()
+        if health_interval_s > 0:
+            self._monitor = threading.Thread(target=self._monitor_loop, name="ollama-health", daemon=True)
+            self._monitor.start()
+
+    # --- Health ---
+
+    def _check_endpoint(self, endpoint: Endpoint) -> None:
+        try:
+            running = endpoint.client.ps()
+            models = [m.get("model") or m.get("name") for m in running.get("models") or []]
+        except Exception as e:
+            with self._lock:
+                endpoint.healthy = False
+                endpoint.last_error = str(e)
+            return
+        with self._lock:
+            endpoint.healthy = True
+            endpoint.consecutive_failures = 0
+            endpoint.model_capacity = max(endpoint.model_capacity, len(models))
+            endpoint.loaded_models = OrderedDict((m, None) for m in models if m)
+
+    def check_health(self) -> None:
+        """Probes every endpoint's /api/ps, updating its health and loaded models."""
+        for endpoint in self.endpoints:
+            self._check_endpoint(endpoint)
+
+    def _monitor_loop(self) -> None:
+        while not self._stop.wait(self.health_interval_s):
+            self.check_health()
+
+    def _mark_failed(self, endpoint: Endpoint, error: Exception) -> None:
+        with self._lock:
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            endpoint.last_error = str(error)
+            if endpoint.consecutive_failures >= self.failure_threshold:
+                endpoint.healthy = False
+                endpoint.loaded_models.clear()
+
+    def _mark_served(self, endpoint: Endpoint) -> None:
+        with self._lock:
+            endpoint.served += 1
+            endpoint.consecutive_failures = 0
+
+    # --- Routing ---
+
+    def _cost(self, endpoint: Endpoint, model: Optional[str]) -> float:
+        """
+        Routing cost: requests in flight less the endpoint's capacity (if known, plus
+        load_penalty when the model is at capacity there), plus load_penalty if the
+        model must be loaded, plus load_penalty again if loading it would evict a model
+        that is still busy (that model's next requests would need a reload, and the
+        swap cascades).
+        """
+        cost = float(endpoint.outstanding)
+        if self.capacity is not None:
+            capacity = self.capacity(endpoint.url, model)
+            cost -= capacity
+            if endpoint.in_flight.get(model, 0) >= capacity:
+                # Past its limit requests only queue there, which is as bad as a load elsewhere
+                cost += self.load_penalty
+        if model in endpoint.loaded_models:
+            return cost
+        cost += self.load_penalty
+        if len(endpoint.loaded_models) >= endpoint.model_capacity:
+            evicted = next(iter(endpoint.loaded_models))
+            if endpoint.in_flight.get(evicted):
+                cost += self.load_penalty
+        return cost
+
+    def _acquire(self, model: Optional[str], exclude: Set[str]) -> Optional[Endpoint]:
+        """Picks the cheapest healthy endpoint not in `exclude` and counts the request against it."""
+        with self._lock:
+            candidates = [e for e in self.endpoints if e.healthy and e.url not in exclude]
+            if not candidates:
+                return None
+            best = min(candidates, key=lambda e: (self._cost(e, model), e.served))
+            best.outstanding += 1
+            best.in_flight[model] = best.in_flight.get(model, 0) + 1
+            if model:
+                # The server loads it on receipt, so later requests can follow it here
+                best.touch_model(model)
+            return best
+
+    def _release(self, endpoint: Endpoint, model: Optional[str]) -> None:
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.in_flight[model] -= 1
+
+    def _next_endpoint(self, model: str, tried: Set[str], last_error: Optional[Exception]) -> Endpoint:
+        endpoint = self._acquire(model, tried)
+        if endpoint is None and not tried:
+            # Everything looked down; the background check may be stale
+            self.check_health()
+            endpoint = self._acquire(model, tried)
+        if endpoint is None:
+            raise NoHealthyEndpointError(
+                f"No healthy Ollama endpoint left (tried {sorted(tried) or 'none'}): {last_error}")
+        tried.add(endpoint.url)
+        return endpoint
+
+    @staticmethod
+    def _tag(response: Any, endpoint: Endpoint) -> Dict[str, Any]:
+        out = response.model_dump() if hasattr(response, "model_dump") else dict(response)
+        out["endpoint"] = endpoint.url
+        return out
+
+    def generate(self, model: str = "", **kwargs: Any) -> Union[Dict[str, Any], Iterator[Dict[str, Any]]]:
+        """
+        Same arguments as `ollama.Client.generate`. Returns the response as a dict
+        with an extra `endpoint` key naming the server used; with stream=True, an
+        iterator of such chunks. A stream fails over only before its first chunk.
+
+        Raises:
+            NoHealthyEndpointError: No endpoint is left to try.
+            ollama.ResponseError: The server rejected the request itself (4xx).
+            httpx.TimeoutException: The chosen endpoint did not answer in time.
+        """
+        if kwargs.get("stream"):
+            return self._stream(model, kwargs)
+
+        tried: Set[str] = set()
+        last_error: Optional[Exception] = None
+        while True:
+            endpoint = self._next_endpoint(model, tried, last_error)
+            try:
+                response = endpoint.client.generate(model=model, **kwargs)
+            except Exception as e:
+                if not _is_endpoint_failure(e):
+                    raise
+                self._mark_failed(endpoint, e)
+                last_error = e
+                continue
+            finally:
+                self._release(endpoint, model)
+
+            self._mark_served(endpoint)
+            return self._tag(response, endpoint)
+
+    def _stream(self, model: str, kwargs: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Streaming generate; the endpoint counts as busy until the stream ends or is closed."""
+        tried: Set[str] = set()
+        last_error: Optional[Exception] = None
+        while True:
+            endpoint = self._next_endpoint(model, tried, last_error)
+            started = False
+            chunks = None
+            try:
+                chunks = endpoint.client.generate(model=model, **kwargs)
+                for chunk in chunks:
+                    started = True
+                    yield self._tag(chunk, endpoint)
+            except Exception as e:
+                if started or not _is_endpoint_failure(e):
+                    raise
+                self._mark_failed(endpoint, e)
+                last_error = e
+                continue
+            finally:
+                if chunks is not None:
+                    # Closes the HTTP response now if our caller stopped reading early
+                    chunks.close()
+                self._release(endpoint, model)
+                if started:
+                    self._mark_served(endpoint)
+            return
+
+    # --- Reporting / lifecycle ---
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """One dict per endpoint: url, healthy, outstanding, served, failures, loaded models, last error."""
+        with self._lock:
+            return [{"url": e.url, "healthy": e.healthy, "outstanding": e.outstanding, "served": e.served,
+                     "failures": e.failures, "loaded_models": list(e.loaded_models),
+                     "last_error": e.last_error} for e in self.endpoints]
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._monitor is not None:
+            self._monitor.join()
+        for endpoint in self.endpoints:
+            endpoint.client._client.close()
+
+    def __enter__(self) -> "EndpointPool":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
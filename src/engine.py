@@ -9,75 +9,772 @@ and saving the results.
 import pandas as pd
 from pathlib import Path
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Iterator, Iterable, Tuple, Callable, Union, Mapping
+from types import MappingProxyType
+from concurrent.futures import Future, ThreadPoolExecutor
+import shutil
+import string
+import threading
+import time
 import ollama
 import warnings
 
+from adaptive_concurrency import AdaptiveConcurrency
+from dead_letter import DeadLetterFile
+from journal import TrialJournal
+from metrics import TrialMetrics
+from decisions import detect_decision
+from endpoint_pool import EndpointPool
+from response_cache import ResponseCache
+from result_records import ResultTable, widen_float32
+from result_store import ParquetResultStore
+from retries import RETRYABLE_KINDS, RetryPolicy, TrialFailed, classify_error
+
 
 # --- 1. Data Generation ---> moved to input_table_gen.py ---
 
 # --- 2. Data Loading ---
 
-def load_input_data(input_path: Path) -> pd.DataFrame:
+REQUIRED_INPUT_COLUMNS = ['role', 'pot', 'offer', 'base-prompt']
+
+# Compact dtypes applied to input columns when present. Low-cardinality labels
+# become categoricals; sampling parameters only need float32 precision.
+INPUT_DTYPES = {
+    "experiment-id": "category",
+    "game": "category",
+    "role": "category",
+    "model": "category",
+    "temperature": "float32",
+    "top_p": "float32",
+    "min_p": "float32",
+    "repeat_penalty": "float32",
+    "frequency_penalty": "float32",
+    "presence_penalty": "float32",
+    "tfs_z": "float32",
+    "mirostat_eta": "float32",
+    "mirostat_tau": "float32",
+}
+
+INPUT_SUFFIXES = (".csv", ".parquet", ".xlsx")
+
+
+def _input_format(input_path: Path) -> str:
+    suffix = input_path.suffix.lower()
+    if suffix not in INPUT_SUFFIXES:
+        raise ValueError(f"Unsupported input file type '{suffix}'; expected one of {list(INPUT_SUFFIXES)}")
+    return suffix
+
+
+def read_input_columns(input_path: Path) -> List[str]:
     """
-    Loads the experimental trials from a specified CSV or Excel file.
+    Reads only the header (CSV/xlsx) or schema (Parquet) of an input file.
 
     Args:
         input_path (Path): The path to the input file.
 
     Returns:
-        pd.DataFrame: A DataFrame containing the experimental trials.
+        List[str]: The column names, in file order.
     """
     if not input_path.exists():
         raise FileNotFoundError(f"Input file not found: {input_path}")
 
-    df = pd.read_csv(input_path)
+    fmt = _input_format(input_path)
+    if fmt == ".csv":
+        return list(pd.read_csv(input_path, nrows=0).columns)
+    if fmt == ".parquet":
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(input_path).names)
+
+    import openpyxl
+    workbook = openpyxl.load_workbook(input_path, read_only=True)
+    try:
+        header = next(workbook.active.iter_rows(max_row=1, values_only=True), ())
+    finally:
+        workbook.close()
+    return [str(c) for c in header if c is not None]
+
 
-    # Validate required columns
-    required_cols = ['role', 'pot', 'offer', 'base-prompt']
-    missing_cols = [col for col in required_cols if col not in df.columns]
+def _validate_input_columns(columns: List[str]) -> None:
+    missing_cols = [col for col in REQUIRED_INPUT_COLUMNS if col not in columns]
     if missing_cols:
         raise ValueError(f"Missing required columns: {missing_cols}")
-    return df
+
+
+def _apply_input_dtypes(chunk: pd.DataFrame) -> pd.DataFrame:
+    dtypes = {col: dtype for col, dtype in INPUT_DTYPES.items() if col in chunk.columns}
+    return chunk.astype(dtypes) if dtypes else chunk
+
+
+def _iter_excel_chunks(input_path: Path, columns: List[str], chunksize: int) -> Iterator[pd.DataFrame]:
+    import openpyxl
+    workbook = openpyxl.load_workbook(input_path, read_only=True)
+    try:
+        rows = workbook.active.iter_rows(min_row=2, values_only=True)
+        batch: List[tuple] = []
+        for row in rows:
+            batch.append(row[:len(columns)])
+            if len(batch) >= chunksize:
+                yield pd.DataFrame(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def count_input_rows(input_path: Path) -> int:
+    """Number of trials in an input file, reading as little of it as the format allows."""
+    fmt = _input_format(input_path)
+    if fmt == ".parquet":
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(input_path).metadata.num_rows
+    if fmt == ".csv":
+        # Parse (not just count lines) so quoted prompts with newlines count once
+        return sum(len(chunk) for chunk in pd.read_csv(input_path, usecols=[0], chunksize=1_000_000))
+    return sum(len(chunk) for chunk in iter_input_chunks(input_path))
+
+
+def iter_input_chunks(input_path: Path, chunksize: int = 100_000) -> Iterator[pd.DataFrame]:
+    """
+    Streams the experimental trials from a CSV, Parquet or Excel (.xlsx) file.
+
+    The header/schema is validated before any rows are read, and every chunk gets
+    the compact INPUT_DTYPES. Chunk indexes continue across chunks (0..n-1 overall),
+    so positions stay unique when chunks are run one after another.
+
+    Args:
+        input_path (Path): The path to the input file.
+        chunksize (int): Maximum rows per chunk.
+
+    Returns:
+        Iterator[pd.DataFrame]: The trials, one chunk at a time.
+    """
+    columns = read_input_columns(input_path)
+    _validate_input_columns(columns)
+
+    fmt = _input_format(input_path)
+    if fmt == ".csv":
+        dtypes = {col: dtype for col, dtype in INPUT_DTYPES.items() if col in columns}
+        chunks: Iterator[pd.DataFrame] = pd.read_csv(input_path, chunksize=chunksize, dtype=dtypes)
+    elif fmt == ".parquet":
+        import pyarrow.parquet as pq
+        chunks = (batch.to_pandas() for batch in pq.ParquetFile(input_path).iter_batches(batch_size=chunksize))
+    else:
+        chunks = _iter_excel_chunks(input_path, columns, chunksize)
+
+    offset = 0
+    for chunk in chunks:
+        chunk = _apply_input_dtypes(chunk)
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+        yield chunk
+
+
+def load_input_data(input_path: Path) -> pd.DataFrame:
+    """
+    Loads the experimental trials from a specified CSV, Parquet or Excel file.
+
+    Args:
+        input_path (Path): The path to the input file.
+
+    Returns:
+        pd.DataFrame: A DataFrame containing the experimental trials.
+    """
+    chunks = list(iter_input_chunks(input_path))
+    if not chunks:
+        return _apply_input_dtypes(pd.DataFrame(columns=read_input_columns(input_path)))
+    # Chunks carry their own category sets; re-apply the dtypes after concatenating
+    return _apply_input_dtypes(pd.concat(chunks))
 
 
 # --- 3. Prompt Engineering ---
 
-def build_prompts_df(input_df: pd.DataFrame) -> pd.DataFrame:
+# Placeholders each role's base-prompt may use.
+ROLE_FIELDS = {
+    "proposer": ("pot",),
+    "receiver": ("pot", "offer", "remainder"),
+}
+
+_FORMATTER = string.Formatter()
+
+
+def _format_prompt_row(row: Dict[str, Any]) -> str:
+    """Reference per-row prompt builder; used for templates the batched path can't parse."""
+    if row['role'] == 'proposer':
+        return row['base-prompt'].format(pot=row['pot'])
+    elif row['role'] == 'receiver':
+        remainder = row['pot'] - row['offer']  # Calculate outside format()
+        return row['base-prompt'].format(
+            pot=row['pot'],
+            offer=row['offer'],
+            remainder=remainder  # Pass as a new parameter
+        )
+    else:
+        raise ValueError(f"Invalid role: {row['role']}")
+
+
+def _format_values(values: np.ndarray, conversion: Optional[str], spec: str) -> Tuple[np.ndarray, List[str]]:
+    """Formats a column the way str.format would, once per distinct value. Returns (codes, strings)."""
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    # tolist() gives native Python scalars, matching what a row-wise apply passes to format
+    return codes, [format(_FORMATTER.convert_field(u, conversion), spec) for u in uniques.tolist()]
+
+
+def _fill_template(template: str, columns: Dict[str, np.ndarray], n: int) -> Optional[np.ndarray]:
+    """
+    Fills one template for n rows from per-placeholder value arrays. Every placeholder
+    column is formatted once per distinct value, the template is rendered once per
+    distinct combination of values, and the result is scattered back to the rows.
+
+    Returns None if the template uses anything beyond plain {name}, {name!conv} or
+    {name:spec} fields. Raises KeyError for placeholders the role does not provide,
+    like str.format.
+    """
+    literals: List[str] = []
+    field_codes: List[np.ndarray] = []
+    field_strings: List[List[str]] = []
+    for literal, field, spec, conversion in _FORMATTER.parse(template):
+        literals.append(literal)
+        if field is None:
+            continue
+        if not field.isidentifier() or (spec and "{" in spec):
+            return None  # attribute/index access or nested specs
+        if field not in columns:
+            raise KeyError(field)
+        codes, strings = _format_values(columns[field], conversion, spec or "")
+        field_codes.append(codes)
+        field_strings.append(strings)
+
+    if not field_codes:
+        return np.full(n, "".join(literals), dtype=object)
+
+    row_combo, combos = _combine_codes(field_codes, [len(strings) for strings in field_strings])
+    rendered = np.empty(len(combos), dtype=object)
+    for i, combo in enumerate(combos):
+        parts = []
+        for j, literal in enumerate(literals):
+            parts.append(literal)
+            if j < len(combo):
+                parts.append(field_strings[j][combo[j]])
+        rendered[i] = "".join(parts)
+    return rendered[row_combo]
+
+
+def _invalid_role_error(df: pd.DataFrame, invalid: pd.Series) -> ValueError:
+    """Builds one error that lists every row with an unknown role."""
+    bad = df.loc[invalid]
+    labels = bad["trial-id"] if "trial-id" in bad.columns else pd.Series(bad.index, index=bad.index)
+    details = [f"row {pos} ({label}): {role!r}" for pos, label, role in
+               zip(np.flatnonzero(invalid.to_numpy()), labels, bad["role"])]
+    shown = "; ".join(details[:20]) + (f"; ... {len(details) - 20} more" if len(details) > 20 else "")
+    return ValueError(f"Invalid role in {len(details)} row(s), expected one of "
+                      f"{sorted(ROLE_FIELDS)}: {shown}")
+
+
+def format_prompts(input_df: pd.DataFrame) -> pd.Series:
+    """
+    Builds the final prompt for every trial without touching the DataFrame.
+
+    Rows are grouped by (role, base-prompt) so each template is parsed once, and the
+    placeholders are filled column-wise. The output is byte-identical to calling
+    base-prompt.format(...) row by row.
+
+    Args:
+        input_df (pd.DataFrame): Trials with 'role', 'pot', 'offer' and 'base-prompt'.
+
+    Returns:
+        pd.Series: The final prompts, aligned to input_df.index.
+
+    Raises:
+        ValueError: If any row has a role other than 'proposer' or 'receiver'.
+    """
+    n = len(input_df)
+    invalid = ~input_df["role"].isin(list(ROLE_FIELDS))
+    if invalid.any():
+        raise _invalid_role_error(input_df, invalid)
+
+    pot = input_df["pot"].to_numpy()
+    offer = input_df["offer"].to_numpy()
+    remainder = (input_df["pot"] - input_df["offer"]).to_numpy()  # one vectorized subtraction
+    values = {"pot": pot, "offer": offer, "remainder": remainder}
+
+    prompts = np.empty(n, dtype=object)
+    groups = input_df.groupby(["role", "base-prompt"], sort=False, dropna=False, observed=True).indices
+    for (role, template), positions in groups.items():
+        filled = None
+        if isinstance(template, str):
+            columns = {name: values[name][positions] for name in ROLE_FIELDS[role]}
+            filled = _fill_template(template, columns, len(positions))
+        if filled is None:
+            filled = [_format_prompt_row(input_df.iloc[p].to_dict()) for p in positions]
+        prompts[positions] = filled
+    return pd.Series(prompts, index=input_df.index, name="final-prompt", dtype=object)
+
+
+def build_prompts_df(input_df: pd.DataFrame, preview: bool = True) -> pd.DataFrame:
     """
     Takes the input DataFrame and adds a new column with the fully constructed
     prompt for each trial, based on the 'role', 'pot', and other variables.
 
     Args:
         input_df (pd.DataFrame): The DataFrame loaded from the input file.
+        preview (bool): Offer the interactive preview/save prompts. Disable for
+                        every input chunk after the first.
 
     Returns:
         pd.DataFrame: The DataFrame with an added 'final_prompt' column.
     """
-    df = input_df.copy()
-
-    def format_prompt(row):
-        if row['role'] == 'proposer':
-            return row['base-prompt'].format(pot=row['pot'])
-        elif row['role'] == 'receiver':
-            remainder = row['pot'] - row['offer']  # Calculate outside format()
-            return row['base-prompt'].format(
-                pot=row['pot'],
-                offer=row['offer'],
-                remainder=remainder  # Pass as a new parameter
-            )
-        else:
-            raise ValueError(f"Invalid role: {row['role']}")
-
-    df['final-prompt'] = df.apply(format_prompt, axis=1)  # axis 1 for row-wise operations.
+    # Shallow copy: shares the input columns instead of duplicating the frame
+    df = input_df.copy(deep=False)
+    df['final-prompt'] = format_prompts(input_df)
     # Offer to preview and/or save the intermediary DataFrame before Step 4 (Ollama trials)
-    maybe_preview_and_save_intermediate_df(df)
+    if preview:
+        maybe_preview_and_save_intermediate_df(df)
     return df
 
 
 # --- 4. Experiment Execution ---
 
-def run_ollama_trials(trials_with_prompts_df: pd.DataFrame) -> pd.DataFrame:
+# Map known input columns to Ollama option keys.
+OPTION_COLUMNS = [
+    ("seed", "seed"),
+    ("temperature", "temperature"),
+    ("top_p", "top_p"),
+    ("top_k", "top_k"),
+    ("repeat_penalty", "repeat_penalty"),
+    ("presence_penalty", "presence_penalty"),
+    ("frequency_penalty", "frequency_penalty"),
+    ("mirostat", "mirostat"),
+    ("mirostat_tau", "mirostat_tau"),
+    ("mirostat_eta", "mirostat_eta"),
+    ("num_ctx", "num_ctx"),
+    ("num_predict", "num_predict"),
+    ("num_keep", "num_keep"),
+    ("tfs_z", "tfs_z"),
+    ("min_p", "min_p"),
+    ("repeat_last_n", "repeat_last_n"),
+]
+
+
+# Boolean flags that Ollama accepts.
+BOOL_OPTION_COLUMNS = ["use_mmap", "use_mlock"]
+
+# Every input column that feeds into the options of a request.
+OPTION_INPUT_COLUMNS = [col for col, _ in OPTION_COLUMNS] + ["stop_sequence"] + BOOL_OPTION_COLUMNS
+
+# An immutable options mapping, shared by every trial that resolves to it.
+OptionSet = Mapping[str, Any]
+
+
+def _is_present(value: Any) -> bool:
+    """True unless the value is None, NaN or an empty string."""
+    if value is None:
+        return False
+    if isinstance(value, float) and np.isnan(value):
+        return False
+    return not (isinstance(value, str) and value == "")
+
+
+def _parse_stop(value: Any) -> Optional[Tuple[str, ...]]:
+    """Stop sequences: a pipe-separated string or a list. None if nothing usable."""
+    if isinstance(value, str):
+        parts = tuple(p for p in (part.strip() for part in value.split("|")) if p)
+        return parts or None
+    if isinstance(value, (list, tuple)):
+        return tuple(value)
+    return None
+
+
+def _options_from_values(values: Mapping[str, Any]) -> OptionSet:
+    """Builds one immutable option set from a column -> value mapping."""
+    opts: Dict[str, Any] = {}
+    for col, opt_key in OPTION_COLUMNS:
+        if col in values and _is_present(values[col]):
+            opts[opt_key] = values[col]
+
+    if "stop_sequence" in values and _is_present(values["stop_sequence"]):
+        stop = _parse_stop(values["stop_sequence"])
+        if stop is not None:
+            opts["stop"] = stop
+
+    for b in BOOL_OPTION_COLUMNS:
+        if b in values and _is_present(values[b]):
+            opts[b] = bool(values[b])
+
+    return MappingProxyType(opts)
+
+
+def _build_options(row: Dict[str, Any]) -> OptionSet:
+    """Builds Ollama options safely from a single data row."""
+    return _options_from_values(row)
+
+
+def _combine_codes(codes: List[np.ndarray], dims: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Factorizes rows of several categorical code columns at once.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: A code per row and the distinct code
+                                       combinations, shape (n_distinct, n_columns).
+    """
+    # Mixed-radix key per row, hash-factorized; sort-based fallback if it would overflow
+    if np.prod(dims, dtype=float) < 2 ** 62:
+        row_combo, keys = pd.factorize(np.ravel_multi_index(codes, dims))
+        return row_combo, np.stack(np.unravel_index(keys, dims), axis=1)
+    combos, row_combo = np.unique(np.stack(codes, axis=1), axis=0, return_inverse=True)
+    return row_combo.reshape(-1), combos
+
+
+def resolve_option_sets(trials_df: pd.DataFrame) -> Tuple[np.ndarray, List[OptionSet]]:
+    """
+    Resolves Ollama options for every trial column-wise. Each option column is
+    factorized once, and an option set is built once per distinct combination, so
+    the cost scales with the number of distinct option sets rather than trials.
+
+    Args:
+        trials_df (pd.DataFrame): The trials, e.g. the output of build_prompts_df.
+
+    Returns:
+        Tuple[np.ndarray, List[OptionSet]]: For each row (by position), an index into
+                                            the list of shared, read-only option sets.
+    """
+    cols = [c for c in OPTION_INPUT_COLUMNS if c in trials_df.columns]
+    if not cols or trials_df.empty:
+        return np.zeros(len(trials_df), dtype=np.intp), [MappingProxyType({})]
+
+    codes: List[np.ndarray] = []
+    uniques: List[List[Any]] = []
+    for col in cols:
+        values = trials_df[col]
+        if values.dtype == object:
+            # Lists (e.g. stop sequences) are unhashable; factorize them as tuples
+            values = values.map(lambda v: tuple(v) if isinstance(v, list) else v)
+        col_codes, col_uniques = pd.factorize(values, use_na_sentinel=False)
+        if values.dtype == np.float32:
+            col_uniques = col_uniques.astype(str).astype(np.float64)
+        codes.append(col_codes)
+        uniques.append(col_uniques.tolist())  # native Python scalars, as in to_dict()
+
+    set_codes, combos = _combine_codes(codes, [len(u) for u in uniques])
+    option_sets = [
+        _options_from_values({col: uniques[i][combo[i]] for i, col in enumerate(cols)})
+        for combo in combos
+    ]
+    return set_codes, option_sets
+
+
+def _response_columns(response: Any) -> Dict[str, Any]:
+    """Flattens an Ollama generate response into the llm_* result columns."""
+    out: Dict[str, Any] = {
+        "llm_status": "ok",
+        "llm_model": response.get("model"),
+        "llm_created_at": response.get("created_at"),
+        "llm_response": response.get("response"),
+        "llm_done": response.get("done"),
+        "llm_done_reason": response.get("done_reason"),
+        "llm_eval_count": response.get("eval_count"),
+        "llm_eval_duration_ns": response.get("eval_duration"),
+        "llm_prompt_eval_count": response.get("prompt_eval_count"),
+        "llm_prompt_eval_duration_ns": response.get("prompt_eval_duration"),
+        "llm_load_duration_ns": response.get("load_duration"),
+        "llm_total_duration_ns": response.get("total_duration"),
+    }
+
+    # Responses routed through an EndpointPool name the server that answered
+    endpoint = response.get("endpoint") if isinstance(response, dict) else None
+    if endpoint is not None:
+        out["llm_endpoint"] = endpoint
+
+    # Some versions include token/metadata under "info"; if present, flatten a few
+    info = response.get("info") if isinstance(response, dict) else None
+    if isinstance(info, dict):
+        for k, v in info.items():
+            out[f"llm_info_{k}"] = v
+    return out
+
+
+def _build_request(row: Dict[str, Any], options: Optional[OptionSet] = None) -> Dict[str, Any]:
+    """
+    Builds the exact keyword arguments sent to `generate` for one trial. `options`
+    is the trial's pre-resolved option set; it is built from the row if omitted.
+    """
+    model = row.get("model")
+    prompt = row.get("final-prompt")
+    system_prompt = row.get("system-prompt", "")
+    if options is None:
+        options = _build_options(row)
+
+    if not model or not prompt:
+        raise ValueError("Missing required fields for Ollama call: 'model' and/or 'final-prompt'.")
+
+    return {
+        "model": model,
+        "prompt": prompt,
+        "system": system_prompt or None,
+        "options": dict(options) if options else None,
+    }
+
+
+def _stream_until_decision(client: "OllamaClient", request: Dict[str, Any], role: Any,
+                           tail_tokens: int) -> Dict[str, Any]:
+    """
+    Streams one generate call and closes the stream `tail_tokens` tokens after the
+    role's decision shows up in the text, which makes Ollama stop generating.
+
+    Returns:
+        Dict[str, Any]: The llm_* columns. A stream that ends on its own looks like a
+                        normal response; a cut-short one has llm_done=False,
+                        llm_done_reason="early_stop" and no server durations. Both add
+                        llm_stream_decision, llm_truncation_reason ("decision" or None)
+                        and llm_tokens_saved (num_predict budget left unused by the cut).
+    """
+    parts: List[str] = []
+    tokens = 0
+    first: Any = None
+    final: Any = None
+    decision = None
+    decided_at = 0
+    chunks = client.generate(**request, stream=True)
+    try:
+        for chunk in chunks:
+            if first is None:
+                first = chunk
+            parts.append(chunk.get("response") or "")
+            if chunk.get("done"):
+                final = chunk
+                break
+            tokens += 1
+            if decision is None:
+                decision = detect_decision(role, "".join(parts), final=False)
+                decided_at = tokens
+            if decision is not None and tokens - decided_at >= tail_tokens:
+                break
+    finally:
+        chunks.close()
+
+    text = "".join(parts)
+    if final is not None:
+        out = _response_columns(final)
+        out["llm_response"] = text
+        decision = detect_decision(role, text)
+    else:
+        source = first if first is not None else {}
+        out = {
+            "llm_status": "ok",
+            "llm_model": source.get("model"),
+            "llm_created_at": source.get("created_at"),
+            "llm_response": text,
+            "llm_done": False,
+            "llm_done_reason": "early_stop",
+            "llm_eval_count": tokens,
+            "llm_eval_duration_ns": None,
+            "llm_prompt_eval_count": None,
+            "llm_prompt_eval_duration_ns": None,
+            "llm_load_duration_ns": None,
+            "llm_total_duration_ns": None,
+        }
+        endpoint = source.get("endpoint") if isinstance(source, dict) else None
+        if endpoint is not None:
+            out["llm_endpoint"] = endpoint
+
+    num_predict = (request.get("options") or {}).get("num_predict")
+    truncated = final is None and decision is not None
+    out["llm_stream_decision"] = decision.value if decision is not None else None
+    out["llm_truncation_reason"] = "decision" if truncated else None
+    out["llm_tokens_saved"] = max(int(num_predict) - tokens, 0) if truncated and num_predict and num_predict > 0 else 0
+    return out
+
+
+# Anything with ollama.Client's generate(); an EndpointPool spreads calls over several servers.
+OllamaClient = Union[ollama.Client, EndpointPool]
+
+
+def _run_single_trial(client: OllamaClient, row: Dict[str, Any],
+                      options: Optional[OptionSet] = None,
+                      cache: Optional[ResponseCache] = None,
+                      early_stop_tail: Optional[int] = None,
+                      retry: Optional[RetryPolicy] = None) -> Dict[str, Any]:
+    """
+    Sends one trial to Ollama and returns the row merged with the llm_* columns.
+    Any exception is captured on the row as llm_status="error", with
+    `llm_error_kind` saying whether it was transient, a timeout or permanent (see
+    retries.classify_error). With a `retry` policy, transient failures and timeouts
+    are retried; `llm_attempts` counts the calls made (0 for a cache hit).
+    `llm_client_wall_ns` is the time the call took as seen from here, retries
+    included. With `early_stop_tail` set, the response is streamed and cut that
+    many tokens after the decision.
+    """
+    base_out: Dict[str, Any] = dict(row)  # start with original inputs
+    start_ns = time.perf_counter_ns()
+    attempts = 0
+    try:
+        request = _build_request(row, options)
+
+        def _attempt() -> Dict[str, Any]:
+            if early_stop_tail is not None:
+                return _stream_until_decision(client, request, row.get("role"), early_stop_tail)
+            return _response_columns(client.generate(**request, stream=False))
+
+        def _generate() -> Dict[str, Any]:
+            nonlocal attempts
+            if retry is None:
+                attempts = 1
+                return _attempt()
+            columns, attempts = retry.call(_attempt)
+            return columns
+
+        if cache is not None:
+            # Truncated responses must not be served to runs without (or with another) tail
+            cache_key = request if early_stop_tail is None else dict(request, early_stop_tail=early_stop_tail)
+            columns, hit = cache.get_or_generate(cache_key, _generate)
+        else:
+            columns, hit = _generate(), False
+        base_out.update(columns)
+        base_out["llm_cache_hit"] = hit
+
+    except TrialFailed as e:
+        attempts = e.attempts
+        base_out.update({
+            "llm_status": "error",
+            "llm_error": str(e),
+            "llm_error_kind": e.kind,
+            "llm_cache_hit": False,
+        })
+    except Exception as e:
+        base_out.update({
+            "llm_status": "error",
+            "llm_error": str(e),
+            "llm_error_kind": classify_error(e),
+            "llm_cache_hit": False,
+        })
+
+    base_out["llm_attempts"] = attempts
+    base_out["llm_client_wall_ns"] = time.perf_counter_ns() - start_ns
+    return base_out
+
+
+Trial = Tuple[int, Dict[str, Any], OptionSet]
+
+
+def _iter_trials(df: pd.DataFrame, chunksize: int = 10_000) -> Iterator[Trial]:
+    """
+    Yields (position, row dict, option set) a chunk at a time, so the whole frame is
+    never duplicated as dicts. Options are resolved once for the whole frame. Integer
+    index labels are kept as positions so callers that run a slice of a larger frame
+    still report positions in the full frame.
+    """
+    option_codes, option_sets = resolve_option_sets(df)
+    positions = df.index if pd.api.types.is_integer_dtype(df.index) else pd.RangeIndex(len(df))
+    for start in range(0, len(df), chunksize):
+        chunk = widen_float32(df.iloc[start:start + chunksize])
+        for pos, row, code in zip(positions[start:start + chunksize], chunk.to_dict(orient="records"),
+                                  option_codes[start:start + chunksize]):
+            yield int(pos), row, option_sets[code]
+
+
+ResultSink = Callable[[int, Dict[str, Any]], None]
+
+
+def _timeout(retry: Optional[RetryPolicy]) -> Optional[float]:
+    """HTTP timeout for a client built here: the retry policy's per-trial timeout, if any."""
+    return retry.timeout_s if retry is not None else None
+
+
+def is_dead_letter(result: Dict[str, Any]) -> bool:
+    """True for a trial that failed for a reason a later re-run could get past."""
+    return result.get("llm_status") == "error" and result.get("llm_error_kind") in RETRYABLE_KINDS
+
+
+def _run_trials_sequentially(client: OllamaClient,
+                             trials: Iterable[Trial],
+                             sink: ResultSink,
+                             cache: Optional[ResponseCache] = None,
+                             early_stop_tail: Optional[int] = None,
+                             retry: Optional[RetryPolicy] = None) -> None:
+    """Runs trials one at a time, handing each result to `sink` as it completes."""
+    for pos, row, options in trials:
+        result = _run_single_trial(client, row, options, cache, early_stop_tail, retry)
+        result["llm_queue_wait_ns"] = 0
+        sink(pos, result)
+
+
+def _run_trials_concurrently(client: OllamaClient,
+                             trials: Iterable[Trial],
+                             sink: ResultSink,
+                             concurrency: int,
+                             model_concurrency: Optional[Dict[str, int]],
+                             cache: Optional[ResponseCache] = None,
+                             early_stop_tail: Optional[int] = None,
+                             limiter: Optional[AdaptiveConcurrency] = None,
+                             retry: Optional[RetryPolicy] = None) -> None:
+    """
+    Runs trials on a thread pool, keeping at most `concurrency` requests in flight
+    overall and at most `model_concurrency[model]` per model. Trials are dispatched
+    in input order and each result is handed to `sink` with its position as soon as
+    it completes. `llm_queue_wait_ns` records how long each trial waited for its slots.
+    With a `limiter`, its adaptive per-model limits replace `concurrency`.
+
+    A trial's own errors are recorded on its result; an exception from `sink`
+    (e.g. a journal that can't be written) stops dispatching, and the first one is
+    raised once the trials in flight have finished, as in the sequential runner.
+    """
+    global_slots = threading.BoundedSemaphore(concurrency)
+    model_slots = {m: threading.BoundedSemaphore(n) for m, n in (model_concurrency or {}).items()}
+    failures: List[BaseException] = []
+
+    def _collect(future: Future) -> None:
+        error = future.exception()
+        if error is not None:
+            failures.append(error)
+
+    def _worker(pos: int, row: Dict[str, Any], options: OptionSet,
+                model_slot: Optional[threading.BoundedSemaphore], ready_ns: int) -> None:
+        result: Dict[str, Any] = {}
+        try:
+            queue_wait_ns = time.perf_counter_ns() - ready_ns
+            result = _run_single_trial(client, row, options, cache, early_stop_tail, retry)
+            result["llm_queue_wait_ns"] = queue_wait_ns
+            sink(pos, result)
+        finally:
+            if model_slot is not None:
+                model_slot.release()
+            if limiter is not None:
+                limiter.release(row.get("model"), result)
+            else:
+                global_slots.release()
+
+    max_workers = limiter.max_in_flight if limiter is not None else concurrency
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ollama-trial") as pool:
+        for pos, row, options in trials:
+            if failures:
+                break
+            ready_ns = time.perf_counter_ns()
+            # Take the model slot first so a saturated model never holds a global slot
+            model_slot = model_slots.get(row.get("model"))
+            if model_slot is not None:
+                model_slot.acquire()
+            if limiter is not None:
+                # Blocks while the limits are full, so no further trials are pulled meanwhile
+                limiter.acquire(row.get("model"))
+            else:
+                global_slots.acquire()
+            pool.submit(_worker, pos, row, options, model_slot, ready_ns).add_done_callback(_collect)
+    if failures:
+        raise failures[0]
+
+
+def run_ollama_trials(trials_with_prompts_df: pd.DataFrame,
+                      concurrency: int = 1,
+                      model_concurrency: Optional[Dict[str, int]] = None,
+                      host: Optional[str] = None,
+                      cache: Optional[ResponseCache] = None,
+                      journal: Optional[TrialJournal] = None,
+                      pool: Optional[EndpointPool] = None,
+                      metrics: Optional[TrialMetrics] = None,
+                      early_stop_tail: Optional[int] = None,
+                      limiter: Optional[AdaptiveConcurrency] = None,
+                      retry: Optional[RetryPolicy] = None,
+                      dead_letter: Optional[DeadLetterFile] = None) -> Optional[pd.DataFrame]:
     """
     Iterates through each trial, sends a request to the Ollama API with the
     specified parameters, and captures the full response.
@@ -85,112 +782,87 @@ def run_ollama_trials(trials_with_prompts_df: pd.DataFrame) -> pd.DataFrame:
     Args:
         trials_with_prompts_df (pd.DataFrame): The DataFrame containing the
                                                final prompts and all parameters.
+        concurrency (int): Maximum number of requests in flight at once. 1 runs
+                           the trials sequentially.
+        model_concurrency (Dict[str, int], optional): Per-model cap on requests in
+                                                      flight, e.g. {"phi3:latest": 2}.
+        host (str, optional): Ollama server URL. Defaults to OLLAMA_HOST / localhost.
+        cache (ResponseCache, optional): On-disk cache for deterministic requests.
+                                         None bypasses the cache for this run.
+        journal (TrialJournal, optional): Append each result to this journal as it
+                                          completes instead of keeping it in memory.
+                                          Trials whose trial-id is already journaled
+                                          are skipped, so re-running resumes the run.
+                                          A ResultTable of the trials keeps them in
+                                          memory, compactly, for save_results.
+        pool (EndpointPool, optional): Route requests across several Ollama servers
+                                       instead of `host`; results get `llm_endpoint`.
+        metrics (TrialMetrics, optional): Record every finished trial's latencies and
+                                          token counts here as it completes.
+        early_stop_tail (int, optional): Stream responses and stop each one this many
+                                         tokens after its decision (accept/reject, or
+                                         the offer) is detected. None waits for the
+                                         full response.
+        limiter (AdaptiveConcurrency, optional): Adapt the requests in flight per
+                                                 endpoint and model to the server's
+                                                 queueing instead of using a fixed
+                                                 `concurrency`. Reuse one across calls
+                                                 to keep its limits and timeline.
+        retry (RetryPolicy, optional): Time out hung requests and retry transient
+                                       failures with backoff, within the policy's
+                                       retry budget. None makes one attempt per
+                                       trial with no timeout.
+        dead_letter (DeadLetterFile, optional): Append trials that still failed
+                                                with a transient error or timeout
+                                                here, to re-run later as an input file.
 
     Returns:
         pd.DataFrame: A new DataFrame containing the results of all trials,
-                      including all inputs and all output metadata.
-    """
-
-
-    # Helper: build Ollama options safely from a data row
-    def _build_options(row: Dict[str, Any]) -> Dict[str, Any]:
-        # Map known columns to Ollama options; include only if present and not null
-        def present(key: str) -> bool:
-            return (key in row) and (row[key] is not None) and (not (isinstance(row[key], float) and np.isnan(row[key]))) and (row[key] != "")
-
-        opts: Dict[str, Any] = {}
-        mapping = [
-            ("seed", "seed"),
-            ("temperature", "temperature"),
-            ("top_p", "top_p"),
-            ("top_k", "top_k"),
-            ("repeat_penalty", "repeat_penalty"),
-            ("presence_penalty", "presence_penalty"),
-            ("frequency_penalty", "frequency_penalty"),
-            ("mirostat", "mirostat"),
-            ("mirostat_tau", "mirostat_tau"),
-            ("mirostat_eta", "mirostat_eta"),
-            ("num_ctx", "num_ctx"),
-            ("num_predict", "num_predict"),
-            ("num_keep", "num_keep"),
-            ("tfs_z", "tfs_z"),
-            ("min_p", "min_p"),
-            ("repeat_last_n", "repeat_last_n"),
-        ]
-        for col, opt_key in mapping:
-            if present(col):
-                opts[opt_key] = row[col]
-
-        # Stop sequences: support string or list
-        if present("stop_sequence"):
-            stop_val = row["stop_sequence"]
-            if isinstance(stop_val, str):
-                # Allow pipe-separated list, else single stop
-                parts = [s for s in [p.strip() for p in stop_val.split("|")] if s]
-                opts["stop"] = parts if len(parts) > 1 else parts
-            elif isinstance(stop_val, (list, tuple)):
-                opts["stop"] = list(stop_val)
-
-        # Booleans that Ollama accepts
-        for b in ["use_mmap", "use_mlock"]:
-            if present(b):
-                opts[b] = bool(row[b])
-
-        return opts
-
-    # Iterate over trials and call Ollama
-    results: List[Dict[str, Any]] = []
-    trials: List[Dict[str, Any]] = trials_with_prompts_df.to_dict(orient="records")
-
-    for idx, row in enumerate(trials, start=1):
-        base_out: Dict[str, Any] = dict(row)  # start with original inputs
-        try:
-            model = row.get("model")
-            prompt = row.get("final-prompt")
-            system_prompt = row.get("system-prompt", "")
-            options = _build_options(row)
-
-            if not model or not prompt:
-                raise ValueError("Missing required fields for Ollama call: 'model' and/or 'final-prompt'.")
-
-            response = ollama.generate(
-                model=model,
-                prompt=prompt,
-                system=system_prompt or None,
-                options=options if options else None,
-                stream=False,
-            )
-
-            # Merge key response fields
-            base_out.update({
-                "llm_status": "ok",
-                "llm_model": response.get("model"),
-                "llm_created_at": response.get("created_at"),
-                "llm_response": response.get("response"),
-                "llm_done": response.get("done"),
-                "llm_done_reason": response.get("done_reason"),
-                "llm_eval_count": response.get("eval_count"),
-                "llm_eval_duration_ns": response.get("eval_duration"),
-                "llm_prompt_eval_count": response.get("prompt_eval_count"),
-                "llm_prompt_eval_duration_ns": response.get("prompt_eval_duration"),
-                "llm_total_duration_ns": response.get("total_duration"),
-            })
-
-            # Some versions include token/metadata under "info"; if present, flatten a few
-            info = response.get("info") if isinstance(response, dict) else None
-            if isinstance(info, dict):
-                for k, v in info.items():
-                    base_out[f"llm_info_{k}"] = v
-
-        except Exception as e:
-            base_out.update({
-                "llm_status": "error",
-                "llm_error": str(e),
-            })
-
-        results.append(base_out)
-
-    return pd.DataFrame(results)
+                      including all inputs and all output metadata, in input order.
+                      `llm_cache_hit` marks trials answered without a new LLM call;
+                      `llm_client_wall_ns` and `llm_queue_wait_ns` are client-side timings;
+                      `llm_attempts` and, for failures, `llm_error_kind` come from the retries.
+                      With early_stop_tail, also `llm_stream_decision`,
+                      `llm_truncation_reason` and `llm_tokens_saved`.
+                      Built once at the end from a compact ResultTable. None when a
+                      journal is given; pass the journal to save_results.
+    """
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be >= 1, got {concurrency}")
+
+    client: OllamaClient = pool if pool is not None else ollama.Client(host=host, timeout=_timeout(retry))
+    trials = _iter_trials(trials_with_prompts_df)
+
+    results = ResultTable(trials_with_prompts_df)
+    if journal is not None:
+        done = journal.completed_ids()
+        trials = (trial for trial in trials if str(trial[1].get("trial-id")) not in done)
+        sink: ResultSink = journal.append
+    else:
+        sink = results.append
+    if metrics is not None or dead_letter is not None:
+        store = sink
+
+        def sink(pos: int, result: Dict[str, Any]) -> None:
+            if metrics is not None:
+                metrics.record(result)
+            if dead_letter is not None and is_dead_letter(result):
+                dead_letter.append(result)
+            store(pos, result)
+
+    if limiter is not None:
+        limiter.bind(pool)
+        _run_trials_concurrently(client, trials, sink, concurrency, model_concurrency, cache, early_stop_tail,
+                                 limiter, retry)
+    elif concurrency == 1 and not model_concurrency:
+        _run_trials_sequentially(client, trials, sink, cache, early_stop_tail, retry)
+    else:
+        _run_trials_concurrently(client, trials, sink, concurrency, model_concurrency, cache, early_stop_tail,
+                                 retry=retry)
+
+    if journal is not None:
+        return None
+    return results.to_frame()
 
 
 def debug_run_single_trial(trial: Dict[str, Any]) -> Dict[str, Any]:
@@ -248,21 +920,69 @@ def debug_run_single_trial(trial: Dict[str, Any]) -> Dict[str, Any]:
 
 # --- 5. Saving Results ---
 
-def save_results(results_df: pd.DataFrame, output_path: Path) -> None:
+def save_results(results_df: Union[pd.DataFrame, TrialJournal, ResultTable], output_path: Path) -> None:
     """
-    Saves the final results DataFrame to a specified CSV or Excel file.
+    Saves the final results DataFrame to a specified CSV file or Parquet dataset.
 
     Args:
-        results_df (pd.DataFrame): The DataFrame containing the experiment results.
-        output_path (Path): The file path where the results should be saved.
+        results_df (pd.DataFrame | TrialJournal | ResultTable): The experiment results,
+                                                 or the journal (or result table) they
+                                                 were streamed to, which is written in
+                                                 trial order chunk by chunk.
+        output_path (Path): The file path where the results should be saved. A path
+                            ending in .parquet is written as a compressed Parquet
+                            dataset partitioned by experiment-id and model.
     """
     output_path.parent.mkdir(parents=True, exist_ok=True)
+    if output_path.suffix.lower() == ".parquet":
+        _save_parquet_results(results_df, output_path)
+        return
+    if isinstance(results_df, TrialJournal):
+        rows = results_df.write_csv(output_path)
+        if rows == 0:
+            warnings.warn("save_results called with an empty journal; creating empty file.")
+        print(f"Results saved to: {output_path}")
+        return
+    if isinstance(results_df, ResultTable):
+        rows = 0
+        for chunk in results_df.iter_frames():
+            chunk.to_csv(output_path, mode="w" if rows == 0 else "a", header=rows == 0, index=False)
+            rows += len(chunk)
+        if rows == 0:
+            warnings.warn("save_results called with an empty result table; creating empty file.")
+            results_df.inputs.iloc[:0].to_csv(output_path, index=False)
+        print(f"Results saved to: {output_path}")
+        return
     if results_df is None or results_df.empty:
         warnings.warn("save_results called with empty results DataFrame; creating empty file.")
     results_df.to_csv(output_path, index=False)
     print(f"Results saved to: {output_path}")
 
 
+def _save_parquet_results(results: Union[pd.DataFrame, TrialJournal, ResultTable], output_path: Path) -> None:
+    """Replaces the dataset at output_path, writing the results one chunk at a time."""
+    if output_path.is_dir():
+        shutil.rmtree(output_path)
+    elif output_path.exists():
+        output_path.unlink()
+
+    store = ParquetResultStore(output_path)
+    if isinstance(results, TrialJournal):
+        chunks = results.iter_chunks()
+    elif isinstance(results, ResultTable):
+        chunks = results.iter_frames()
+    else:
+        chunks = [results]
+    rows = 0
+    for chunk in chunks:
+        if chunk is not None:
+            store.write(chunk)
+            rows += len(chunk)
+    if rows == 0:
+        warnings.warn("save_results called with empty results; no Parquet files written.")
+    print(f"Results saved to: {output_path}")
+
+
 # --- Utility: Optional preview and save of intermediary DataFrame (Step 3) ---
 def maybe_preview_and_save_intermediate_df(df: pd.DataFrame, default_filename: str = "Intermediate-Prompts.csv") -> None:
     """
@@ -0,0 +1,452 @@
+"""
+A small fake Ollama HTTP server for benchmarks and local experiments.
+
+It implements just enough of the Ollama REST API (`/api/generate`, streaming or
+not, `/api/tags`, `/api/ps`, `/api/version`) for `ollama.Client` to talk to it,
+sleeping instead of running a model. The time a request takes is
+
+    base latency (fixed, uniform, exponential or lognormal around `latency_s`)
+    + prompt tokens / `prompt_tokens_per_s` + generated tokens / `eval_tokens_per_s`
+
+and a share `error_rate` of requests fails with HTTP 500, while a share
+`hang_rate` takes `hang_s` longer (a hung request, for client timeouts). With
+`num_parallel`, only that many requests are processed at once and the rest wait
+for a slot, like OLLAMA_NUM_PARALLEL; as in Ollama, the wait is reported in
+`load_duration` and `total_duration`. Streamed tokens are paced at
+`eval_tokens_per_s`, and a client that disconnects stops generation;
+`tokens_generated` counts what was actually produced. Like a real Ollama box
+it keeps at most `max_loaded_models` models resident (least recently used is
+evicted), and loading a model costs `load_delay_s` (or a per-model value).
+
+Prompt tokens are the words of the system prompt and the prompt. With
+`prompt_cache_slots`, the server keeps that many evaluated prompts per model,
+like Ollama's per-slot KV cache: a request reuses the slot whose prompt shares
+the longest leading run of tokens with its own, only the rest is evaluated (and
+counted in `prompt_eval_count` and `prompt_eval_duration`), and the slot then
+holds the new prompt. Unloading a model drops its cached prompts.
+
+Everything is deterministic: response text follows from the request, and the
+random draws come from `seed`, the request and how many times that request has
+been seen, so repeated runs against a fresh server behave identically whatever
+the thread timing.
+"""
+
+import contextlib
+import hashlib
+import itertools
+import json
+import re
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+# Filler words for responses padded to `response_tokens`.
+_FILLER = ("the", "offer", "seems", "fair", "given", "pot", "and", "my", "reasoning", "is", "simple")
+
+
+class _FakeOllamaHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so the client can keep connections alive between requests
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass  # Keep benchmark output clean
+
+    def _send_json(self, payload: Dict[str, Any], status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length) if length else b"{}"
+        return json.loads(raw or b"{}")
+
+    def do_GET(self) -> None:
+        if self.path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        elif self.path == "/api/tags":
+            self._send_json({"models": [{"name": m, "model": m} for m in sorted(self.server.seen_models)]})
+        elif self.path == "/api/ps":
+            self._send_json({"models": [{"name": m, "model": m} for m in list(self.server.loaded_models)]})
+        else:
+            self._send_json({"error": f"not found: {self.path}"}, status=404)
+
+    def do_POST(self) -> None:
+        if self.server.killed:
+            # Drop the connection without answering, like a crashed server
+            self.close_connection = True
+            return
+        if self.path != "/api/generate":
+            self._send_json({"error": f"not found: {self.path}"}, status=404)
+            return
+        request = self._read_json()
+        self.server.record_request()
+        if request.get("stream", True):
+            self._send_stream(self.server.stream_generate(request))
+            return
+        response = self.server.generate(request)
+        self._send_json(response, status=500 if "error" in response else 200)
+
+    def _send_stream(self, chunks: Iterator[Dict[str, Any]]) -> None:
+        """Sends NDJSON chunks with chunked transfer encoding; stops if the client goes away."""
+        first = next(chunks)
+        if "error" in first:
+            self._send_json(first, status=500)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for chunk in itertools.chain([first], chunks):
+                data = (json.dumps(chunk) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        finally:
+            chunks.close()
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """
+    Threaded fake Ollama server. Every request is served on its own thread, so by
+    default the server behaves like a backend with unlimited parallel slots and lets
+    benchmarks measure client-side concurrency; set num_parallel to model a busy one.
+
+    Usage:
+        with FakeOllamaServer(latency_s=0.05) as server:
+            engine.run_ollama_trials(df, host=server.url)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency_s: float = 0.05, load_delay_s: Union[float, Dict[str, float]] = 0.0,
+                 max_loaded_models: int = 1, host: str = "127.0.0.1", port: int = 0,
+                 latency_distribution: str = "fixed", latency_spread: float = 0.5,
+                 prompt_tokens_per_s: Optional[float] = None, eval_tokens_per_s: Optional[float] = None,
+                 response_tokens: Optional[int] = None, error_rate: float = 0.0, seed: int = 0,
+                 num_parallel: Optional[int] = None, hang_rate: float = 0.0, hang_s: float = 60.0,
+                 prompt_cache_slots: int = 0):
+        """
+        Args:
+            latency_s (float): Base latency per request; the median for "lognormal",
+                               the mean otherwise.
+            load_delay_s (float | Dict[str, float]): Time to load a model, or per-model
+                                                     times (missing models load instantly).
+            max_loaded_models (int): Models kept resident at once.
+            latency_distribution (str): One of LATENCY_DISTRIBUTIONS.
+            latency_spread (float): Half-width of "uniform" as a fraction of latency_s,
+                                    or the sigma of "lognormal".
+            prompt_tokens_per_s (float, optional): Prompt processing speed; adds
+                                                   prompt tokens / rate to each request.
+            eval_tokens_per_s (float, optional): Generation speed; adds generated
+                                                 tokens / rate to each request.
+            response_tokens (int, optional): Pad responses to this many words (capped
+                                             by the request's num_predict).
+            error_rate (float): Share of requests answered with HTTP 500.
+            seed (int): Seed for latency and error draws.
+            num_parallel (int, optional): Requests processed at once; others queue.
+                                          None processes every request immediately.
+            hang_rate (float): Share of requests that stall for `hang_s` before answering.
+            hang_s (float): Extra time a stalled request takes.
+            prompt_cache_slots (int): Evaluated prompts kept per model for prefix
+                                      reuse; 0 evaluates every prompt in full.
+        """
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"latency_distribution must be one of {LATENCY_DISTRIBUTIONS}")
+        super().__init__((host, port), _FakeOllamaHandler)
+        self.latency_s = latency_s
+        self.load_delay_s = load_delay_s
+        self.max_loaded_models = max_loaded_models
+        self.latency_distribution = latency_distribution
+        self.latency_spread = latency_spread
+        self.prompt_tokens_per_s = prompt_tokens_per_s
+        self.eval_tokens_per_s = eval_tokens_per_s
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang_s = hang_s
+        self.hang_count = 0
+        self.seed = seed
+        self.request_count = 0
+        self.error_count = 0
+        self.tokens_generated = 0
+        self._seen_requests: "Counter[str]" = Counter()
+        self.load_count = 0
+        self.seen_models = set()
+        self.loaded_models: "OrderedDict[str, None]" = OrderedDict()
+        self.killed = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(num_parallel) if num_parallel else None
+        self.num_parallel = num_parallel
+        self.prompt_cache_slots = prompt_cache_slots
+        self.prompt_tokens_cached = 0
+        self.prompt_tokens_evaluated = 0
+        self._prompt_cache: Dict[str, "OrderedDict[int, Tuple[str, ...]]"] = {}
+        self._prompt_cache_ids = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # Clients hanging up (early-stopped streams, closed pools) are expected here
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.request_count += 1
+
+    def _ensure_loaded(self, model: str) -> int:
+        """Loads `model` if it is not resident; returns the load time in ns."""
+        with self._load_lock:
+            if model in self.loaded_models:
+                self.loaded_models.move_to_end(model)
+                return 0
+            start = time.perf_counter_ns()
+            delay = self.load_delay_s.get(model, 0.0) if isinstance(self.load_delay_s, dict) else self.load_delay_s
+            time.sleep(delay)
+            while len(self.loaded_models) >= self.max_loaded_models:
+                evicted, _ = self.loaded_models.popitem(last=False)
+                with self._lock:
+                    self._prompt_cache.pop(evicted, None)
+            self.loaded_models[model] = None
+            self.load_count += 1
+            return time.perf_counter_ns() - start
+
+    def _evaluate_prompt(self, model: str, tokens: Tuple[str, ...]) -> int:
+        """Prompt tokens that must be evaluated, after reusing the best-matching cached prompt."""
+        if not self.prompt_cache_slots:
+            cached = 0
+        else:
+            with self._lock:
+                slots = self._prompt_cache.setdefault(model, OrderedDict())
+                best, cached = None, 0
+                for slot, previous in slots.items():
+                    shared = 0
+                    for a, b in zip(previous, tokens):
+                        if a != b:
+                            break
+                        shared += 1
+                    if shared > cached:
+                        best, cached = slot, shared
+                # Like Ollama, the last prompt token is always evaluated again
+                cached = min(cached, max(len(tokens) - 1, 0))
+                if best is None:
+                    best = next(self._prompt_cache_ids)
+                    if len(slots) >= self.prompt_cache_slots:
+                        slots.popitem(last=False)
+                slots[best] = tokens
+                slots.move_to_end(best)
+        with self._lock:
+            self.prompt_tokens_cached += cached
+            self.prompt_tokens_evaluated += len(tokens) - cached
+        return len(tokens) - cached
+
+    def _rng(self, digest: str) -> np.random.Generator:
+        """Random stream for the n-th occurrence of a request, so retries draw afresh."""
+        with self._lock:
+            self._seen_requests[digest] += 1
+            occurrence = self._seen_requests[digest]
+        return np.random.default_rng([self.seed, int(digest[:15], 16), occurrence])
+
+    def _base_latency(self, rng: np.random.Generator) -> float:
+        if self.latency_distribution == "uniform":
+            return rng.uniform(1 - self.latency_spread, 1 + self.latency_spread) * self.latency_s
+        if self.latency_distribution == "exponential":
+            return rng.exponential(self.latency_s)
+        if self.latency_distribution == "lognormal":
+            return self.latency_s * float(np.exp(rng.normal(0.0, self.latency_spread)))
+        return self.latency_s
+
+    def _response_text(self, digest: str, prompt: str, num_predict: Optional[int],
+                       seed: Optional[int] = None) -> Tuple[str, bool]:
+        """
+        Deterministic response for a prompt (and seed, like Ollama's sampling), and
+        whether num_predict cut it short. Ultimatum prompts get a decision first:
+        receivers accept (or, for a quarter of draws, reject) and proposers offer
+        30-50% of the pot.
+        """
+        text = f"Fake response {digest[:12]} to a {len(prompt)}-character prompt."
+        if seed is None:
+            draw = int(digest[12:16], 16)
+        else:
+            draw = int(hashlib.sha256(f"{digest}\n{seed}".encode("utf-8")).hexdigest()[:4], 16)
+        lowered = prompt.lower()
+        if "receiver" in lowered and "accept" in lowered:
+            text = f"Decision: {'REJECT' if draw % 4 == 0 else 'ACCEPT'}. {text}"
+        elif "proposer" in lowered:
+            pot = re.search(r"\$(\d+(?:\.\d+)?)", prompt)
+            if pot is not None:
+                offer = round(float(pot.group(1)) * (0.3 + 0.05 * (draw % 5)), 2)
+                text = f"Offer: ${offer:g} to the receiver. {text}"
+
+        words = text.split()
+        if self.response_tokens is not None:
+            words += [_FILLER[i % len(_FILLER)] for i in range(max(self.response_tokens - len(words), 0))]
+        truncated = num_predict is not None and 0 <= num_predict < len(words)
+        if truncated:
+            words = words[:num_predict]
+        return " ".join(words), truncated
+
+    @contextlib.contextmanager
+    def _slot(self) -> Iterator[int]:
+        """Holds a processing slot for the duration; yields how long it waited for one, in ns."""
+        if self._slots is None:
+            yield 0
+            return
+        start = time.perf_counter_ns()
+        self._slots.acquire()
+        try:
+            yield time.perf_counter_ns() - start
+        finally:
+            self._slots.release()
+
+    def _begin(self, request: Dict[str, Any], queued_ns: int = 0) -> Dict[str, Any]:
+        """
+        Common start of a generate call: loads the model and decides the outcome.
+        Returns a finished response (preload or error) under "final", or the plan
+        for generating text. `queued_ns` is how long the request waited for a slot.
+        """
+        start = time.perf_counter_ns() - queued_ns
+        model = request.get("model", "")
+        prompt = request.get("prompt") or ""
+        with self._lock:
+            self.seen_models.add(model)
+
+        load_ns = queued_ns + self._ensure_loaded(model)
+        if not prompt:
+            # An empty prompt only loads the model, like Ollama's preload call
+            return {"final": {
+                "model": model,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "response": "",
+                "done": True,
+                "done_reason": "load",
+                "load_duration": load_ns,
+                "total_duration": time.perf_counter_ns() - start,
+            }}
+
+        digest = hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+        rng = self._rng(digest)
+        if self.error_rate and rng.random() < self.error_rate:
+            with self._lock:
+                self.error_count += 1
+            return {"final": {"error": f"fake failure for model '{model}'"}}
+
+        latency_s = self._base_latency(rng)
+        if self.hang_rate and rng.random() < self.hang_rate:
+            with self._lock:
+                self.hang_count += 1
+            latency_s += self.hang_s
+
+        options = request.get("options") or {}
+        text, truncated = self._response_text(digest, prompt, options.get("num_predict"), options.get("seed"))
+        prompt_tokens = self._evaluate_prompt(model, tuple((request.get("system") or "").split() + prompt.split()))
+        return {
+            "start": start, "model": model, "load_ns": load_ns, "text": text,
+            "done_reason": "length" if truncated else "stop",
+            "prompt_tokens": prompt_tokens,
+            "prompt_s": prompt_tokens / self.prompt_tokens_per_s if self.prompt_tokens_per_s else 0.0,
+            "latency_s": latency_s,
+        }
+
+    def _final_response(self, plan: Dict[str, Any], eval_tokens: int, eval_s: float, text: str) -> Dict[str, Any]:
+        total_ns = time.perf_counter_ns() - plan["start"]
+        run_ns = total_ns - plan["load_ns"]
+        if self.prompt_tokens_per_s or self.eval_tokens_per_s:
+            prompt_ns, eval_ns = int(plan["prompt_s"] * 1e9), int(eval_s * 1e9)
+        else:
+            prompt_ns, eval_ns = run_ns // 4, run_ns // 2
+        return {
+            "model": plan["model"],
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "response": text,
+            "done": True,
+            "done_reason": plan["done_reason"],
+            "prompt_eval_count": plan["prompt_tokens"],
+            "prompt_eval_duration": prompt_ns,
+            "eval_count": eval_tokens,
+            "eval_duration": eval_ns,
+            "load_duration": plan["load_ns"],
+            "total_duration": total_ns,
+        }
+
+    def generate(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Builds a deterministic non-streaming /api/generate response after sleeping for the modelled time."""
+        with self._slot() as queued_ns:
+            plan = self._begin(request, queued_ns)
+            if "final" in plan:
+                return plan["final"]
+            eval_tokens = len(plan["text"].split())
+            eval_s = eval_tokens / self.eval_tokens_per_s if self.eval_tokens_per_s else 0.0
+            time.sleep(plan["latency_s"] + plan["prompt_s"] + eval_s)
+        with self._lock:
+            self.tokens_generated += eval_tokens
+        return self._final_response(plan, eval_tokens, eval_s, plan["text"])
+
+    def stream_generate(self, request: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Yields /api/generate stream chunks, one word per chunk, pacing them at
+        eval_tokens_per_s. Closing the generator stops generation, like a client
+        disconnect does on a real server.
+        """
+        with self._slot() as queued_ns:
+            plan = self._begin(request, queued_ns)
+            if "final" in plan:
+                yield plan["final"]
+                return
+            time.sleep(plan["latency_s"] + plan["prompt_s"])
+            words = plan["text"].split()
+            per_token_s = 1 / self.eval_tokens_per_s if self.eval_tokens_per_s else 0.0
+            eval_start = time.perf_counter()
+            for i, word in enumerate(words):
+                if per_token_s:
+                    time.sleep(per_token_s)
+                with self._lock:
+                    self.tokens_generated += 1
+                yield {"model": plan["model"], "created_at": datetime.now(timezone.utc).isoformat(),
+                       "response": word if i == 0 else " " + word, "done": False}
+            eval_s = time.perf_counter() - eval_start if per_token_s else 0.0
+            yield self._final_response(plan, len(words), eval_s, "")
+
+    def start(self) -> "FakeOllamaServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def kill(self) -> None:
+        """Simulates a crash: open connections are dropped and new ones are refused."""
+        self.killed = True
+        self.stop()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeOllamaServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.stop()
@@ -0,0 +1,411 @@
+"""
+Paired proposer -> receiver games.
+
+In a plain input file a receiver's `offer` is a fixed column value. Here, rows
+that share a `game-id` form one game: the proposer row plays first, and every
+receiver row of the game responds to the offer the proposer actually made
+(possibly with a different model). Each receiver depends on its proposer, so
+the trials form a dependency graph instead of two phases:
+
+    proposer finishes -> offer parsed (decisions.detect_decision) -> receiver
+    rows get `offer` and their final prompt -> dispatched right away
+
+Receivers of a finished proposer go ahead of the next proposers, so games
+complete in about input order, while independent games run concurrently under
+the same slots, limiter and retries as `engine.run_ollama_trials`. Rows without
+a game-id run as ordinary trials. If the proposer failed or made no usable
+offer (none found, or outside 0..pot), its receivers are recorded with
+llm_status="skipped" and the reason in `llm_skip_reason`.
+
+Receiver results also carry their proposer (`game_proposer_trial_id`,
+`game_proposer_model`, `game_proposer_status`), so `write_games_file` can save
+each game's outcome as one row without joining the two sides.
+
+Rows of a game must be adjacent, proposer first, as `input_table_gen.
+generate_game_design` writes them; a game split across two input chunks is
+carried over by the `GameState` passed to every chunk.
+"""
+
+import math
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+import numpy as np
+import ollama
+import pandas as pd
+
+import analysis
+import engine
+from adaptive_concurrency import AdaptiveConcurrency
+from dead_letter import DeadLetterFile
+from decisions import detect_decision
+from endpoint_pool import EndpointPool
+from journal import TrialJournal
+from metrics import TrialMetrics
+from response_cache import ResponseCache
+from result_records import ResultTable
+from retries import RetryPolicy
+
+GAME_ID_COLUMN = "game-id"
+PROPOSER_COLUMNS = ["game_proposer_trial_id", "game_proposer_model", "game_proposer_status"]
+SKIPPED_STATUS = "skipped"
+
+# One row per receiver of a game, written by write_games_file.
+GAMES_OUTPUT_COLUMNS = ["experiment-id", "game-id", "pot", "offer", "offer_fraction",
+                        "proposer_model", "proposer_trial_id", "proposer_status",
+                        "receiver_model", "receiver_trial_id", "receiver_status", "decision",
+                        "proposer_payoff", "receiver_payoff"]
+_GAMES_INPUT_COLUMNS = ["experiment-id", "game-id", "trial-id", "model", "role", "pot", "offer",
+                        "llm_status", "llm_response"] + PROPOSER_COLUMNS
+
+
+def game_key(value: Any) -> Optional[str]:
+    """A row's game-id as a string, or None for rows that are not part of a game."""
+    if value is None or (isinstance(value, float) and math.isnan(value)) or value == "":
+        return None
+    return str(value)
+
+
+class GameGraph:
+    """
+    Which rows of a trial table depend on which: the proposer of every game and
+    its receivers, as row positions in the table.
+
+    Args:
+        trials_df (pd.DataFrame): Trials with a `game-id` column (others run alone).
+
+    Raises:
+        ValueError: If a game has more than one proposer.
+    """
+
+    def __init__(self, trials_df: pd.DataFrame):
+        self.proposers: Dict[str, int] = {}
+        self.receivers: Dict[str, List[int]] = {}
+        if GAME_ID_COLUMN not in trials_df.columns:
+            return
+        roles = trials_df["role"].astype(str).to_numpy()
+        for pos, (value, role) in enumerate(zip(trials_df[GAME_ID_COLUMN].to_numpy(), roles)):
+            game = game_key(value)
+            if game is None:
+                continue
+            if role == "proposer":
+                if game in self.proposers:
+                    raise ValueError(f"Game '{game}' has more than one proposer")
+                self.proposers[game] = pos
+            elif role == "receiver":
+                self.receivers.setdefault(game, []).append(pos)
+
+    def __len__(self) -> int:
+        return len(set(self.proposers) | set(self.receivers))
+
+
+def proposer_outcome(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    What a proposer's receivers need from its result: who it was, its status, and the
+    offer it made (None, with a `skip_reason`, if receivers can't respond to it).
+    """
+    outcome = {"game_proposer_trial_id": result.get("trial-id"),
+               "game_proposer_model": result.get("model"),
+               "game_proposer_status": result.get("llm_status"),
+               "offer": None, "skip_reason": None}
+    if result.get("llm_status") != "ok":
+        outcome["skip_reason"] = "proposer_failed"
+        return outcome
+    decision = detect_decision("proposer", str(result.get("llm_response") or ""))
+    if decision is None:
+        outcome["skip_reason"] = "no_offer"
+        return outcome
+    # A whole offer takes the pot's type, so an int pot reads "$40 ... $60" in the receiver's
+    # prompt and a float pot "$40.0 ... $60.0", like the pot itself
+    offer = float(decision.value)
+    if offer.is_integer() and (result.get("pot") is None or pd.api.types.is_integer(result.get("pot"))):
+        offer = int(offer)
+    pot = pd.to_numeric(result.get("pot"), errors="coerce")
+    if offer < 0 or (not pd.isna(pot) and offer > float(pot)):
+        outcome["skip_reason"] = "invalid_offer"
+    outcome["offer"] = offer
+    return outcome
+
+
+class GameState:
+    """
+    Proposer outcomes of games whose receivers may still be waiting to run, kept
+    across the input chunks of one run (and restored from the journal on resume).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.outcomes: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, game: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        outcome = proposer_outcome(result)
+        with self._lock:
+            self.outcomes[game] = outcome
+        return outcome
+
+    def get(self, game: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self.outcomes.get(game)
+
+    def load_journal(self, journal: TrialJournal, games: Set[str]) -> None:
+        """Restores the outcomes of the given games' journaled proposers (one pass over the journal)."""
+        games = {g for g in games if g not in self.outcomes}
+        if not games:
+            return
+        for _, result in journal.iter_entries():
+            game = game_key(result.get(GAME_ID_COLUMN))
+            if game in games and result.get("role") == "proposer":
+                self.record(game, result)
+
+    def retain(self, games: Set[str]) -> None:
+        """Forgets every outcome except these games' (ones that may continue in the next chunk)."""
+        with self._lock:
+            self.outcomes = {g: o for g, o in self.outcomes.items() if g in games}
+
+
+def _receiver_trial(trial: engine.Trial, outcome: Optional[Dict[str, Any]]) -> Tuple[engine.Trial, Optional[str]]:
+    """
+    The receiver trial with its proposer's offer and the prompt built from it, or the
+    reason it can't run.
+    """
+    pos, row, options = trial
+    row = dict(row)
+    if outcome is None:
+        return (pos, row, options), "no_proposer"
+    row.update({col: outcome[col] for col in PROPOSER_COLUMNS})
+    if outcome["skip_reason"] is not None:
+        if outcome["offer"] is not None:
+            row["offer"] = outcome["offer"]
+        return (pos, row, options), outcome["skip_reason"]
+    row["offer"] = outcome["offer"]
+    row["final-prompt"] = engine._format_prompt_row(row)
+    return (pos, row, options), None
+
+
+def run_paired_games(trials_with_prompts_df: pd.DataFrame,
+                     concurrency: int = 1,
+                     model_concurrency: Optional[Dict[str, int]] = None,
+                     host: Optional[str] = None,
+                     cache: Optional[ResponseCache] = None,
+                     journal: Optional[TrialJournal] = None,
+                     pool: Optional[EndpointPool] = None,
+                     metrics: Optional[TrialMetrics] = None,
+                     early_stop_tail: Optional[int] = None,
+                     state: Optional[GameState] = None,
+                     limiter: Optional[AdaptiveConcurrency] = None,
+                     retry: Optional[RetryPolicy] = None,
+                     dead_letter: Optional[DeadLetterFile] = None) -> Optional[pd.DataFrame]:
+    """
+    Runs trials, dispatching each game's receivers as soon as its proposer finishes.
+
+    Args:
+        trials_with_prompts_df (pd.DataFrame): The output of build_prompts_df, with a
+                                               `game-id` column. Receivers' offer and
+                                               final prompt are replaced at dispatch.
+        concurrency, model_concurrency, host, cache, pool, metrics, early_stop_tail, limiter,
+        retry, dead_letter:
+            As for run_ollama_trials.
+        journal (TrialJournal, optional): As for run_ollama_trials. Receivers whose
+                                          proposer is already journaled respond to
+                                          the journaled offer.
+        state (GameState, optional): Carry proposer outcomes across calls, so a game
+                                     split between two input chunks stays paired.
+
+    Returns:
+        pd.DataFrame: The results in input order, skipped receivers included with
+                      llm_status="skipped". None when a journal is given.
+    """
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be >= 1, got {concurrency}")
+    if state is None:
+        state = GameState()
+
+    df = trials_with_prompts_df
+    if not pd.api.types.is_integer_dtype(df.index):
+        df = df.reset_index(drop=True)
+    client: engine.OllamaClient = pool if pool is not None else ollama.Client(host=host, timeout=engine._timeout(retry))
+    graph = GameGraph(df)
+
+    results = ResultTable(df)
+    done: Set[str] = set()
+    if journal is not None:
+        done = journal.completed_ids()
+        store: engine.ResultSink = journal.append
+    else:
+        store = results.append
+
+    trial_ids = df["trial-id"].astype(str).to_numpy() if "trial-id" in df.columns else None
+
+    def is_done(pos: int) -> bool:
+        return trial_ids is not None and trial_ids[pos] in done
+
+    # Games whose proposer runs in this call; the others' receivers need an earlier outcome
+    running = {game for game, pos in graph.proposers.items() if not is_done(pos)}
+    if journal is not None:
+        state.load_journal(journal, {game for game, positions in graph.receivers.items()
+                                     if game not in running and not all(is_done(p) for p in positions)})
+
+    cond = threading.Condition()
+    ready: Deque[engine.Trial] = deque()
+    waiting: Dict[str, List[engine.Trial]] = {}
+    finished: Dict[str, Dict[str, Any]] = {}
+    awaiting = 0  # dispatched proposers whose receivers are not released yet
+
+    def sink(pos: int, result: Dict[str, Any]) -> None:
+        nonlocal awaiting
+        if metrics is not None:
+            metrics.record(result)
+        if dead_letter is not None and engine.is_dead_letter(result):
+            dead_letter.append(result)
+        game = game_key(result.get(GAME_ID_COLUMN))
+        if not (game in running and result.get("role") == "proposer"):
+            store(pos, result)
+            return
+        try:
+            store(pos, result)
+        finally:
+            # Even if the result can't be stored, the scheduler must not wait for it forever;
+            # the engine raises the store error after the trials in flight
+            outcome = state.record(game, result)
+            with cond:
+                finished[game] = outcome
+                ready.extend(waiting.pop(game, []))
+                awaiting -= 1
+                cond.notify_all()
+
+    def prepared(trial: engine.Trial) -> Iterator[engine.Trial]:
+        """Yields a receiver ready to run, or records why it can't."""
+        game = game_key(trial[1].get(GAME_ID_COLUMN))
+        trial, skip_reason = _receiver_trial(trial, finished.get(game) or state.get(game))
+        if skip_reason is None:
+            yield trial
+        else:
+            pos, row, _ = trial
+            store(pos, {**row, "llm_status": SKIPPED_STATUS, "llm_skip_reason": skip_reason})
+
+    def drain() -> Iterator[engine.Trial]:
+        while True:
+            with cond:
+                if not ready:
+                    return
+                trial = ready.popleft()
+            yield from prepared(trial)
+
+    def schedule() -> Iterator[engine.Trial]:
+        nonlocal awaiting
+        for trial in engine._iter_trials(df):
+            # Receivers whose proposer just finished go first, so games complete in order
+            yield from drain()
+            row = trial[1]
+            if str(row.get("trial-id")) in done:
+                continue
+            game = game_key(row.get(GAME_ID_COLUMN))
+            role = row.get("role")
+            if game is None or role not in ("proposer", "receiver"):
+                yield trial
+            elif role == "proposer":
+                with cond:
+                    awaiting += 1
+                yield trial
+            elif game in running:
+                with cond:
+                    if game not in finished:
+                        waiting.setdefault(game, []).append(trial)
+                        continue
+                yield from prepared(trial)
+            else:
+                yield from prepared(trial)
+        while True:
+            with cond:
+                while not ready and awaiting > 0:
+                    cond.wait()
+                if not ready:
+                    return
+            yield from drain()
+
+    trials = schedule()
+    if limiter is not None:
+        limiter.bind(pool)
+        engine._run_trials_concurrently(client, trials, sink, concurrency, model_concurrency, cache, early_stop_tail,
+                                        limiter, retry)
+    elif concurrency == 1 and not model_concurrency:
+        engine._run_trials_sequentially(client, trials, sink, cache, early_stop_tail, retry)
+    else:
+        engine._run_trials_concurrently(client, trials, sink, concurrency, model_concurrency, cache, early_stop_tail,
+                                        retry=retry)
+
+    # Only the last game of the frame can continue in the next chunk
+    last = game_key(df[GAME_ID_COLUMN].iloc[-1]) if GAME_ID_COLUMN in df.columns and len(df) else None
+    state.retain({last} if last is not None else set())
+
+    if journal is not None:
+        return None
+    return results.to_frame()
+
+
+# --- Paired outcomes ---
+
+def pair_games(results_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per receiver of a game: the proposer's offer and the receiver's decision
+    side by side, with both players' payoffs (offer and the remainder if accepted,
+    nothing for either if rejected). Receivers that were skipped keep their row, with
+    no decision or payoffs.
+
+    Args:
+        results_df (pd.DataFrame): Results with the receivers' game_proposer_* columns.
+
+    Returns:
+        pd.DataFrame: GAMES_OUTPUT_COLUMNS.
+    """
+    receivers = results_df.reindex(columns=_GAMES_INPUT_COLUMNS)
+    receivers = receivers[(receivers["role"].astype(str) == "receiver") & receivers["game-id"].notna()
+                          & receivers["game_proposer_trial_id"].notna()]
+    decided = analysis.extract_decisions(receivers)
+    pot = pd.to_numeric(decided["pot"], errors="coerce").to_numpy(dtype=float)
+    offer = pd.to_numeric(decided["offer"], errors="coerce").to_numpy(dtype=float)
+    decision = decided["decision"].astype(object).to_numpy()
+    accepted = decision == "accept"
+    decided_mask = accepted | (decision == "reject")
+    return pd.DataFrame({
+        "experiment-id": decided["experiment-id"].to_numpy(),
+        "game-id": decided["game-id"].to_numpy(),
+        "pot": pot,
+        "offer": offer,
+        "offer_fraction": decided["offer_fraction"].to_numpy(),
+        "proposer_model": decided["game_proposer_model"].to_numpy(),
+        "proposer_trial_id": decided["game_proposer_trial_id"].to_numpy(),
+        "proposer_status": decided["game_proposer_status"].to_numpy(),
+        "receiver_model": decided["model"].to_numpy(),
+        "receiver_trial_id": decided["trial-id"].to_numpy(),
+        "receiver_status": decided["llm_status"].to_numpy(),
+        "decision": decision,
+        "proposer_payoff": np.where(decided_mask, np.where(accepted, pot - offer, 0.0), np.nan),
+        "receiver_payoff": np.where(decided_mask, np.where(accepted, offer, 0.0), np.nan),
+    }, columns=GAMES_OUTPUT_COLUMNS)
+
+
+def write_games_file(results_path: Union[Path, TrialJournal],
+                     output_path: Path,
+                     chunksize: int = 100_000) -> int:
+    """
+    Runs pair_games over saved results (results CSV, Parquet or journal) chunk by
+    chunk and writes the paired outcomes to a CSV.
+
+    Returns:
+        int: Number of games (receiver rows) written.
+    """
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    rows = 0
+    for chunk in analysis.iter_result_chunks(results_path, _GAMES_INPUT_COLUMNS, chunksize):
+        games = pair_games(chunk)
+        if games.empty:
+            continue
+        games.to_csv(output_path, mode="w" if rows == 0 else "a", header=rows == 0, index=False)
+        rows += len(games)
+    if rows == 0:
+        pd.DataFrame(columns=GAMES_OUTPUT_COLUMNS).to_csv(output_path, index=False)
+    return rows
@@ -1,99 +1,99 @@
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Optional, Sequence
 
 import numpy as np
 import pandas as pd
 
 
+BASE_SYSTEM_PROMPT = ("You are a rational agent participating in an economic decision-making experiment. "
+                      "Provide clear, direct responses that explain your reasoning. "
+                      "Focus only on the decision at hand.")
+
+BASE_PROMPT_PROPOSER = ("You are the proposer in an ultimatum game. "
+                        "The total pot is ${pot}. "
+                        "You must propose a split of the pot between you and the receiver. "
+                        "State your offer to the receiver and justify your reasoning.")
+
+BASE_PROMPT_RECEIVER = ("You are the receiver in an ultimatum game. "
+                        "The total pot is ${pot}. "
+                        "The proposer has offered you ${offer}. "
+                        "If you accept, you will receive ${offer} and the proposer will receive ${remainder}. "
+                        "If you reject, both of you will receive nothing. "
+                        "Decide whether to accept or reject the offer and justify your reasoning.")
+
+
+# Supported models
+CPU_MODELS: List[str] = [
+    "phi3:latest",
+    # "phi:latest",        # Microsoft's smallest model
+    # "phi-2:latest",      # Improved version, still lightweight
+    # "neural-chat:7b",    # Good balance of size/performance
+    # "stablelm-zephyr:3b",# Very lightweight
+    # "llama2:7b",         # Base model, reasonable on CPU
+    # "orca-mini:3b"       # Smaller version of Orca
+]
+GPU_MODELS: List[str] = [
+    "mixtral:8x7b",      # State-of-the-art performance
+    "llama2:70b",        # Large, well-researched model
+    "falcon:40b",        # Strong performer
+    "openchat:7b",       # Great for dialogues
+    "vicuna:13b",        # Strong reasoning
+    "codellama:34b",     # Excellent for analytical tasks
+    "qwen:72b",          # Latest large model
+    "claude-2:latest"    # If available through Ollama
+]
+MODELS: List[str] = [] + CPU_MODELS  # + GPU_MODELS
+
+# DataFrame columns (matching OpenWebUI parameter names where possible)
+COLUMNS: List[str] = [
+    # --- Experimental Setup Metadata ---
+    "experiment-id",     # str, experiment grouping
+    "trial-id",          # str, unique trial identifier
+    "game",              # str, task/game type
+    "role",              # str, {'proposer', 'receiver'}
+    "pot",               # float, total resources in the game
+    "offer",             # float, proposed split value
+    "model",             # str, model name
+
+    # --- Prompts and Instructions ---
+    "system-prompt",     # str, researcher-provided or default
+    "base-prompt",       # str, researcher-provided or default
+    "final-prompt",      # str, constructed prompt substitued with pot/offer.
+
+    # --- Creative / Behavioral Parameters for Ollama ---
+    "temperature",       # float, [0.0-2.0], randomness/creativity
+    "top_p",             # float, [0.0-1.0], nucleus sampling
+    "top_k",             # int, [1+], top-k token filtering
+    "min_p",             # float, [0.0-1.0], minimum probability
+    "repeat_penalty",    # float, [1.0-2.0], discourages repetition
+    "frequency_penalty", # float, [0.0-2.0], discourages frequent tokens
+    "presence_penalty",  # float, [0.0-2.0], encourages novelty
+    "tfs_z",             # float, tail-free sampling parameter
+    "mirostat",          # int, {0,1,2}, adaptive sampling mode
+    "mirostat_eta",      # float, learning rate for mirostat
+    "mirostat_tau",      # float, target surprise for mirostat
+
+    # --- Technical / System Parameters ---
+    "seed",              # int, reproducibility seed (or not-applicable)
+    "repeat_last_n",     # int, tokens considered for repeat_penalty
+    "reasoning_effort",  # float or str, not widely supported
+    "logit_bias",        # str or dict, bias token probabilities.
+    "num_ctx",           # int, context window size
+    "stop_sequence",     # str or list, stopping condition
+    "use_mmap",          # bool, memory map flag, not useful
+    "use_mlock",         # bool, lock model into RAM, not useful
+    "num_keep",          # int, tokens to keep from start of context, not useful
+    "num_predict",       # int, number of tokens to predict
+    # "max_tokens",        # int, max tokens to generate - overlaps w/ num_predict.
+]
+
+
 def generate_sample_input_file(output_path: Path) -> None:
     """
     Generates a sample CSV file with experiment parameters and saves it to the specified path.
     """
     num_rows = 10  # aka trials
 
-    base_system_prompt = ("You are a rational agent participating in an economic decision-making experiment. "
-                          "Provide clear, direct responses that explain your reasoning. "
-                          "Focus only on the decision at hand.")
-
-    base_prompt_proposer = ("You are the proposer in an ultimatum game. "
-                            "The total pot is ${pot}. "
-                            "You must propose a split of the pot between you and the receiver. "
-                            "State your offer to the receiver and justify your reasoning.")
-
-    base_prompt_receiver = ("You are the receiver in an ultimatum game. "
-                            "The total pot is ${pot}. "
-                            "The proposer has offered you ${offer}. "
-                            "If you accept, you will receive ${offer} and the proposer will receive ${remainder}. "
-                            "If you reject, both of you will receive nothing. "
-                            "Decide whether to accept or reject the offer and justify your reasoning.")
-
-
-
-    # Define supported models
-    cpu_models: List[str] = [
-        "phi3:latest",
-        # "phi:latest",        # Microsoft's smallest model
-        # "phi-2:latest",      # Improved version, still lightweight
-        # "neural-chat:7b",    # Good balance of size/performance
-        # "stablelm-zephyr:3b",# Very lightweight
-        # "llama2:7b",         # Base model, reasonable on CPU
-        # "orca-mini:3b"       # Smaller version of Orca
-    ]
-    gpu_models: List[str] = [
-        "mixtral:8x7b",      # State-of-the-art performance
-        "llama2:70b",        # Large, well-researched model
-        "falcon:40b",        # Strong performer
-        "openchat:7b",       # Great for dialogues
-        "vicuna:13b",        # Strong reasoning
-        "codellama:34b",     # Excellent for analytical tasks
-        "qwen:72b",          # Latest large model
-        "claude-2:latest"    # If available through Ollama
-    ]
-    models: List[str] = [] + cpu_models  # + gpu_models
-
-    # Define DataFrame columns (matching OpenWebUI parameter names where possible)
-    columns: List[str] = [
-        # --- Experimental Setup Metadata ---
-        "experiment-id",     # str, experiment grouping
-        "trial-id",          # str, unique trial identifier
-        "game",              # str, task/game type
-        "role",              # str, {'proposer', 'receiver'}
-        "pot",               # float, total resources in the game
-        "offer",             # float, proposed split value
-        "model",             # str, model name
-
-        # --- Prompts and Instructions ---
-        "system-prompt",     # str, researcher-provided or default
-        "base-prompt",       # str, researcher-provided or default
-        "final-prompt",      # str, constructed prompt substitued with pot/offer.
-
-        # --- Creative / Behavioral Parameters for Ollama ---
-        "temperature",       # float, [0.0-2.0], randomness/creativity
-        "top_p",             # float, [0.0-1.0], nucleus sampling
-        "top_k",             # int, [1+], top-k token filtering
-        "min_p",             # float, [0.0-1.0], minimum probability
-        "repeat_penalty",    # float, [1.0-2.0], discourages repetition
-        "frequency_penalty", # float, [0.0-2.0], discourages frequent tokens
-        "presence_penalty",  # float, [0.0-2.0], encourages novelty
-        "tfs_z",             # float, tail-free sampling parameter
-        "mirostat",          # int, {0,1,2}, adaptive sampling mode
-        "mirostat_eta",      # float, learning rate for mirostat
-        "mirostat_tau",      # float, target surprise for mirostat
-
-        # --- Technical / System Parameters ---
-        "seed",              # int, reproducibility seed (or not-applicable)
-        "repeat_last_n",     # int, tokens considered for repeat_penalty
-        "reasoning_effort",  # float or str, not widely supported
-        "logit_bias",        # str or dict, bias token probabilities.
-        "num_ctx",           # int, context window size
-        "stop_sequence",     # str or list, stopping condition
-        "use_mmap",          # bool, memory map flag, not useful
-        "use_mlock",         # bool, lock model into RAM, not useful
-        "num_keep",          # int, tokens to keep from start of context, not useful
-        "num_predict",       # int, number of tokens to predict
-        # "max_tokens",        # int, max tokens to generate - overlaps w/ num_predict.
-    ]
-
     # Fill with defaults / placeholders
     table: pd.DataFrame = pd.DataFrame({
         "experiment-id": ["EXP00"] * num_rows,
@@ -102,9 +102,9 @@ def generate_sample_input_file(output_path: Path) -> None:
         "role": np.random.choice(["proposer", "receiver"], size=num_rows),
         "pot": [100] * num_rows,
         "offer": [50.0] * num_rows,
-        "model": np.random.choice(models, size=num_rows),
+        "model": np.random.choice(MODELS, size=num_rows),
 
-        "system-prompt": [base_system_prompt] * num_rows,
+        "system-prompt": [BASE_SYSTEM_PROMPT] * num_rows,
         "base-prompt": [""] * num_rows,
         "final-prompt": [""] * num_rows,
 
@@ -131,12 +131,286 @@ def generate_sample_input_file(output_path: Path) -> None:
         "num_keep": [0] * num_rows,
         "num_predict": [512] * num_rows,
         # "max_tokens": [512] * num_rows,
-    }, columns=columns)
+    }, columns=COLUMNS)
 
     # Assign base prompts based on role after DataFrame creation
     table["base-prompt"] = table["role"].apply(
-        lambda x: base_prompt_proposer if x == "proposer" else base_prompt_receiver
+        lambda x: BASE_PROMPT_PROPOSER if x == "proposer" else BASE_PROMPT_RECEIVER
     )
 
     table.to_csv(output_path, index=False)
-    print(f"Sample input file saved to: {output_path}")
\ No newline at end of file
+    print(f"Sample input file saved to: {output_path}")
+
+# --- Factorial designs ---
+
+# Values for the parameter columns that are not design factors.
+DESIGN_PARAMETER_DEFAULTS = {
+    "top_p": 0.9,
+    "top_k": 40,
+    "min_p": 0.0,
+    "repeat_penalty": 1.1,
+    "frequency_penalty": 0.0,
+    "presence_penalty": 0.0,
+    "tfs_z": 1.0,
+    "mirostat": 0,
+    "mirostat_eta": 0.1,
+    "mirostat_tau": 5.0,
+    "repeat_last_n": 64,
+    "reasoning_effort": "",
+    "logit_bias": "",
+    "num_ctx": 2048,
+    "stop_sequence": "",
+    "use_mmap": True,
+    "use_mlock": False,
+    "num_keep": 0,
+    "num_predict": 512,
+}
+
+# Salts that give the row-selection and seed hashes independent streams.
+_SELECT_SALT = 0x5EEDF00D
+_SEED_SALT = 0xC0FFEE
+
+
+def _hash_uniform(index: np.ndarray, random_seed: int, salt: int) -> np.ndarray:
+    """
+    Counter-based uniform [0, 1) per grid index (SplitMix64). The value depends only on
+    (index, random_seed, salt), so designs are reproducible regardless of chunk size.
+    """
+    with np.errstate(over="ignore"):
+        z = index.astype(np.uint64) + np.uint64((random_seed * 0x9E3779B97F4A7C15 + salt) % 2**64)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+    return (z >> np.uint64(11)).astype(np.float64) * 2.0**-53
+
+
+def _design_blocks(roles: Sequence[str], factors: Dict[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    """
+    One block per role. Proposer prompts don't use the offer, so the offer
+    fraction is only a factor for receivers.
+    """
+    blocks = []
+    offset = 0
+    for role in roles:
+        names = [name for name in factors if role == "receiver" or name != "offer_fraction"]
+        dims = [len(factors[name]) for name in names]
+        size = int(np.prod(dims, dtype=np.int64))
+        blocks.append({"role": role, "names": names, "dims": dims, "offset": offset, "size": size})
+        offset += size
+    return blocks
+
+
+def _design_table(block: Dict[str, Any], factors: Dict[str, Sequence[Any]], local_idx: np.ndarray,
+                  random_seed: int, experiment_id: str, seeds_given: bool):
+    """Builds the Arrow table for some rows of one block. Repeated strings are dictionary-encoded."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    n = len(local_idx)
+    grid_idx = block["offset"] + local_idx
+    levels = dict(zip(block["names"], np.unravel_index(local_idx, block["dims"])))
+
+    def repeated(values: Sequence[str], codes: Optional[np.ndarray] = None):
+        codes = np.zeros(n, dtype=np.int32) if codes is None else codes.astype(np.int32)
+        return pa.DictionaryArray.from_arrays(pa.array(codes), pa.array(list(values), type=pa.string()))
+
+    pots = np.asarray(factors["pot"])[levels["pot"]]
+    if "offer_fraction" in levels:
+        offers = np.round(pots * np.asarray(factors["offer_fraction"], dtype=np.float64)[levels["offer_fraction"]], 2)
+    else:
+        offers = np.full(n, np.nan)
+    if seeds_given:
+        seed_values = np.asarray(factors["seed"], dtype=np.int64)[levels["seed"]]
+    else:
+        seed_values = (_hash_uniform(grid_idx, random_seed, _SEED_SALT) * 2**31).astype(np.int64)
+    base_prompt = BASE_PROMPT_PROPOSER if block["role"] == "proposer" else BASE_PROMPT_RECEIVER
+
+    columns = {
+        "experiment-id": repeated([experiment_id]),
+        "trial-id": pc.binary_join_element_wise("trial_", pc.cast(pa.array(grid_idx + 1), pa.string()), ""),
+        "game": repeated(["ultimatum"]),
+        "role": repeated([block["role"]]),
+        "pot": pa.array(pots),
+        "offer": pa.array(offers),
+        "model": repeated([str(m) for m in factors["model"]], levels["model"]),
+        "system-prompt": repeated([BASE_SYSTEM_PROMPT]),
+        "base-prompt": repeated([base_prompt]),
+        "final-prompt": repeated([""]),
+        "temperature": pa.array(np.asarray(factors["temperature"], dtype=np.float64)[levels["temperature"]]),
+        "seed": pa.array(seed_values),
+    }
+    for col, value in DESIGN_PARAMETER_DEFAULTS.items():
+        columns[col] = repeated([value]) if isinstance(value, str) else pa.array(np.full(n, value))
+    columns["replicate"] = pa.array(levels["replicate"].astype(np.int32))
+    return pa.table({col: columns[col] for col in COLUMNS + ["replicate"]})
+
+
+def generate_factorial_design(output_path: Path,
+                              pots: Sequence[float] = (100,),
+                              offer_fractions: Sequence[float] = (0.5,),
+                              models: Optional[Sequence[str]] = None,
+                              temperatures: Sequence[float] = (0.8,),
+                              seeds: Optional[Sequence[int]] = None,
+                              roles: Sequence[str] = ("proposer", "receiver"),
+                              replicates: int = 1,
+                              fraction: float = 1.0,
+                              random_seed: int = 0,
+                              experiment_id: str = "EXP00",
+                              chunk_rows: int = 1_000_000) -> int:
+    """
+    Expands factor levels into a full (or fractional) factorial design and streams it
+    to a CSV or Parquet file in chunks, so memory stays bounded for 10^7+ row designs.
+
+    Every role gets the grid models x pots x temperatures x seeds x replicates;
+    receivers additionally cross it with the offer fractions (offer = pot * fraction,
+    rounded to cents). Rows are decoded from their grid index with vectorized
+    mixed-radix arithmetic, and trial-ids are derived from the grid index.
+
+    Args:
+        output_path (Path): Destination; .parquet (recommended for big designs) or .csv.
+        pots, offer_fractions, models, temperatures: Factor levels. models defaults to MODELS.
+        seeds (Sequence[int], optional): Ollama seed levels. None (the default) derives a
+                                         distinct, reproducible seed for every row from
+                                         random_seed, so replicates are independent samples
+                                         rather than repeats of one seeded request.
+        roles (Sequence[str]): Roles to include.
+        replicates (int): Replicates of every condition; recorded in a 'replicate' column.
+        fraction (float): Keep this fraction of the grid (0 < fraction <= 1). Rows are
+                          chosen by a hash of (grid index, random_seed), so the same
+                          arguments always select the same rows.
+        random_seed (int): Seed for row selection and derived Ollama seeds.
+        experiment_id (str): Value of the experiment-id column.
+        chunk_rows (int): Grid rows generated and written per chunk.
+
+    Returns:
+        int: Number of rows written.
+    """
+    import pyarrow.parquet as pq
+
+    if not 0 < fraction <= 1:
+        raise ValueError(f"fraction must be in (0, 1], got {fraction}")
+    if replicates < 1:
+        raise ValueError(f"replicates must be >= 1, got {replicates}")
+    invalid_roles = [r for r in roles if r not in ("proposer", "receiver")]
+    if invalid_roles:
+        raise ValueError(f"Invalid roles: {invalid_roles}")
+
+    factors: Dict[str, Sequence[Any]] = {
+        "model": list(models if models is not None else MODELS),
+        "pot": list(pots),
+        "offer_fraction": list(offer_fractions),
+        "temperature": list(temperatures),
+    }
+    if seeds is not None:
+        factors["seed"] = list(seeds)
+    factors["replicate"] = list(range(replicates))
+
+    suffix = output_path.suffix.lower()
+    if suffix not in (".csv", ".parquet"):
+        raise ValueError(f"Unsupported design file type '{suffix}'; expected .csv or .parquet")
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    rows_written = 0
+    writer = None
+    try:
+        for block in _design_blocks(roles, factors):
+            for start in range(0, block["size"], chunk_rows):
+                local_idx = np.arange(start, min(start + chunk_rows, block["size"]), dtype=np.int64)
+                if fraction < 1:
+                    keep = _hash_uniform(block["offset"] + local_idx, random_seed, _SELECT_SALT) < fraction
+                    local_idx = local_idx[keep]
+                if len(local_idx) == 0:
+                    continue
+                table = _design_table(block, factors, local_idx, random_seed, experiment_id, seeds is not None)
+                if suffix == ".parquet":
+                    if writer is None:
+                        writer = pq.ParquetWriter(output_path, table.schema, compression="zstd")
+                    writer.write_table(table)
+                else:
+                    # pandas writes the CSV so numbers are formatted like generate_sample_input_file
+                    table.to_pandas().to_csv(output_path, mode="w" if rows_written == 0 else "a",
+                                             header=rows_written == 0, index=False)
+                rows_written += len(local_idx)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if rows_written == 0:
+        empty = pd.DataFrame(columns=COLUMNS + ["replicate"])
+        if suffix == ".csv":
+            empty.to_csv(output_path, index=False)
+        else:
+            empty.to_parquet(output_path)
+    print(f"Factorial design with {rows_written} trials saved to: {output_path}")
+    return rows_written
+
+
+def generate_game_design(output_path: Path,
+                         pots: Sequence[float] = (100,),
+                         proposer_models: Optional[Sequence[str]] = None,
+                         receiver_models: Optional[Sequence[str]] = None,
+                         temperatures: Sequence[float] = (0.8,),
+                         replicates: int = 1,
+                         random_seed: int = 0,
+                         experiment_id: str = "EXP00") -> int:
+    """
+    Writes paired ultimatum games for games.run_paired_games: one game per proposer
+    model x pot x temperature x replicate, each a proposer row followed by one
+    receiver row per receiver model, sharing a `game-id`. Receivers' offer is left
+    empty; it is filled in from the proposer's response when the game runs. Every
+    row gets its own reproducible seed derived from random_seed.
+
+    Args:
+        output_path (Path): Destination; .csv or .parquet.
+        pots, temperatures: Factor levels.
+        proposer_models, receiver_models: Models for each side; default to MODELS.
+        replicates (int): Games per condition; recorded in a 'replicate' column.
+        random_seed (int): Seed for the derived Ollama seeds.
+        experiment_id (str): Value of the experiment-id column.
+
+    Returns:
+        int: Number of rows (trials) written.
+    """
+    if replicates < 1:
+        raise ValueError(f"replicates must be >= 1, got {replicates}")
+    proposer_models = list(proposer_models if proposer_models is not None else MODELS)
+    receiver_models = list(receiver_models if receiver_models is not None else MODELS)
+    suffix = output_path.suffix.lower()
+    if suffix not in (".csv", ".parquet"):
+        raise ValueError(f"Unsupported design file type '{suffix}'; expected .csv or .parquet")
+
+    dims = [len(proposer_models), len(pots), len(temperatures), replicates]
+    n_games = int(np.prod(dims, dtype=np.int64))
+    model_idx, pot_idx, temp_idx, replicate = np.unravel_index(np.arange(n_games), dims)
+    players = 1 + len(receiver_models)
+    n = n_games * players
+    game = np.repeat(np.arange(n_games), players)
+    seat = np.tile(np.arange(players), n_games)  # 0 is the proposer
+    is_proposer = seat == 0
+
+    table = pd.DataFrame({
+        "experiment-id": experiment_id,
+        "trial-id": [f"trial_{i + 1}" for i in range(n)],
+        "game": "ultimatum",
+        "role": np.where(is_proposer, "proposer", "receiver"),
+        "pot": np.asarray(pots, dtype=np.float64)[pot_idx][game],
+        "offer": np.nan,
+        "model": np.where(is_proposer, np.asarray(proposer_models, dtype=object)[model_idx][game],
+                          np.asarray([""] + receiver_models, dtype=object)[seat]),
+        "system-prompt": BASE_SYSTEM_PROMPT,
+        "base-prompt": np.where(is_proposer, BASE_PROMPT_PROPOSER, BASE_PROMPT_RECEIVER),
+        "final-prompt": "",
+        "temperature": np.asarray(temperatures, dtype=np.float64)[temp_idx][game],
+        "seed": (_hash_uniform(np.arange(n), random_seed, _SEED_SALT) * 2**31).astype(np.int64),
+        **DESIGN_PARAMETER_DEFAULTS,
+    }, columns=COLUMNS)
+    table["replicate"] = replicate[game]
+    table["game-id"] = [f"game_{g + 1}" for g in game]
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if suffix == ".parquet":
+        table.to_parquet(output_path, index=False)
+    else:
+        table.to_csv(output_path, index=False)
+    print(f"Game design with {n_games} games ({n} trials) saved to: {output_path}")
+    return n
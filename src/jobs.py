@@ -0,0 +1,286 @@
+"""
+Background experiment jobs.
+
+The dashboard submits experiments here instead of running them on the Streamlit
+script thread. Each job gets its own directory under data/jobs/ holding the
+uploaded input file and every output the pipeline writes (results, journal,
+metrics), and a row in a SQLite job table:
+
+    queued -> running -> succeeded | failed       (queued jobs can be cancelled)
+
+A fixed number of worker threads take queued jobs in submission order, so several
+users can queue experiments without blocking each other or the dashboard. While a
+job runs, its worker tracks progress by counting the results appended to the job's
+journal, and readers can follow the journal for partial results. Jobs left
+running by a stopped server are queued again on start and resume from their
+journal.
+"""
+
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+import engine
+
+DEFAULT_JOBS_DIR = Path(__file__).parent.parent / "data" / "jobs"
+
+JOB_COLUMNS = ["job_id", "name", "status", "input_path", "output_path", "submitted_at", "started_at",
+               "finished_at", "total_trials", "done_trials", "error"]
+
+# Runs one job: (input file, results CSV) -> None. Raises on failure.
+JobRunner = Callable[[Path, Path], None]
+
+
+def _default_runner(input_path: Path, output_path: Path) -> None:
+    # Imported here: main configures the pipeline and creates data/ on import
+    from main import run_pipeline
+
+    run_pipeline(input_path=input_path, output_path=output_path, confirm=False, metrics_port=None)
+
+
+def job_paths(output_path: Path) -> Dict[str, Optional[Path]]:
+    """Every file a job writes, named after its results CSV (see main.output_paths)."""
+    from main import output_paths
+
+    return output_paths(output_path)
+
+
+def _safe_name(name: str, default: str) -> str:
+    """A file-name-safe version of a user-supplied name."""
+    cleaned = re.sub(r"[^A-Za-z0-9._-]+", "-", Path(name or "").name).strip("-.")
+    return cleaned or default
+
+
+class JobManager:
+    """
+    SQLite job table plus worker threads that run queued jobs.
+
+    Args:
+        root (Path): Directory for the job table and one sub-directory per job.
+        workers (int): Jobs run at the same time. Each job already keeps
+                       OLLAMA_CONCURRENCY requests in flight, so 1 is right for a
+                       single Ollama server.
+        runner (JobRunner, optional): Runs a job; defaults to main.run_pipeline.
+        poll_interval_s (float): Seconds between progress updates of a running job.
+    """
+
+    def __init__(self, root: Path = DEFAULT_JOBS_DIR,
+                 workers: int = 1,
+                 runner: Optional[JobRunner] = None,
+                 poll_interval_s: float = 1.0):
+        self.root = Path(root)
+        self.runner = runner or _default_runner
+        self.poll_interval_s = poll_interval_s
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.root / "jobs.sqlite"), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY, name TEXT NOT NULL, status TEXT NOT NULL,"
+            " input_path TEXT NOT NULL, output_path TEXT NOT NULL, submitted_at REAL NOT NULL,"
+            " started_at REAL, finished_at REAL, total_trials INTEGER, done_trials INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT)"
+        )
+        # Jobs cut off by a restart pick up from their journal
+        self._conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+        self._conn.commit()
+        for (job_id,) in self._conn.execute("SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY submitted_at"):
+            self._queue.put(job_id)
+
+        self._workers = [threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    # --- Job table ---
+
+    def _update(self, job_id: str, **values: Any) -> None:
+        assignments = ", ".join(f"{col} = ?" for col in values)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*values.values(), job_id))
+            self._conn.commit()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job's row as a dict, or None if there is no such job."""
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE job_id = ?",
+                                     (job_id,)).fetchone()
+        return dict(zip(JOB_COLUMNS, row)) if row is not None else None
+
+    def list_jobs(self) -> pd.DataFrame:
+        """All jobs, newest first, with times as datetimes and a `progress` fraction."""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs "
+                                      f"ORDER BY submitted_at DESC").fetchall()
+        df = pd.DataFrame(rows, columns=JOB_COLUMNS)
+        for col in ("submitted_at", "started_at", "finished_at"):
+            df[col] = pd.to_datetime(df[col], unit="s")
+        total = pd.to_numeric(df["total_trials"], errors="coerce")
+        df["progress"] = (df["done_trials"] / total.where(total > 0)).clip(upper=1.0)
+        return df
+
+    # --- Submitting ---
+
+    def submit(self, input_name: str, input_data: bytes, output_name: Optional[str] = None) -> str:
+        """
+        Queues an experiment.
+
+        Args:
+            input_name (str): Name of the uploaded input file; its suffix picks the
+                              format (.csv, .parquet or .xlsx).
+            input_data (bytes): The input file's contents.
+            output_name (str, optional): Results file name (without directory);
+                                         defaults to the input name with -OUT.
+
+        Returns:
+            str: The new job's id.
+        """
+        suffix = Path(input_name).suffix.lower()
+        if suffix not in engine.INPUT_SUFFIXES:
+            raise ValueError(f"Unsupported input file type '{suffix}'; expected one of {list(engine.INPUT_SUFFIXES)}")
+        job_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+        job_dir = self.root / job_id
+        job_dir.mkdir(parents=True)
+
+        input_path = job_dir / f"{_safe_name(Path(input_name).stem, 'input')}{suffix}"
+        input_path.write_bytes(input_data)
+        name = _safe_name(Path(output_name).stem if output_name else "", f"{input_path.stem}-OUT")
+        output_path = job_dir / f"{name}.csv"
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, name, status, input_path, output_path, submitted_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, name, str(input_path), str(output_path), time.time()),
+            )
+            self._conn.commit()
+        self._queue.put(job_id)
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancels a job that has not started yet. Returns False if it already has."""
+        with self._lock:
+            cur = self._conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? "
+                                     "WHERE job_id = ? AND status = 'queued'", (time.time(), job_id))
+            self._conn.commit()
+        return cur.rowcount > 0
+
+    # --- Running ---
+
+    def _track_progress(self, job_id: str, journal_path: Path, stop: threading.Event) -> None:
+        """Counts journaled results as they are appended, only reading the new bytes."""
+        offset, done = 0, 0
+        while True:
+            finished = stop.wait(self.poll_interval_s)
+            if journal_path.exists():
+                with open(journal_path, "rb") as f:
+                    f.seek(offset)
+                    data = f.read()
+                complete = data.rfind(b"\n") + 1
+                done += data.count(b"\n", 0, complete)
+                offset += complete
+                self._update(job_id, done_trials=done)
+            if finished:
+                return
+
+    def _run(self, job_id: str) -> None:
+        with self._lock:
+            # Conditional, so a job cancelled while it waited never starts
+            started = self._conn.execute("UPDATE jobs SET status = 'running', started_at = ?, error = NULL "
+                                         "WHERE job_id = ? AND status = 'queued'", (time.time(), job_id)).rowcount
+            self._conn.commit()
+        job = self.get(job_id)
+        if not started or job is None:
+            return
+        input_path, output_path = Path(job["input_path"]), Path(job["output_path"])
+
+        stop = threading.Event()
+        tracker = threading.Thread(target=self._track_progress, name=f"job-progress-{job_id}",
+                                   args=(job_id, job_paths(output_path)["journal"], stop), daemon=True)
+        try:
+            self._update(job_id, total_trials=engine.count_input_rows(input_path))
+            tracker.start()
+            self.runner(input_path, output_path)
+        except Exception as e:
+            status, error = "failed", f"{type(e).__name__}: {e}"
+        else:
+            status, error = "succeeded", None
+        finally:
+            stop.set()
+            if tracker.is_alive():
+                tracker.join()
+        self._update(job_id, status=status, finished_at=time.time(), error=error)
+
+    def _work(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            self._run(job_id)
+
+    def close(self, wait: bool = True) -> None:
+        """Stops the workers after the jobs they are running; queued jobs stay queued."""
+        for _ in self._workers:
+            self._queue.put(None)
+        if wait:
+            for worker in self._workers:
+                worker.join()
+        self._conn.close()
+
+
+class IncompleteChunk(Exception):
+    """Raised by read_journal_chunk for a chunk the journal is still filling; carries what was read."""
+
+    def __init__(self, df: pd.DataFrame, next_offset: int):
+        super().__init__(f"{len(df)} rows so far")
+        self.df = df
+        self.next_offset = next_offset
+
+
+def read_journal_chunk(journal_path: Path, offset: int, rows: int) -> Tuple[pd.DataFrame, int]:
+    """
+    Reads `rows` journaled results starting at byte `offset`. A full chunk never
+    changes once written, so this is safe to wrap in a cache (e.g. st.cache_data):
+    a chunk that is not full yet raises IncompleteChunk instead of returning, and
+    caches do not keep raised results.
+
+    Returns:
+        Tuple[pd.DataFrame, int]: The results and the offset of the next chunk.
+    """
+    from journal import TrialJournal
+
+    df, next_offset = TrialJournal(journal_path).read_chunk(offset, rows)
+    if len(df) < rows:
+        raise IncompleteChunk(df, next_offset)
+    return df, next_offset
+
+
+def read_partial_results(journal_path: Path,
+                         chunk_rows: int = 1_000,
+                         read_chunk: Callable[[Path, int, int], Tuple[pd.DataFrame, int]] = read_journal_chunk
+                         ) -> pd.DataFrame:
+    """
+    Everything a running (or finished) job has journaled so far, in completion order.
+    Pass a cached read_journal_chunk to re-read only the growing tail on each poll.
+    """
+    chunks: List[pd.DataFrame] = []
+    offset = 0
+    while True:
+        try:
+            df, offset = read_chunk(journal_path, offset, chunk_rows)
+        except IncompleteChunk as tail:
+            chunks.append(tail.df)
+            break
+        chunks.append(df)
+    chunks = [c for c in chunks if len(c)]
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
@@ -0,0 +1,195 @@
+"""
+Append-only JSONL journal of completed trials.
+
+`run_ollama_trials` appends one line per trial as soon as it finishes, so a crash or
+Ctrl-C loses at most the requests that were in flight. Re-running with the same
+journal skips every `trial-id` already recorded. `save_results` merges the journal
+back into a single file in the original trial order, reading it in chunks so memory
+stays flat regardless of run size.
+
+Each line looks like {"pos": <input row position>, "result": {<result columns>}}.
+A later line for the same position replaces an earlier one (e.g. a trial that was
+skipped as converged and then run after a resume).
+"""
+
+import heapq
+import json
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import pandas as pd
+
+
+class TrialJournal:
+    """
+    Thread-safe, append-only trial journal.
+
+    Args:
+        path (Path): JSONL file; created on first append, appended to on resume.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._file = None
+        self._completed: Optional[Set[str]] = None
+
+    # --- Writing ---
+
+    def _open(self):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # A crash can leave a half-written last line; start on a fresh line
+            needs_newline = False
+            if self.path.exists() and self.path.stat().st_size > 0:
+                with open(self.path, "rb") as f:
+                    f.seek(-1, 2)
+                    needs_newline = f.read(1) != b"\n"
+            self._file = open(self.path, "a", encoding="utf-8")
+            if needs_newline:
+                self._file.write("\n")
+        return self._file
+
+    def append(self, pos: int, result: Dict[str, Any]) -> None:
+        """Records one finished trial and flushes it to disk."""
+        line = json.dumps({"pos": int(pos), "result": result}, default=str)
+        with self._lock:
+            f = self._open()
+            f.write(line + "\n")
+            f.flush()
+            if self._completed is not None:
+                self._completed.add(str(result.get("trial-id")))
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self) -> "TrialJournal":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    # --- Reading ---
+
+    def iter_entries(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Yields (pos, result) in append order, skipping truncated lines."""
+        if not self.path.exists():
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                yield entry["pos"], entry["result"]
+
+    def read_chunk(self, offset: int = 0, max_rows: int = 1_000) -> Tuple[pd.DataFrame, int]:
+        """
+        Reads up to `max_rows` complete results starting at byte `offset`, in append
+        order, without touching the rest of the file. A line still being written is
+        left for the next read. Lets a live reader follow a running journal.
+
+        Returns:
+            Tuple[pd.DataFrame, int]: The results and the offset to continue from.
+        """
+        rows: List[Dict[str, Any]] = []
+        if not self.path.exists():
+            return pd.DataFrame(), offset
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            while len(rows) < max_rows:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    rows.append(json.loads(line)["result"])
+                except json.JSONDecodeError:
+                    continue
+        return pd.DataFrame(rows), offset
+
+    def completed_ids(self) -> Set[str]:
+        """The trial-ids already journaled, used to resume a run. Read from disk once."""
+        with self._lock:
+            if self._completed is None:
+                self._completed = {str(result.get("trial-id")) for _, result in self.iter_entries()}
+            return set(self._completed)
+
+    def iter_ordered(self, chunksize: int = 100_000) -> Iterator[Dict[str, Any]]:
+        """
+        Yields results sorted by input position with bounded memory: the journal is
+        sorted in chunks spilled to temporary files, then merged. Of several entries
+        for one position, only the last appended is yielded.
+        """
+        with tempfile.TemporaryDirectory(prefix="journal-merge-") as tmp:
+            runs: List[Path] = []
+            chunk: List[Tuple[int, Dict[str, Any]]] = []
+
+            def _spill() -> None:
+                chunk.sort(key=lambda e: e[0])
+                run_path = Path(tmp) / f"run-{len(runs)}.jsonl"
+                with open(run_path, "w", encoding="utf-8") as out:
+                    for pos, result in chunk:
+                        out.write(json.dumps({"pos": pos, "result": result}, default=str) + "\n")
+                runs.append(run_path)
+                chunk.clear()
+
+            for entry in self.iter_entries():
+                chunk.append(entry)
+                if len(chunk) >= chunksize:
+                    _spill()
+            if chunk:
+                _spill()
+
+            def _read_run(run_path: Path) -> Iterator[Tuple[int, Dict[str, Any]]]:
+                with open(run_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        entry = json.loads(line)
+                        yield entry["pos"], entry["result"]
+
+            # Stable throughout (sort, then merge of runs in append order), so equal
+            # positions come out in append order and the last of them is kept
+            last: Optional[Tuple[int, Dict[str, Any]]] = None
+            for entry in heapq.merge(*(_read_run(p) for p in runs), key=lambda e: e[0]):
+                if last is not None and last[0] != entry[0]:
+                    yield last[1]
+                last = entry
+            if last is not None:
+                yield last[1]
+
+    def columns(self) -> List[str]:
+        """Union of result columns across the journal, in first-seen order."""
+        seen: Dict[str, None] = {}
+        for _, result in self.iter_entries():
+            for k in result:
+                seen.setdefault(k, None)
+        return list(seen)
+
+    def iter_chunks(self, chunksize: int = 100_000) -> Iterator[pd.DataFrame]:
+        """Yields the journal as ordered DataFrame chunks with a consistent column set."""
+        cols = self.columns()
+        batch: List[Dict[str, Any]] = []
+        for result in self.iter_ordered(chunksize):
+            batch.append(result)
+            if len(batch) >= chunksize:
+                yield pd.DataFrame(batch).reindex(columns=cols)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch).reindex(columns=cols)
+
+    def write_csv(self, output_path: Path, chunksize: int = 100_000) -> int:
+        """Merges the journal into one CSV in trial order. Returns the rows written."""
+        rows = 0
+        header = True
+        for chunk in self.iter_chunks(chunksize):
+            chunk.to_csv(output_path, mode="w" if header else "a", header=header, index=False)
+            header = False
+            rows += len(chunk)
+        if header:
+            pd.DataFrame(columns=self.columns()).to_csv(output_path, index=False)
+        return rows
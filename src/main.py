@@ -3,17 +3,37 @@ Main entry point for running the LLM experiment pipeline.
 
 This script orchestrates the entire process:
 1. Define the file paths for input and output.
-2. Ensures a sample input file exists.
+2. Ensures a sample input file exists (unless another input file is given).
 3. Loads the data.
 4. Builds the prompts.
 5. Runs the Ollama trials.
 6. Save the results.
+7. Extracts each trial's decision and offer into a compact analysis table.
+8. For paired games, saves each game's offer and decision side by side.
+9. Compares the cost planned from past results with what the run took.
 """
 
 import subprocess
+import time
 from pathlib import Path
+from typing import Dict, Optional
+
+import pandas as pd
+
+import adaptive
+import analysis
 import engine
+import games
 import input_table_gen
+import planner
+import scheduler
+from adaptive_concurrency import AdaptiveConcurrency
+from dead_letter import DeadLetterFile
+from endpoint_pool import EndpointPool
+from journal import TrialJournal
+from metrics import TrialMetrics
+from response_cache import ResponseCache
+from retries import RetryBudget, RetryPolicy
 
 
 # --- 1. Define Constants and File Paths ---
@@ -26,39 +46,361 @@ DATA_DIR = PROJECT_ROOT / "data"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 INPUT_FILE_PATH = DATA_DIR / "Experiment-SAMPLE-IN.csv"
 OUTPUT_FILE_PATH = DATA_DIR / "Experiment-SAMPLE-OUT.csv"
+# Compressed Parquet copy of the results, partitioned by experiment-id and model.
+# Set to None to only write the CSV.
+PARQUET_OUTPUT_PATH = DATA_DIR / "Experiment-SAMPLE-OUT.parquet"
+# One row per trial with the parsed decision, offered amount and offer fraction.
+# Set to None to skip the analysis step.
+DECISIONS_OUTPUT_PATH = DATA_DIR / "Experiment-SAMPLE-DECISIONS.csv"
+# Every finished trial is appended here; re-running resumes from it. Delete the
+# file to start the experiment from scratch.
+JOURNAL_FILE_PATH = DATA_DIR / "Experiment-SAMPLE-OUT.journal.jsonl"
+# Input trials are read, prompted and run this many rows at a time.
+INPUT_CHUNK_ROWS = 100_000
+
+# Requests kept in flight against Ollama. Match the server's OLLAMA_NUM_PARALLEL;
+# 1 runs the trials one at a time.
+OLLAMA_CONCURRENCY = 1
+OLLAMA_MODEL_CONCURRENCY = {}  # e.g. {"phi3:latest": 2}
+
+# A request with no answer after TRIAL_TIMEOUT_S seconds is abandoned as hung.
+# Connection errors, 5xx responses and timeouts are retried up to
+# RETRY_MAX_ATTEMPTS times in all, with exponential backoff and jitter; over the
+# whole run at most RETRY_BUDGET_RATIO retries per trial are spent. Trials that
+# still fail are also written to the dead-letter file, which can be run on its
+# own as an input file (with a different output file) once the server is back.
+TRIAL_TIMEOUT_S = 300.0
+RETRY_MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY_S = 0.5
+RETRY_MAX_DELAY_S = 30.0
+RETRY_BUDGET_RATIO = 0.2
+DEAD_LETTER_PATH = DATA_DIR / "Experiment-SAMPLE-OUT.dead-letter.csv"
+
+# Adapt the requests in flight per server and model to how fast each server
+# answers, between these bounds, instead of using OLLAMA_CONCURRENCY. How the
+# limits moved is saved next to the results (X-OUT.concurrency.csv).
+ADAPTIVE_CONCURRENCY = False
+ADAPTIVE_CONCURRENCY_MAX = 16
+CONCURRENCY_TIMELINE_PATH = DATA_DIR / "Experiment-SAMPLE-OUT.concurrency.csv"
+
+# Several Ollama servers to spread the trials over, e.g.
+# ["http://gpu-1:11434", "http://gpu-2:11434"]. Empty uses the single default host.
+# Raise OLLAMA_CONCURRENCY to roughly the sum of the servers' parallel slots.
+OLLAMA_HOSTS = []
+
+# Group trials by model so Ollama is not swapping models between rows, and
+# preload the next model while the current group finishes. Each group's preload
+# and load time is saved next to the results (X-OUT.schedule.csv).
+SCHEDULE_BY_MODEL = True
+OLLAMA_KEEP_ALIVE = "5m"
+SCHEDULE_REPORT_PATH = DATA_DIR / "Experiment-SAMPLE-OUT.schedule.csv"
+# Within each model, run trials with the same system prompt and prompt start back
+# to back so Ollama reuses the prefix it already evaluated (needs SCHEDULE_BY_MODEL).
+ORDER_BY_PREFIX = True
+
+# Reuse responses to identical seeded requests across runs. Set to False to
+# force every trial to hit Ollama for this run.
+USE_RESPONSE_CACHE = True
+RESPONSE_CACHE_PATH = DATA_DIR / "response-cache.sqlite"
+RESPONSE_CACHE_MAX_AGE_S = 30 * 24 * 3600
+RESPONSE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Stream responses and stop generating this many tokens after the decision
+# (accept/reject, or the offer amount) appears. None waits for full responses.
+EARLY_STOP_TAIL_TOKENS = None
+
+# Adaptive sampling: stop running a condition's replicates once its acceptance
+# rate (receivers) or mean offer fraction (proposers) is known to within this
+# confidence-interval half-width. None runs every trial in the input.
+ADAPTIVE_PRECISION = None  # e.g. 0.05
+ADAPTIVE_CONFIDENCE = 0.95
+ADAPTIVE_MIN_REPLICATES = 10
+ADAPTIVE_REPORT_PATH = DATA_DIR / "Experiment-SAMPLE-ADAPTIVE.csv"
+
+# Inputs with a `game-id` column are played as paired games: each receiver
+# responds to the offer its game's proposer made, and is sent as soon as that
+# proposer answers (see input_table_gen.generate_game_design). The outcome of
+# every game is saved to GAMES_OUTPUT_PATH.
+PAIR_GAMES = True
+GAMES_OUTPUT_PATH = DATA_DIR / "Experiment-SAMPLE-GAMES.csv"
+
+# Before running, estimate every chunk's tokens and time from the results of past
+# runs under PLAN_HISTORY_DIR (planner.py), and end with a planned-vs-actual report.
+# That report's run becomes history too, so the estimates improve run by run.
+PLAN_RUN = True
+PLAN_HISTORY_DIR = DATA_DIR
+PLAN_REPORT_PATH = DATA_DIR / "Experiment-SAMPLE-PLAN.csv"
+
+# Live latency/throughput metrics in Prometheus text format, rewritten every few
+# seconds during a run (the dashboard's live panel reads this file). Set
+# METRICS_HTTP_PORT to also serve them at http://localhost:<port>/metrics.
+METRICS_FILE_PATH = DATA_DIR / "metrics.prom"
+METRICS_EXPORT_INTERVAL_S = 5.0
+METRICS_HTTP_PORT = None
 
 
 # --- 2. Main Pipeline Function ---
-def run_pipeline():
-    """Executes the full experiment pipeline."""
+def output_paths(output_path: Path) -> Dict[str, Optional[Path]]:
+    """
+    Every file a run writes, named after its results CSV the way the defaults above
+    are (e.g. X-OUT.csv -> X-OUT.parquet, X-OUT.journal.jsonl, X-OUT-DECISIONS.csv).
+    Outputs switched off above (set to None) stay off.
+    """
+    output_path = Path(output_path)
+    stem = output_path.with_suffix("")
+    return {
+        "output": output_path,
+        "parquet": stem.with_suffix(".parquet") if PARQUET_OUTPUT_PATH is not None else None,
+        "journal": stem.with_suffix(".journal.jsonl"),
+        "decisions": Path(f"{stem}-DECISIONS.csv") if DECISIONS_OUTPUT_PATH is not None else None,
+        "adaptive_report": Path(f"{stem}-ADAPTIVE.csv"),
+        "metrics": Path(f"{stem}.metrics.prom"),
+        "concurrency": stem.with_suffix(".concurrency.csv"),
+        "schedule": stem.with_suffix(".schedule.csv"),
+        "dead_letter": stem.with_suffix(".dead-letter.csv"),
+        "games": Path(f"{stem}-GAMES.csv"),
+        "plan": Path(f"{stem}-PLAN.csv"),
+    }
+
+
+def retry_policy() -> RetryPolicy:
+    """The timeout and retry settings above, with a fresh retry budget for one run."""
+    return RetryPolicy(max_attempts=RETRY_MAX_ATTEMPTS, base_delay_s=RETRY_BASE_DELAY_S,
+                       max_delay_s=RETRY_MAX_DELAY_S, timeout_s=TRIAL_TIMEOUT_S,
+                       budget=RetryBudget(ratio=RETRY_BUDGET_RATIO))
+
+
+def run_pipeline(input_path: Optional[Path] = None,
+                 output_path: Optional[Path] = None,
+                 confirm: bool = False,
+                 metrics_port: Optional[int] = METRICS_HTTP_PORT):
+    """
+    Executes the full experiment pipeline.
+
+    Args:
+        input_path (Path, optional): Trials to run (.csv, .parquet or .xlsx). Defaults
+                                     to INPUT_FILE_PATH, generating the sample if missing.
+        output_path (Path, optional): Results CSV; the other outputs are named after it
+                                      (see output_paths). Defaults to the paths above.
+        confirm (bool): Offer the prompt preview and ask on the console before sending
+                        trials to Ollama. Leave False when nobody is at the console
+                        (e.g. dashboard jobs).
+        metrics_port (int, optional): Serve live metrics over HTTP on this port.
+    """
     print("--- Starting LLM Experiment Pipeline ---")
+    if output_path is None:
+        paths = {"output": OUTPUT_FILE_PATH, "parquet": PARQUET_OUTPUT_PATH, "journal": JOURNAL_FILE_PATH,
+                 "decisions": DECISIONS_OUTPUT_PATH, "adaptive_report": ADAPTIVE_REPORT_PATH,
+                 "metrics": METRICS_FILE_PATH, "concurrency": CONCURRENCY_TIMELINE_PATH,
+                 "schedule": SCHEDULE_REPORT_PATH,
+                 "dead_letter": DEAD_LETTER_PATH, "games": GAMES_OUTPUT_PATH, "plan": PLAN_REPORT_PATH}
+    else:
+        paths = output_paths(output_path)
 
     # Step 1: Generate a sample input file if one doesn't exist
-    print(f"Input file not found. Generating sample at '{INPUT_FILE_PATH}'")
-    input_table_gen.generate_sample_input_file(INPUT_FILE_PATH)
+    if input_path is None:
+        input_path = INPUT_FILE_PATH
+        if not input_path.exists():
+            print(f"Input file not found. Generating sample at '{input_path}'")
+            input_table_gen.generate_sample_input_file(input_path)
 
+    journal = TrialJournal(paths["journal"])
+    already_done = len(journal.completed_ids())
+    if already_done:
+        print(f"Resuming: skipping {already_done} trials already in {paths['journal']}")
+    cache = None
+    if USE_RESPONSE_CACHE:
+        cache = ResponseCache(RESPONSE_CACHE_PATH,
+                              max_age_s=RESPONSE_CACHE_MAX_AGE_S,
+                              max_bytes=RESPONSE_CACHE_MAX_BYTES)
+    metrics = TrialMetrics()
+    metrics.start_file_export(paths["metrics"], METRICS_EXPORT_INTERVAL_S)
+    metrics_server = metrics.serve(metrics_port) if metrics_port else None
+    limiter = None
+    if ADAPTIVE_CONCURRENCY:
+        limiter = AdaptiveConcurrency(initial=max(OLLAMA_CONCURRENCY, 1), max_limit=ADAPTIVE_CONCURRENCY_MAX)
+    max_connections = ADAPTIVE_CONCURRENCY_MAX if ADAPTIVE_CONCURRENCY else max(OLLAMA_CONCURRENCY, 1)
+    pool = None
+    if OLLAMA_HOSTS:
+        pool = EndpointPool(OLLAMA_HOSTS, max_connections=max_connections, timeout=TRIAL_TIMEOUT_S)
+    retry = retry_policy()
+    dead_letter = DeadLetterFile(paths["dead_letter"])
+    paired = PAIR_GAMES and games.GAME_ID_COLUMN in engine.read_input_columns(input_path)
+    # One state for every chunk, so a game split between two chunks stays paired
+    game_state = games.GameState() if paired else None
+    sampler = None
+    if ADAPTIVE_PRECISION is not None:
+        # One sampler for every chunk, so a condition's estimate spans the whole input
+        sampler = adaptive.SequentialSampler(ADAPTIVE_PRECISION, ADAPTIVE_CONFIDENCE, ADAPTIVE_MIN_REPLICATES)
+    # One log for every chunk; only the scheduled path below writes to it
+    schedule_log = scheduler.ScheduleLog() if SCHEDULE_BY_MODEL else None
+    cost_model = None
+    plans = []
+    if PLAN_RUN:
+        history = planner.find_result_files(PLAN_HISTORY_DIR)
+        cost_model = planner.CostModel.from_results(history)
+        print(f"Run planner: learned from {cost_model.history_trials} trials in {len(history)} past result files")
+    run_start = time.perf_counter()
 
-    # Step 2: Load the input data
-    print(f"\nLoading data from: {INPUT_FILE_PATH}")
-    input_df = engine.load_input_data(INPUT_FILE_PATH)
+    # Steps 2-4 run one input chunk at a time, so the trial table never has to
+    # fit in memory at once.
+    try:
+        for chunk_no, input_df in enumerate(engine.iter_input_chunks(input_path, INPUT_CHUNK_ROWS)):
+            first_chunk = chunk_no == 0
 
-    # Step 3: Build prompts for each trial
-    print("\nBuilding prompts...")
-    trials_with_prompts_df = engine.build_prompts_df(input_df)
-    wait = input("press any key to continue to run ollama trials against the API\n")
+            # Step 2: Load the input data
+            print(f"\nLoading data from: {input_path} (chunk {chunk_no + 1}, {len(input_df)} trials)")
 
-    # Step 4: Run the trials against the Ollama API
-    print("\nRunning Ollama trials...")
-    results_df = engine.run_ollama_trials(trials_with_prompts_df)
-    # print(engine.debug_run_single_trial(trials_with_prompts_df.iloc[0]))  # Debug output for first trial
+            # Step 3: Build prompts for each trial
+            print("\nBuilding prompts...")
+            trials_with_prompts_df = engine.build_prompts_df(input_df, preview=first_chunk and confirm)
+
+            # Step 3b: Estimate what the chunk will cost
+            if cost_model is not None:
+                plan = cost_model.estimate(trials_with_prompts_df)
+                if "trial-id" in trials_with_prompts_df.columns:
+                    # Planned vs. actual matches trials by trial-id; without one there is nothing to compare
+                    plans.append(trials_with_prompts_df.reindex(columns=["trial-id", "model"]).join(plan))
+                print(f"\nPlanned cost at concurrency {OLLAMA_CONCURRENCY}:")
+                print(planner.summarize_plan(trials_with_prompts_df, plan, OLLAMA_CONCURRENCY).to_string(index=False))
+                for url in OLLAMA_HOSTS:
+                    hours = cost_model.estimate(trials_with_prompts_df, url)["plan_seconds"].sum() / 3600
+                    print(f"  all on {url}: {hours:.2f} client hours")
+            if first_chunk and confirm:
+                input("press any key to continue to run ollama trials against the API\n")
+
+            # Step 4: Run the trials against the Ollama API
+            print("\nRunning Ollama trials...")
+            if paired:
+                games.run_paired_games(trials_with_prompts_df,
+                                       concurrency=OLLAMA_CONCURRENCY,
+                                       model_concurrency=OLLAMA_MODEL_CONCURRENCY,
+                                       cache=cache,
+                                       journal=journal,
+                                       pool=pool,
+                                       metrics=metrics,
+                                       early_stop_tail=EARLY_STOP_TAIL_TOKENS,
+                                       state=game_state,
+                                       limiter=limiter,
+                                       retry=retry,
+                                       dead_letter=dead_letter)
+            elif sampler is not None:
+                adaptive.run_adaptive_trials(trials_with_prompts_df,
+                                             concurrency=OLLAMA_CONCURRENCY,
+                                             model_concurrency=OLLAMA_MODEL_CONCURRENCY,
+                                             cache=cache,
+                                             journal=journal,
+                                             pool=pool,
+                                             metrics=metrics,
+                                             early_stop_tail=EARLY_STOP_TAIL_TOKENS,
+                                             sampler=sampler,
+                                             limiter=limiter,
+                                             retry=retry,
+                                             dead_letter=dead_letter)
+            elif SCHEDULE_BY_MODEL:
+                if ORDER_BY_PREFIX:
+                    baseline = scheduler.prefix_reuse(trials_with_prompts_df)
+                    ordered = scheduler.prefix_reuse(trials_with_prompts_df,
+                                                     scheduler.plan_prefix_order(trials_with_prompts_df))
+                    total = max(ordered["prompt_tokens"], 1)
+                    print(f"Prompt tokens shared with the previous trial: "
+                          f"{ordered['shared_tokens'] / total:.0%} in prefix order, "
+                          f"{baseline['shared_tokens'] / total:.0%} in input order")
+                scheduler.run_scheduled_trials(trials_with_prompts_df,
+                                               concurrency=OLLAMA_CONCURRENCY,
+                                               model_concurrency=OLLAMA_MODEL_CONCURRENCY,
+                                               keep_alive=OLLAMA_KEEP_ALIVE,
+                                               cache=cache,
+                                               journal=journal,
+                                               pool=pool,
+                                               metrics=metrics,
+                                               early_stop_tail=EARLY_STOP_TAIL_TOKENS,
+                                               limiter=limiter,
+                                               retry=retry,
+                                               dead_letter=dead_letter,
+                                               order_by_prefix=ORDER_BY_PREFIX,
+                                               schedule_log=schedule_log)
+            else:
+                engine.run_ollama_trials(trials_with_prompts_df,
+                                         concurrency=OLLAMA_CONCURRENCY,
+                                         model_concurrency=OLLAMA_MODEL_CONCURRENCY,
+                                         cache=cache,
+                                         journal=journal,
+                                         pool=pool,
+                                         metrics=metrics,
+                                         early_stop_tail=EARLY_STOP_TAIL_TOKENS,
+                                         limiter=limiter,
+                                         retry=retry,
+                                         dead_letter=dead_letter)
+            # print(engine.debug_run_single_trial(trials_with_prompts_df.iloc[0]))  # Debug output for first trial
+    finally:
+        run_wall_s = time.perf_counter() - run_start
+        journal.close()
+        dead_letter.close()
+        metrics.close()
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        snapshot = metrics.snapshot()
+        if snapshot.empty:
+            # e.g. every trial was already journaled, or the run failed before the first one
+            print("\nNo trials were sent in this run.")
+        else:
+            print(f"\nTrial metrics (also in {paths['metrics']}):")
+            print(snapshot[["model", "endpoint", "trials", "errors", "retries", "client_wall_p50_s",
+                            "client_wall_p95_s", "overhead_p50_s", "eval_tokens_per_s"]])
+        print(f"Retries: {retry.budget.stats()}")
+        if dead_letter.count:
+            print(f"{dead_letter.count} trials failed after retries; re-run them from {paths['dead_letter']}")
+        if cache is not None:
+            print(f"Response cache: {cache.stats()}")
+            cache.close()
+        if sampler is not None:
+            report = sampler.report()
+            report.to_csv(paths["adaptive_report"], index=False)
+            print(f"Adaptive sampling: {int(report['trials_skipped'].sum())} trials skipped, "
+                  f"{int(report['converged'].sum())}/{len(report)} conditions converged "
+                  f"(report: {paths['adaptive_report']})")
+        if schedule_log is not None and schedule_log.rows:
+            schedule = schedule_log.report()
+            schedule.to_csv(paths["schedule"], index=False)
+            print(f"Scheduled {len(schedule)} model groups; {schedule['sched_group_load_ns'].sum() / 1e9:.1f}s "
+                  f"spent loading models (report: {paths['schedule']})")
+        if limiter is not None:
+            limiter.write_timeline(paths["concurrency"])
+            print(f"Adaptive concurrency limits (timeline: {paths['concurrency']}):")
+            print(limiter.snapshot())
+        if pool is not None:
+            for endpoint in pool.stats():
+                print(f"Endpoint {endpoint['url']}: {endpoint}")
+            pool.close()
 
     # Step 5: Save the final results
-    print(f"\nSaving results to: {OUTPUT_FILE_PATH}")
-    engine.save_results(results_df, OUTPUT_FILE_PATH)
+    print(f"\nSaving results to: {paths['output']}")
+    engine.save_results(journal, paths["output"])
+    if paths["parquet"] is not None:
+        engine.save_results(journal, paths["parquet"])
+
+    # Step 6: Parse decisions from the saved responses
+    if paths["decisions"] is not None:
+        decided = analysis.extract_decisions_file(journal, paths["decisions"])
+        print(f"Decisions for {decided} trials saved to: {paths['decisions']}")
+
+    # Step 7: Pair each game's proposer and receivers
+    if paired:
+        played = games.write_games_file(journal, paths["games"])
+        print(f"Outcomes of {played} games saved to: {paths['games']}")
+
+    # Step 8: Compare the plan with the run
+    if plans:
+        report = planner.planned_vs_actual(pd.concat(plans), journal, OLLAMA_CONCURRENCY, run_wall_s)
+        report.to_csv(paths["plan"], index=False)
+        total = report.iloc[-1]
+        print(f"Planned vs. actual (report: {paths['plan']}): client time x{total['ratio_s']:.2f}, "
+              f"prompt tokens x{total['ratio_prompt_tokens']:.2f}, output tokens x{total['ratio_output_tokens']:.2f}")
 
     print("\n--- Pipeline Finished ---")
 
 
 # --- 3. Script Execution ---
 if __name__ == "__main__":
-    run_pipeline()
\ No newline at end of file
+    run_pipeline(confirm=True)
\ No newline at end of file
@@ -0,0 +1,372 @@
+"""
+Latency and throughput instrumentation for trial runs.
+
+`run_ollama_trials` stamps every result with the client-side timings
+`llm_client_wall_ns` (the whole generate call, as seen by us) and
+`llm_queue_wait_ns` (time the trial waited for a free concurrency slot). Pass a
+`TrialMetrics` to the run and each finished trial is folded into streaming
+histograms and counters per (model, endpoint):
+
+    client_wall    - our wall time for the request
+    server_total   - Ollama's total_duration
+    overhead       - client_wall - server_total: network, server-side queueing
+                     and client code
+    queue_wait     - waiting for a concurrency slot in our executor
+    load, prompt_eval, eval - Ollama's own phase timings
+
+plus prompt/eval token counts, giving tokens/sec. Histograms use fixed
+log-spaced buckets, so memory does not grow with the run and quantiles are
+accurate to a couple of percent.
+
+The metrics can be read in-process (`snapshot()`), rendered as Prometheus text
+(`to_prometheus()`), written to a file periodically for the dashboard or a
+node-exporter textfile collector (`start_file_export`), or served over HTTP
+(`serve`).
+"""
+
+import math
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+QUANTILES = (0.5, 0.95, 0.99)
+METRIC_PREFIX = "ultimatum_"
+
+# Latency histograms kept per (model, endpoint), all in seconds.
+LATENCY_METRICS = ("client_wall", "server_total", "overhead", "queue_wait", "load", "prompt_eval", "eval")
+
+
+class StreamingHistogram:
+    """
+    Fixed-memory histogram with log-spaced buckets between min_value and max_value.
+    Values outside the range land in under/overflow buckets and are reported as
+    the smallest/largest value seen.
+
+    Args:
+        min_value (float): Lower edge of the first regular bucket.
+        max_value (float): Upper edge of the last regular bucket.
+        growth (float): Ratio between consecutive bucket edges; the relative error
+                        of a quantile is about (growth - 1) / 2.
+    """
+
+    def __init__(self, min_value: float = 1e-4, max_value: float = 1e4, growth: float = 1.05):
+        self.min_value = min_value
+        self.growth = growth
+        self._log_growth = math.log(growth)
+        self._regular = int(math.ceil(math.log(max_value / min_value) / self._log_growth))
+        self.buckets = [0] * (self._regular + 2)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value: float) -> None:
+        if value < self.min_value:
+            idx = 0
+        else:
+            idx = min(int(math.log(value / self.min_value) / self._log_growth) + 1, self._regular + 1)
+        self.buckets[idx] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimated q-quantile (0 <= q <= 1); NaN if nothing was observed."""
+        if self.count == 0:
+            return math.nan
+        rank = q * (self.count - 1) + 1
+        seen = 0
+        for idx, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                break
+        if idx == 0:
+            return self.min
+        if idx == self._regular + 1:
+            return self.max
+        # Geometric midpoint of the bucket, clamped to what was actually seen
+        mid = self.min_value * self.growth ** (idx - 0.5)
+        return min(max(mid, self.min), self.max)
+
+
+class _SeriesStats:
+    """Histograms and counters for one (model, endpoint) label set."""
+
+    def __init__(self):
+        self.histograms = {name: StreamingHistogram() for name in LATENCY_METRICS}
+        self.trials = 0
+        self.errors = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.eval_tokens = 0
+        self.prompt_eval_s = 0.0
+        self.eval_s = 0.0
+
+
+def _ns_to_s(value: Any) -> Optional[float]:
+    """Converts an *_ns result value to seconds; None for missing/NaN."""
+    if value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value / 1e9
+
+
+def _int_or_zero(value: Any) -> int:
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0
+    return 0 if math.isnan(value) else int(value)
+
+
+class TrialMetrics:
+    """
+    Thread-safe registry of per-trial timings, fed by run_ollama_trials.
+
+    Args:
+        default_endpoint (str): Endpoint label for results without `llm_endpoint`,
+                                i.e. runs against a single host.
+    """
+
+    def __init__(self, default_endpoint: str = "default"):
+        self.default_endpoint = default_endpoint
+        self.started_at = time.time()
+        self._series: Dict[Tuple[str, str], _SeriesStats] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._exporter: Optional[threading.Thread] = None
+        self._export_path: Optional[Path] = None
+
+    # --- Recording ---
+
+    def record(self, result: Dict[str, Any]) -> None:
+        """Folds one finished trial (a run_ollama_trials result row) into the metrics."""
+        key = (str(result.get("model") or ""), str(result.get("llm_endpoint") or self.default_endpoint))
+        ok = result.get("llm_status") == "ok"
+        cache_hit = bool(result.get("llm_cache_hit"))
+        client_s = _ns_to_s(result.get("llm_client_wall_ns"))
+        server_s = _ns_to_s(result.get("llm_total_duration_ns"))
+        values = {
+            "queue_wait": _ns_to_s(result.get("llm_queue_wait_ns")),
+            "client_wall": client_s,
+            "server_total": server_s,
+            "overhead": client_s - server_s if client_s is not None and server_s is not None else None,
+            "load": _ns_to_s(result.get("llm_load_duration_ns")),
+            "prompt_eval": _ns_to_s(result.get("llm_prompt_eval_duration_ns")),
+            "eval": _ns_to_s(result.get("llm_eval_duration_ns")),
+        }
+
+        with self._lock:
+            stats = self._series.get(key)
+            if stats is None:
+                stats = self._series[key] = _SeriesStats()
+            stats.trials += 1
+            stats.retries += max(_int_or_zero(result.get("llm_attempts")) - 1, 0)
+            if not ok:
+                stats.errors += 1
+            if cache_hit:
+                stats.cache_hits += 1
+            if values["queue_wait"] is not None:
+                stats.histograms["queue_wait"].observe(values["queue_wait"])
+            # Cache hits and failures never reached a model; keep them out of the latencies
+            if not ok or cache_hit:
+                return
+            for name, value in values.items():
+                if name != "queue_wait" and value is not None:
+                    stats.histograms[name].observe(max(value, 0.0))
+            # Early-stopped streams have counts but no server durations; skip them for rates
+            if values["prompt_eval"] is not None:
+                stats.prompt_tokens += _int_or_zero(result.get("llm_prompt_eval_count"))
+                stats.prompt_eval_s += values["prompt_eval"]
+            if values["eval"] is not None:
+                stats.eval_tokens += _int_or_zero(result.get("llm_eval_count"))
+                stats.eval_s += values["eval"]
+
+    # --- In-process API ---
+
+    def snapshot(self, quantiles: Sequence[float] = QUANTILES) -> pd.DataFrame:
+        """
+        Current metrics, one row per (model, endpoint).
+
+        Returns:
+            pd.DataFrame: trials, errors, retries, cache_hits, trials_per_s (since creation),
+                          prompt/eval tokens per second (server-timed), and for each
+                          latency metric its mean and quantiles in seconds, e.g.
+                          `client_wall_p95_s`.
+        """
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        rows: List[Dict[str, Any]] = []
+        with self._lock:
+            for (model, endpoint), stats in sorted(self._series.items()):
+                row: Dict[str, Any] = {
+                    "model": model,
+                    "endpoint": endpoint,
+                    "trials": stats.trials,
+                    "errors": stats.errors,
+                    "retries": stats.retries,
+                    "cache_hits": stats.cache_hits,
+                    "trials_per_s": stats.trials / elapsed,
+                    "prompt_tokens_per_s": stats.prompt_tokens / stats.prompt_eval_s if stats.prompt_eval_s else math.nan,
+                    "eval_tokens_per_s": stats.eval_tokens / stats.eval_s if stats.eval_s else math.nan,
+                }
+                for name, hist in stats.histograms.items():
+                    row[f"{name}_mean_s"] = hist.sum / hist.count if hist.count else math.nan
+                    for q in quantiles:
+                        row[f"{name}_p{q * 100:g}_s"] = hist.quantile(q)
+                rows.append(row)
+        return pd.DataFrame(rows)
+
+    # --- Prometheus export ---
+
+    def to_prometheus(self) -> str:
+        """Renders the metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            series = sorted(self._series.items())
+
+            def _labels(model: str, endpoint: str, **extra: str) -> str:
+                pairs = {"model": model, "endpoint": endpoint, **extra}
+                return ",".join(f'{k}="{_escape_label(v)}"' for k, v in pairs.items())
+
+            counters = {
+                "trials_total": ("Finished trials.", lambda s: s.trials),
+                "trial_errors_total": ("Trials that ended with llm_status=error.", lambda s: s.errors),
+                "trial_retries_total": ("Generate calls retried after a transient failure or timeout.",
+                                        lambda s: s.retries),
+                "cache_hits_total": ("Trials answered from the response cache.", lambda s: s.cache_hits),
+                "prompt_tokens_total": ("Prompt tokens evaluated by the server.", lambda s: s.prompt_tokens),
+                "eval_tokens_total": ("Tokens generated by the server.", lambda s: s.eval_tokens),
+            }
+            for name, (help_text, get) in counters.items():
+                lines += [f"# HELP {METRIC_PREFIX}{name} {help_text}", f"# TYPE {METRIC_PREFIX}{name} counter"]
+                lines += [f"{METRIC_PREFIX}{name}{{{_labels(*key)}}} {get(stats)}" for key, stats in series]
+
+            name = f"{METRIC_PREFIX}eval_tokens_per_second"
+            lines += [f"# HELP {name} Generated tokens per second of server eval time.", f"# TYPE {name} gauge"]
+            lines += [f"{name}{{{_labels(*key)}}} {_fmt(s.eval_tokens / s.eval_s if s.eval_s else math.nan)}"
+                      for key, s in series]
+
+            for metric in LATENCY_METRICS:
+                name = f"{METRIC_PREFIX}{metric}_seconds"
+                lines += [f"# HELP {name} Per-trial {metric.replace('_', ' ')} time.", f"# TYPE {name} summary"]
+                for key, stats in series:
+                    hist = stats.histograms[metric]
+                    for q in QUANTILES:
+                        lines.append(f"{name}{{{_labels(*key, quantile=f'{q:g}')}}} {_fmt(hist.quantile(q))}")
+                    lines.append(f"{name}_sum{{{_labels(*key)}}} {_fmt(hist.sum)}")
+                    lines.append(f"{name}_count{{{_labels(*key)}}} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Path) -> None:
+        """Writes to_prometheus() to `path` atomically, so readers never see half a file."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(self.to_prometheus(), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def start_file_export(self, path: Path, interval_s: float = 5.0) -> None:
+        """Rewrites the Prometheus file every `interval_s` seconds until close()."""
+        def _loop() -> None:
+            while not self._stop.wait(interval_s):
+                self.write_prometheus(path)
+
+        self._export_path = Path(path)
+        self._exporter = threading.Thread(target=_loop, name="metrics-export", daemon=True)
+        self._exporter.start()
+
+    def serve(self, port: int = 9464, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """
+        Serves the metrics at http://host:port/metrics on a background thread.
+        Call .shutdown() on the returned server to stop it.
+        """
+        metrics = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+    def close(self) -> None:
+        """Stops the file exporter, writing the final metrics once more."""
+        self._stop.set()
+        if self._exporter is not None:
+            self._exporter.join()
+            self.write_prometheus(self._export_path)
+            self._exporter = None
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    return "NaN" if math.isnan(value) else repr(float(value))
+
+
+# --- Reading exported metrics (dashboard) ---
+
+_SAMPLE_RE = re.compile(r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(?P<labels>.*)\})?\s+(?P<value>\S+)$')
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_prometheus(text: str) -> pd.DataFrame:
+    """Parses Prometheus text into a long DataFrame: one row per sample, labels as columns."""
+    rows: List[Dict[str, Any]] = []
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = _SAMPLE_RE.match(line)
+        if not match:
+            continue
+        row: Dict[str, Any] = {"metric": match["name"], "value": float(match["value"])}
+        for key, value in _LABEL_RE.findall(match["labels"] or ""):
+            row[key] = value.replace('\\"', '"').replace("\\n", "\n").replace("\\\\", "\\")
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def read_metrics_file(path: Path) -> pd.DataFrame:
+    """
+    Reads a file written by write_prometheus into one row per (model, endpoint)
+    with a column per metric, e.g. `client_wall_seconds_p0.95`. Empty if the file
+    does not exist yet.
+    """
+    path = Path(path)
+    if not path.exists():
+        return pd.DataFrame()
+    samples = parse_prometheus(path.read_text(encoding="utf-8"))
+    if samples.empty:
+        return samples
+    samples["metric"] = samples["metric"].str.removeprefix(METRIC_PREFIX)
+    if "quantile" in samples.columns:
+        has_q = samples["quantile"].notna()
+        samples.loc[has_q, "metric"] = samples.loc[has_q, "metric"] + "_p" + samples.loc[has_q, "quantile"]
+    return samples.pivot_table(index=["model", "endpoint"], columns="metric", values="value",
+                               aggfunc="last", dropna=False).reset_index()
@@ -0,0 +1,416 @@
+"""
+Run planning: what a sheet will cost before it is sent, and how to split it.
+
+`CostModel` learns from past result files (any *-OUT.csv / *-OUT.parquet) how the
+servers behaved, per model, `num_ctx` and endpoint where there is enough history:
+
+    tokens per prompt word   llm_prompt_eval_count / words of system + final prompt
+    prompt and output speed  llm_*_count / llm_*_duration_ns
+    overhead per trial       llm_client_wall_ns minus both durations (load, queueing,
+                             network), median
+    output tokens            median llm_eval_count of answers that ended on their own,
+                             per model and role
+
+`estimate` turns that into a predicted prompt size, answer size (capped by the
+trial's `num_predict`) and client seconds per trial, falling back to coarser
+history and finally to the defaults below. `assign_shards` splits a sheet into
+shards of equal predicted cost for parallel workers, keeping each model's trials
+together, and `planned_vs_actual` compares a plan with the results of its run.
+Those results are history for the next plan, so estimates improve run by run:
+
+    python -m planner --input ../data/Experiment-SAMPLE-IN.csv --history ../data --shards 4
+"""
+
+import argparse
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+import analysis
+import engine
+import scheduler
+from journal import TrialJournal
+
+# Used until there is history to learn from; roughly a 7B model on a modest GPU.
+DEFAULT_TOKENS_PER_WORD = 1.3
+DEFAULT_PROMPT_TOKENS_PER_S = 500.0
+DEFAULT_EVAL_TOKENS_PER_S = 30.0
+DEFAULT_OUTPUT_TOKENS = 128.0
+DEFAULT_OVERHEAD_S = 0.05
+
+# Fewest successful trials a group of history needs before its numbers are used.
+MIN_HISTORY_TRIALS = 20
+
+# History is read from at most this many rows per result file.
+HISTORY_ROWS_PER_FILE = 200_000
+
+# From the most specific history to the least; a trial uses the first level with
+# enough trials. Endpoint is the llm_endpoint results record with an EndpointPool.
+RATE_LEVELS = [("model", "num_ctx", "llm_endpoint"), ("model", "num_ctx"), ("model",), ()]
+OUTPUT_LEVELS = [("model", "role"), ("model",), ()]
+
+HISTORY_COLUMNS = ["model", "role", "num_ctx", "llm_endpoint", "llm_status", "llm_cache_hit", "llm_done_reason",
+                   "system-prompt", "final-prompt", "llm_prompt_eval_count", "llm_prompt_eval_duration_ns",
+                   "llm_eval_count", "llm_eval_duration_ns", "llm_client_wall_ns"]
+
+PLAN_COLUMNS = ["plan_prompt_tokens", "plan_output_tokens", "plan_seconds", "plan_basis"]
+
+
+def _sent(results: pd.DataFrame) -> pd.Series:
+    """Rows that were answered by the server: ok and not replayed from the response cache."""
+    ok = results["llm_status"] == "ok" if "llm_status" in results.columns else pd.Series(True, index=results.index)
+    if "llm_cache_hit" not in results.columns:
+        return ok
+    # bool in memory and Parquet, "True"/"False" once read back from CSV
+    hits = results["llm_cache_hit"].astype(str).str.lower().isin(["true", "1", "1.0"])
+    return ok & ~hits
+
+
+def find_result_files(root: Path) -> List[Path]:
+    """Result files under `root` (a results Parquet is preferred over its CSV twin)."""
+    root = Path(root)
+    parquet = sorted(root.rglob("*-OUT.parquet"))
+    csv = [p for p in sorted(root.rglob("*-OUT.csv")) if p.with_suffix(".parquet") not in parquet]
+    return parquet + csv
+
+
+def _word_counts(trials_df: pd.DataFrame) -> np.ndarray:
+    """Whitespace-separated words of each trial's system prompt and prompt, counted once per distinct text."""
+    counts = np.zeros(len(trials_df), dtype=np.int64)
+    for col in scheduler.PREFIX_COLUMNS:
+        if col in trials_df.columns:
+            codes, uniques = pd.factorize(trials_df[col])
+            per_text = np.array([len(str(text).split()) for text in uniques] + [0], dtype=np.int64)
+            counts += per_text[codes]  # code -1 (missing) picks the trailing 0
+    return counts
+
+
+def _key_frame(df: pd.DataFrame, columns: Iterable[str]) -> pd.DataFrame:
+    """
+    The grouping columns as text ("" when missing), so history read back from CSV
+    (num_ctx 2048.0) matches trials built in memory (2048).
+    """
+    keys = pd.DataFrame(index=df.index)
+    for col in columns:
+        if col not in df.columns:
+            keys[col] = ""
+        elif col == "num_ctx":
+            numbers = pd.to_numeric(df[col], errors="coerce")
+            keys[col] = numbers.map(lambda v: "" if pd.isna(v) else str(int(v)))
+        else:
+            keys[col] = df[col].astype(object).map(lambda v: "" if pd.isna(v) else str(v))
+    return keys
+
+
+class CostModel:
+    """
+    Per-trial cost estimates learned from past results.
+
+    Args:
+        history (pd.DataFrame, optional): Past results (the HISTORY_COLUMNS that are
+                                          present). None plans from the defaults.
+    """
+
+    def __init__(self, history: Optional[pd.DataFrame] = None):
+        self.rates: Dict[Tuple, Dict[Tuple, Dict[str, float]]] = {level: {} for level in RATE_LEVELS}
+        self.outputs: Dict[Tuple, Dict[Tuple, float]] = {level: {} for level in OUTPUT_LEVELS}
+        self.history_trials = 0
+        if history is not None and not history.empty:
+            self._fit(history)
+
+    @classmethod
+    def from_results(cls, paths: Iterable[Union[Path, TrialJournal]]) -> "CostModel":
+        """Learns from result files (or journals); unreadable ones are skipped with a message."""
+        frames = []
+        for path in paths:
+            try:
+                read, chunks = 0, []
+                for chunk in analysis.iter_result_chunks(path, HISTORY_COLUMNS):
+                    chunks.append(chunk.iloc[:HISTORY_ROWS_PER_FILE - read])
+                    read += len(chunks[-1])
+                    if read >= HISTORY_ROWS_PER_FILE:
+                        break
+                frames.extend(chunks)
+            except Exception as e:
+                print(f"Skipping history from {path}: {e}")
+        frames = [frame for frame in frames if not frame.empty]
+        return cls(pd.concat(frames, ignore_index=True) if frames else None)
+
+    def _fit(self, history: pd.DataFrame) -> None:
+        ok = history[_sent(history)]
+        numbers = {col: pd.to_numeric(ok[col], errors="coerce") if col in ok.columns
+                   else pd.Series(np.nan, index=ok.index)
+                   for col in ["llm_prompt_eval_count", "llm_prompt_eval_duration_ns", "llm_eval_count",
+                               "llm_eval_duration_ns", "llm_client_wall_ns"]}
+        timed = numbers["llm_prompt_eval_duration_ns"].notna() & numbers["llm_eval_duration_ns"].notna()
+        ok, numbers = ok[timed], {col: values[timed] for col, values in numbers.items()}
+        self.history_trials = len(ok)
+        if ok.empty:
+            return
+
+        words = pd.Series(_word_counts(ok), index=ok.index)
+        stats = pd.DataFrame({
+            "prompt_tokens": numbers["llm_prompt_eval_count"],
+            "prompt_s": numbers["llm_prompt_eval_duration_ns"] / 1e9,
+            "output_tokens": numbers["llm_eval_count"],
+            "output_s": numbers["llm_eval_duration_ns"] / 1e9,
+            # Tokens per word only from trials whose prompt words are known
+            "word_tokens": numbers["llm_prompt_eval_count"].where(words > 0),
+            "words": words.where(words > 0),
+            "overhead_s": ((numbers["llm_client_wall_ns"] - numbers["llm_prompt_eval_duration_ns"]
+                            - numbers["llm_eval_duration_ns"]) / 1e9).clip(lower=0),
+        })
+        keys = _key_frame(ok, ["model", "num_ctx", "llm_endpoint", "role"])
+        for level in RATE_LEVELS:
+            grouped = stats.groupby([keys[col] for col in level], dropna=False) if level \
+                else stats.groupby(np.zeros(len(stats)))
+            sums = grouped.sum(min_count=1)
+            sizes = grouped.size()
+            overhead = grouped["overhead_s"].median()
+            for key in sums.index[(sizes >= MIN_HISTORY_TRIALS).to_numpy()]:
+                row = sums.loc[key]
+                self.rates[level][key if isinstance(key, tuple) else (key,) if level else ()] = {
+                    "tokens_per_word": row["word_tokens"] / row["words"] if row["words"] > 0 else np.nan,
+                    "prompt_tokens_per_s": row["prompt_tokens"] / row["prompt_s"] if row["prompt_s"] > 0 else np.nan,
+                    "eval_tokens_per_s": row["output_tokens"] / row["output_s"] if row["output_s"] > 0 else np.nan,
+                    "overhead_s": overhead.loc[key],
+                }
+
+        # Answers cut off by num_predict understate how long the model wants to talk
+        reasons = ok["llm_done_reason"] if "llm_done_reason" in ok.columns else pd.Series(None, index=ok.index)
+        natural = (reasons == "stop").to_numpy()
+        if natural.sum() >= MIN_HISTORY_TRIALS:
+            output_tokens, output_keys = stats["output_tokens"][natural], keys[natural]
+        else:
+            output_tokens, output_keys = stats["output_tokens"], keys
+        for level in OUTPUT_LEVELS:
+            grouped = output_tokens.groupby([output_keys[col] for col in level], dropna=False) if level \
+                else output_tokens.groupby(np.zeros(len(output_tokens)))
+            medians, sizes = grouped.median(), grouped.size()
+            for key in medians.index[(sizes >= MIN_HISTORY_TRIALS).to_numpy()]:
+                self.outputs[level][key if isinstance(key, tuple) else (key,) if level else ()] = medians.loc[key]
+
+    def _lookup(self, combo: Dict[str, Any]) -> Dict[str, Any]:
+        """Cost parameters for one (model, num_ctx, endpoint, role) combination."""
+        params: Dict[str, Any] = {}
+        basis = "default"
+        for level in RATE_LEVELS:
+            found = self.rates[level].get(tuple(combo[col] for col in level))
+            if found is None:
+                continue
+            if basis == "default":
+                basis = "+".join(col for col in level if combo[col]) or "all history"
+            for name, value in found.items():
+                if name not in params and not pd.isna(value):
+                    params[name] = value
+        for level in OUTPUT_LEVELS:
+            found = self.outputs[level].get(tuple(combo[col] for col in level))
+            if found is not None and not pd.isna(found):
+                params.setdefault("output_tokens", found)
+                break
+        return {
+            "tokens_per_word": params.get("tokens_per_word", DEFAULT_TOKENS_PER_WORD),
+            "prompt_tokens_per_s": params.get("prompt_tokens_per_s", DEFAULT_PROMPT_TOKENS_PER_S),
+            "eval_tokens_per_s": params.get("eval_tokens_per_s", DEFAULT_EVAL_TOKENS_PER_S),
+            "overhead_s": params.get("overhead_s", DEFAULT_OVERHEAD_S),
+            "output_tokens": params.get("output_tokens", DEFAULT_OUTPUT_TOKENS),
+            "plan_basis": basis,
+        }
+
+    def estimate(self, trials_df: pd.DataFrame, endpoint: Optional[str] = None) -> pd.DataFrame:
+        """
+        Predicts each trial's cost.
+
+        Args:
+            trials_df (pd.DataFrame): The trials, e.g. the output of build_prompts_df.
+            endpoint (str, optional): Server the trials would run on, to use its
+                                      history; None uses every endpoint's.
+
+        Returns:
+            pd.DataFrame: Aligned to trials_df.index: `plan_prompt_tokens`,
+                          `plan_output_tokens`, `plan_seconds` (client seconds per
+                          trial) and `plan_basis` (the history level used).
+        """
+        key_cols = ["model", "num_ctx", "llm_endpoint", "role"]
+        keys = _key_frame(trials_df, key_cols)
+        keys["llm_endpoint"] = endpoint or ""
+        # Look up each distinct combination once; ngroup numbers them in drop_duplicates order
+        combos = keys.drop_duplicates()
+        params = pd.DataFrame([self._lookup(combo) for combo in combos.to_dict(orient="records")])
+        params = params.iloc[keys.groupby(key_cols, sort=False).ngroup().to_numpy()].set_axis(trials_df.index)
+
+        prompt_tokens = _word_counts(trials_df) * params["tokens_per_word"]
+        num_ctx = pd.to_numeric(trials_df["num_ctx"], errors="coerce") if "num_ctx" in trials_df.columns \
+            else pd.Series(np.nan, index=trials_df.index)
+        prompt_tokens = prompt_tokens.where(num_ctx.isna() | (prompt_tokens <= num_ctx), num_ctx)
+        output_tokens = params["output_tokens"]
+        if "num_predict" in trials_df.columns:
+            num_predict = pd.to_numeric(trials_df["num_predict"], errors="coerce")
+            output_tokens = output_tokens.where(num_predict.isna() | (num_predict < 0)
+                                                | (output_tokens <= num_predict), num_predict)
+        seconds = (prompt_tokens / params["prompt_tokens_per_s"] + output_tokens / params["eval_tokens_per_s"]
+                   + params["overhead_s"])
+        return pd.DataFrame({"plan_prompt_tokens": prompt_tokens.round(), "plan_output_tokens": output_tokens.round(),
+                             "plan_seconds": seconds, "plan_basis": params["plan_basis"]}, index=trials_df.index)
+
+
+def summarize_plan(trials_df: pd.DataFrame, plan: pd.DataFrame, concurrency: int = 1) -> pd.DataFrame:
+    """
+    Totals a plan per model.
+
+    Args:
+        trials_df (pd.DataFrame): The planned trials.
+        plan (pd.DataFrame): CostModel.estimate's output for them.
+        concurrency (int): Requests in flight, to turn client seconds into wall time.
+                           Client times learned at the same concurrency already
+                           include the server's queueing, so this is a fair divisor.
+
+    Returns:
+        pd.DataFrame: One row per model: trials, planned prompt and output tokens,
+                      client seconds, wall hours at `concurrency`, and the history basis.
+    """
+    model = trials_df["model"].astype(object) if "model" in trials_df.columns else pd.Series("", index=plan.index)
+    summary = plan.groupby(model.rename("model"), dropna=False).agg(
+        trials=("plan_seconds", "size"),
+        prompt_tokens=("plan_prompt_tokens", "sum"),
+        output_tokens=("plan_output_tokens", "sum"),
+        client_s=("plan_seconds", "sum"),
+        basis=("plan_basis", lambda b: b.mode().iloc[0]),
+    ).reset_index()
+    summary["wall_h"] = summary["client_s"] / max(concurrency, 1) / 3600
+    return summary
+
+
+def assign_shards(trials_df: pd.DataFrame, plan_seconds: pd.Series, shards: int) -> np.ndarray:
+    """
+    Splits trials into `shards` parts of about equal predicted cost. Trials are taken
+    model group by model group (scheduler.plan_model_groups) and cut where the running
+    cost crosses each shard's share, so a shard holds few models and at most one
+    trial more cost than its share.
+
+    Args:
+        trials_df (pd.DataFrame): The trials.
+        plan_seconds (pd.Series): Predicted cost per trial, aligned to trials_df.
+        shards (int): Number of shards.
+
+    Returns:
+        np.ndarray: Shard number (0..shards-1) per trial, in trials_df order.
+    """
+    groups = scheduler.plan_model_groups(trials_df).to_numpy()
+    order = np.argsort(groups, kind="stable")
+    cost = np.nan_to_num(plan_seconds.to_numpy(dtype=np.float64))[order]
+    share = cost.sum() / shards
+    before = np.cumsum(cost) - cost
+    shard = np.minimum((before / share).astype(np.int64) if share > 0 else np.zeros(len(cost), np.int64), shards - 1)
+    out = np.empty(len(cost), dtype=np.int64)
+    out[order] = shard
+    return out
+
+
+def write_shards(input_df: pd.DataFrame, shard: np.ndarray, input_path: Path) -> List[Path]:
+    """
+    Writes each shard as an ordinary input file next to the input, e.g.
+    X-IN.shard-1-of-4.csv, for one worker (or one pipeline run) each.
+    """
+    input_path = Path(input_path)
+    shards = int(shard.max()) + 1 if len(shard) else 0
+    paths = []
+    for n in range(shards):
+        path = input_path.with_name(f"{input_path.stem}.shard-{n + 1}-of-{shards}{input_path.suffix}")
+        part = input_df[shard == n]
+        if path.suffix.lower() == ".parquet":
+            part.to_parquet(path, index=False)
+        elif path.suffix.lower() == ".xlsx":
+            part.to_excel(path, index=False)
+        else:
+            part.to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+# --- Planned vs. actual ---
+
+ACTUAL_COLUMNS = ["trial-id", "llm_status", "llm_cache_hit", "llm_prompt_eval_count", "llm_eval_count",
+                  "llm_client_wall_ns"]
+
+
+def planned_vs_actual(plan: pd.DataFrame, results: Union[Path, TrialJournal, pd.DataFrame],
+                      concurrency: int = 1, wall_s: Optional[float] = None) -> pd.DataFrame:
+    """
+    Compares a plan with what its run did.
+
+    Args:
+        plan (pd.DataFrame): `trial-id`, `model` and the plan columns of every planned trial.
+        results (Path | TrialJournal | pd.DataFrame): The run's results.
+        concurrency (int): Requests in flight, as given to summarize_plan.
+        wall_s (float, optional): Measured wall time of the run, for the total row.
+
+    Returns:
+        pd.DataFrame: One row per model plus an "all" row: trials run, planned and actual
+                      prompt tokens, output tokens and client seconds, and actual/planned
+                      ratios. The "all" row also has planned and actual wall seconds.
+    """
+    if isinstance(results, pd.DataFrame):
+        actual = results.reindex(columns=ACTUAL_COLUMNS)
+    else:
+        actual = pd.concat(list(analysis.iter_result_chunks(results, ACTUAL_COLUMNS)), ignore_index=True)
+    actual = actual.drop_duplicates("trial-id", keep="last")
+    actual = actual.assign(**{"trial-id": actual["trial-id"].astype(str)})
+    planned = plan.assign(**{"trial-id": plan["trial-id"].astype(str)})
+    merged = planned.merge(actual, on="trial-id", how="inner")
+    # Skipped or cached trials sent nothing, so they say nothing about the plan
+    merged = merged[_sent(merged) & merged["llm_client_wall_ns"].notna()]
+    merged = merged.assign(model=merged["model"].astype(object),
+                           actual_prompt_tokens=pd.to_numeric(merged["llm_prompt_eval_count"], errors="coerce"),
+                           actual_output_tokens=pd.to_numeric(merged["llm_eval_count"], errors="coerce"),
+                           actual_s=pd.to_numeric(merged["llm_client_wall_ns"], errors="coerce") / 1e9)
+
+    def _row(frame: pd.DataFrame, model: Any) -> Dict[str, Any]:
+        row = {"model": model, "trials": len(frame),
+               "planned_prompt_tokens": frame["plan_prompt_tokens"].sum(),
+               "actual_prompt_tokens": frame["actual_prompt_tokens"].sum(),
+               "planned_output_tokens": frame["plan_output_tokens"].sum(),
+               "actual_output_tokens": frame["actual_output_tokens"].sum(),
+               "planned_s": frame["plan_seconds"].sum(),
+               "actual_s": frame["actual_s"].sum()}
+        for name in ("prompt_tokens", "output_tokens", "s"):
+            planned_total = row[f"planned_{name}"]
+            row[f"ratio_{name}"] = row[f"actual_{name}"] / planned_total if planned_total else np.nan
+        return row
+
+    rows = [_row(frame, model) for model, frame in merged.groupby("model", dropna=False, sort=True)]
+    total = _row(merged, "all")
+    total["planned_wall_s"] = plan["plan_seconds"].sum() / max(concurrency, 1)
+    total["actual_wall_s"] = wall_s
+    rows.append(total)
+    return pd.DataFrame(rows)
+
+
+def main_cli(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Estimate a sheet's cost and split it into balanced shards.")
+    parser.add_argument("--input", type=Path, required=True, help="Trials to plan (.csv, .parquet or .xlsx).")
+    parser.add_argument("--history", type=Path, action="append", default=[],
+                        help="Directory searched for past *-OUT result files (repeatable).")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests in flight, for the wall-time estimate.")
+    parser.add_argument("--endpoint", help="Plan with this endpoint's history (an llm_endpoint value).")
+    parser.add_argument("--shards", type=int, default=1, help="Write this many shard input files next to the input.")
+    args = parser.parse_args(argv)
+
+    history = [path for root in args.history for path in find_result_files(root)]
+    cost_model = CostModel.from_results(history)
+    print(f"Learned from {cost_model.history_trials} trials in {len(history)} result files")
+    input_df = engine.load_input_data(args.input)
+    trials_df = engine.build_prompts_df(input_df, preview=False)
+    plan = cost_model.estimate(trials_df, args.endpoint)
+    print(summarize_plan(trials_df, plan, args.concurrency).to_string(index=False))
+    if args.shards > 1:
+        shard = assign_shards(trials_df, plan["plan_seconds"], args.shards)
+        for n, path in enumerate(write_shards(input_df, shard, args.input)):
+            print(f"{path}: {int((shard == n).sum())} trials, "
+                  f"{plan['plan_seconds'][shard == n].sum() / 3600:.2f} client hours")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,191 @@
+"""
+Persistent, content-addressed cache of Ollama responses.
+
+Entries are keyed by a SHA-256 hash of the exact request sent to `generate`
+(model, prompt, system prompt and options), stored in a SQLite file under data/,
+and evicted by age and total size. Only deterministic requests are cached, i.e.
+ones with a fixed `seed` or `temperature` 0; anything else always goes to Ollama
+so replicates keep their sampling variance.
+
+Identical requests already in flight in the same run are coalesced: the first
+caller runs the request and the others wait for its result.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / "data" / "response-cache.sqlite"
+
+# Once a write takes the cache past max_bytes, evict down to this share of it, so
+# the next writes don't each pay for an eviction pass.
+EVICT_TO_FRACTION = 0.9
+
+
+def request_key(request: Dict[str, Any]) -> str:
+    """Hashes a generate request into a stable cache key."""
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def is_deterministic(request: Dict[str, Any]) -> bool:
+    """True if the request pins a seed or uses greedy decoding."""
+    options = request.get("options") or {}
+    return options.get("seed") is not None or options.get("temperature") == 0
+
+
+class ResponseCache:
+    """
+    SQLite-backed response cache, safe to share between executor threads.
+
+    Args:
+        path (Path): SQLite file to use; created if missing.
+        max_age_s (float, optional): Entries older than this are evicted.
+        max_bytes (int, optional): Evict least recently used entries beyond this size,
+                                   on open and close and whenever a write goes past it.
+    """
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH,
+                 max_age_s: Optional[float] = None,
+                 max_bytes: Optional[int] = None):
+        self.path = Path(path)
+        self.max_age_s = max_age_s
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        # Running estimate of the payload bytes stored, so writes can tell when to evict
+        self._bytes = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, columns TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self.evict()
+
+    # --- Lookup ---
+
+    def _read(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT columns, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if self.max_age_s is not None and row[1] < time.time() - self.max_age_s:
+            return None
+        self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+        return json.loads(row[0])
+
+    def _write(self, key: str, columns: Dict[str, Any]) -> None:
+        payload = json.dumps(columns, default=str)
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, columns, size, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, payload, len(payload), now, now),
+        )
+        self._conn.commit()
+        self._bytes += len(payload)
+        if self.max_bytes is not None and self._bytes > self.max_bytes:
+            self._evict_locked(int(self.max_bytes * EVICT_TO_FRACTION))
+
+    def get_or_generate(self, request: Dict[str, Any],
+                        generate: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], bool]:
+        """
+        Returns the llm_* columns for `request`, calling `generate` only on a miss.
+
+        Args:
+            request (Dict[str, Any]): The keyword arguments sent to `generate`.
+            generate (Callable): Runs the request and returns its llm_* columns.
+
+        Returns:
+            Tuple[Dict[str, Any], bool]: The columns and whether they were served
+                                         without a new LLM call (cache hit or coalesced).
+        """
+        if not is_deterministic(request):
+            return generate(), False
+
+        key = request_key(request)
+        with self._lock:
+            cached = self._read(key)
+            if cached is not None:
+                self.hits += 1
+                return cached, True
+            pending = self._in_flight.get(key)
+            if pending is None:
+                pending = Future()
+                self._in_flight[key] = pending
+                owner = True
+                self.misses += 1
+            else:
+                owner = False
+                self.coalesced += 1
+
+        if not owner:
+            return dict(pending.result()), True
+
+        try:
+            columns = generate()
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        else:
+            pending.set_result(columns)
+            if columns.get("llm_status") == "ok":
+                with self._lock:
+                    self._write(key, columns)
+            return columns, False
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    # --- Maintenance ---
+
+    def _evict_locked(self, target_bytes: Optional[int]) -> int:
+        """evict() for a caller holding the lock; least recently used entries go until target_bytes is met."""
+        removed = 0
+        if self.max_age_s is not None:
+            cur = self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_s,))
+            removed += cur.rowcount
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if target_bytes is not None and total > target_bytes:
+            for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+                if total <= target_bytes:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= size
+                removed += 1
+        self._conn.commit()
+        self._bytes = total
+        return removed
+
+    def evict(self) -> int:
+        """Drops expired entries, then least recently used ones beyond max_bytes. Returns rows removed."""
+        with self._lock:
+            return self._evict_locked(self.max_bytes)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters for this process plus the current on-disk size."""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                "entries": entries, "bytes": size}
+
+    def close(self) -> None:
+        self.evict()
+        self._conn.close()
+
+    def __enter__(self) -> "ResponseCache":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
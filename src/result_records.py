@@ -0,0 +1,301 @@
+"""
+Compact in-memory trial results.
+
+Every result handed to a sink is the trial's input row plus its llm_* columns.
+Kept as a dict per trial, a run of 10^6 trials holds 10^6 dicts of ~50 keys,
+each value boxed on its own; building the results DataFrame from them at the
+end doubles that again. `ResultTable` keeps the same information in far less:
+
+    inputs       - not copied: each result refers to its row of the input frame
+                   by position, and only input values a runner changed (e.g. a
+                   receiver's offer in a paired game) are stored, as overrides
+    llm_* etc.   - one typed array per column (int64, float64, int8 flags);
+                   repeated text (status, model, done_reason, error kinds) as
+                   int32 codes into a table holding each distinct string once;
+                   unique text (responses) as a list of references
+
+The prompts and option sets in the input frame are already shared between rows
+(engine.format_prompts and resolve_option_sets build each distinct one once), so
+the table adds a few bytes per column per trial. The wide DataFrame is only built
+by `to_frame` / `iter_frames`, i.e. when the results are returned or saved.
+"""
+
+import threading
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+# A text column switches to plain references once this many distinct values make
+# up more than half of its rows; interning unique text only adds a lookup table.
+_MAX_INTERNED = 1024
+
+
+def widen_float32(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts float32 columns to float64 via their shortest repr, so a stored 0.8 is
+    sent to Ollama and written to results as 0.8 rather than 0.800000011920929.
+    """
+    float32_cols = [col for col in df.columns if df[col].dtype == np.float32]
+    if not float32_cols:
+        return df
+    return df.assign(**{col: df[col].astype(str).astype(np.float64) for col in float32_cols})
+
+
+def _is_missing(value: Any) -> bool:
+    if value is None:
+        return True
+    try:
+        missing = pd.isna(value)
+    except (TypeError, ValueError):
+        return False
+    return isinstance(missing, (bool, np.bool_)) and bool(missing)
+
+
+def _same(a: Any, b: Any) -> bool:
+    """True if a result value equals its input value (both missing counts as equal)."""
+    if a is b:
+        return True
+    try:
+        equal = a == b
+    except Exception:
+        return False
+    if isinstance(equal, (bool, np.bool_)) and equal:
+        return True
+    return _is_missing(a) and _is_missing(b)
+
+
+_KINDS = {bool: "bool", int: "int", float: "float", str: "text"}
+
+
+def _kind(value: Any) -> str:
+    kind = _KINDS.get(type(value))
+    if kind is not None and (kind != "int" or -2**63 <= value < 2**63):
+        return kind
+    if isinstance(value, (bool, np.bool_)):
+        return "bool"
+    if isinstance(value, (int, np.integer)):
+        return "int" if -2**63 <= value < 2**63 else "object"
+    if isinstance(value, (float, np.floating)):
+        return "float"
+    if isinstance(value, str):
+        return "text"
+    return "object"
+
+
+class _Column:
+    """
+    One column of a ResultTable: a value per recorded trial, with a validity byte
+    so trials that lack the column (e.g. llm_error on successes) cost one byte.
+    """
+
+    __slots__ = ("kind", "data", "valid", "texts", "codes")
+
+    def __init__(self):
+        self.kind: Optional[str] = None
+        self.data: Any = None
+        self.valid = bytearray()
+        self.texts: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def _start(self, kind: str, n: int) -> None:
+        self.kind = kind
+        self.data = {"int": lambda: array("q", bytes(8 * n)),
+                     "float": lambda: array("d", [np.nan]) * n,
+                     "bool": lambda: array("b", bytes(n)),
+                     "text": lambda: array("i", [-1]) * n,
+                     "object": lambda: [None] * n}[kind]()
+
+    def _pad(self, n: int) -> None:
+        missing = n - len(self.valid)
+        if missing <= 0:
+            return
+        self.valid.extend(bytes(missing))
+        if self.kind in ("int", "bool"):
+            self.data.frombytes(bytes(self.data.itemsize * missing))
+        elif self.kind == "float":
+            self.data.extend(array("d", [np.nan]) * missing)
+        elif self.kind == "text":
+            self.data.extend(array("i", [-1]) * missing)
+        elif self.kind == "object":
+            self.data.extend([None] * missing)
+
+    def _values(self) -> List[Any]:
+        """Every stored value as Python objects, None where missing."""
+        if self.kind == "text":
+            return [self.texts[c] if c >= 0 else None for c in self.data]
+        if self.kind == "bool":
+            return [bool(v) if ok else None for v, ok in zip(self.data, self.valid)]
+        return [v if ok else None for v, ok in zip(self.data, self.valid)]
+
+    def _convert(self, kind: str) -> None:
+        if kind == "float" and self.kind == "int":
+            self.data = array("d", (float(v) if ok else np.nan for v, ok in zip(self.data, self.valid)))
+        else:
+            self.data = self._values()
+            self.texts, self.codes = [], {}
+        self.kind = kind
+
+    def set(self, n: int, value: Any) -> None:
+        """Records the value of the n-th trial (n >= every earlier one)."""
+        self._pad(n)
+        if value is None:
+            self._pad(n + 1)
+            return
+        kind = _kind(value)
+        if self.kind is None:
+            self._start(kind, n)
+        elif kind != self.kind:
+            if {kind, self.kind} == {"int", "float"}:
+                if self.kind == "int":
+                    self._convert("float")
+            elif self.kind != "object":
+                self._convert("object")
+        if self.kind == "text":
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.texts)
+                self.texts.append(value)
+            self.data.append(code)
+        elif self.kind == "int":
+            self.data.append(int(value))
+        elif self.kind == "float":
+            self.data.append(float(value))
+        elif self.kind == "bool":
+            self.data.append(1 if value else 0)
+        else:
+            self.data.append(value)
+        self.valid.append(1)
+        if self.kind == "text" and len(self.texts) > _MAX_INTERNED and 2 * len(self.texts) > len(self.valid):
+            self._convert("object")
+
+    def materialize(self, n: int, order: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """The values of the trials in `order` as a column, and where they are present."""
+        self._pad(n)
+        valid = np.frombuffer(bytes(self.valid), dtype=np.uint8).astype(bool)[order]
+        if self.kind == "int":
+            values = np.frombuffer(self.data, dtype=np.int64)[order]
+            if not valid.all():
+                values = np.where(valid, values, np.nan)
+        elif self.kind == "float":
+            values = np.frombuffer(self.data, dtype=np.float64)[order]
+        elif self.kind == "bool" and valid.all():
+            values = np.frombuffer(self.data, dtype=np.int8)[order].astype(bool)
+        elif self.kind == "text":
+            lookup = np.empty(len(self.texts) + 1, dtype=object)
+            lookup[:-1] = self.texts
+            lookup[-1] = np.nan  # code -1
+            values = lookup[np.frombuffer(self.data, dtype=np.int32)[order]]
+        else:
+            stored = self._values() if self.kind == "bool" else (self.data or [None] * n)
+            values = pd.Series(stored, dtype=object).to_numpy()[order]
+            values[~valid] = np.nan
+        return values, valid
+
+
+class ResultTable:
+    """
+    Compact, thread-safe collection of the results of one trial frame. Has the
+    journal methods run_ollama_trials uses (`append`, `completed_ids`), so it can
+    be passed as its journal and later to save_results.
+
+    Args:
+        inputs (pd.DataFrame): The trials being run (e.g. build_prompts_df's output).
+                               Results are recorded against its rows, by index label
+                               if the index is integer, else by position.
+    """
+
+    def __init__(self, inputs: pd.DataFrame):
+        self.inputs = inputs
+        self._inputs = {col: self._input_column(inputs[col]) for col in inputs.columns}
+        self._float32 = {col for col in inputs.columns if inputs[col].dtype == np.float32}
+        self._index = inputs.index if pd.api.types.is_integer_dtype(inputs.index) else None
+        self._lock = threading.Lock()
+        self._positions = array("q")
+        self._rows = array("q")
+        self._columns: Dict[str, _Column] = {}
+        self._overrides: Dict[str, _Column] = {}
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    @staticmethod
+    def _input_column(series: pd.Series) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """A column's values without copying them: categorical codes and their labels, or the array."""
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            labels = np.empty(len(series.cat.categories) + 1, dtype=object)
+            labels[:-1] = series.cat.categories.tolist()
+            labels[-1] = np.nan  # code -1
+            return series.cat.codes.to_numpy(), labels
+        return series.to_numpy(), None
+
+    def _input_value(self, col: str, row: int) -> Any:
+        values, labels = self._inputs[col]
+        value = values[row]
+        if labels is not None:
+            return labels[value]
+        if col in self._float32:
+            return float(str(value))  # as widen_float32 gives it to the trial
+        return value
+
+    def append(self, pos: int, result: Dict[str, Any]) -> None:
+        """Records one finished trial; `pos` is its position as given by the runner."""
+        with self._lock:
+            # Inside the lock: pandas builds an unsorted index's lookup table lazily, not thread-safely
+            row = int(self._index.get_loc(pos)) if self._index is not None else int(pos)
+            n = len(self._positions)
+            for key, value in result.items():
+                if key in self._inputs:
+                    if _same(value, self._input_value(key, row)):
+                        continue
+                    column = self._overrides.get(key)
+                    if column is None:
+                        column = self._overrides[key] = _Column()
+                else:
+                    column = self._columns.get(key)
+                    if column is None:
+                        column = self._columns[key] = _Column()
+                column.set(n, value)
+            self._positions.append(int(pos))
+            self._rows.append(row)
+
+    def completed_ids(self) -> Set[str]:
+        """The trial-ids recorded so far."""
+        with self._lock:
+            if "trial-id" not in self._inputs:
+                return set()
+            return {str(self._input_value("trial-id", row)) for row in self._rows}
+
+    # --- Building frames ---
+
+    def _frame(self, order: np.ndarray, n: int) -> pd.DataFrame:
+        rows = np.frombuffer(self._rows, dtype=np.int64)[order]
+        frame = widen_float32(self.inputs.iloc[rows]).reset_index(drop=True)
+        for col, column in self._overrides.items():
+            values, valid = column.materialize(n, order)
+            target = frame[col]
+            if isinstance(target.dtype, pd.CategoricalDtype):
+                target = target.astype(object)
+            frame[col] = target.where(~valid, pd.Series(values, index=frame.index)).infer_objects()
+        outputs = {col: column.materialize(n, order)[0] for col, column in self._columns.items()}
+        if outputs:
+            frame = pd.concat([frame, pd.DataFrame(outputs, index=frame.index)], axis=1)
+        return frame
+
+    def _order(self) -> Tuple[np.ndarray, int]:
+        n = len(self._positions)
+        return np.argsort(np.frombuffer(self._positions, dtype=np.int64), kind="stable"), n
+
+    def to_frame(self) -> pd.DataFrame:
+        """The results as one wide DataFrame, in input order: inputs, then the result columns."""
+        with self._lock:
+            order, n = self._order()
+            return self._frame(order, n)
+
+    def iter_frames(self, chunksize: int = 100_000) -> Iterator[pd.DataFrame]:
+        """Like to_frame, a chunk of at most `chunksize` trials at a time."""
+        with self._lock:
+            order, n = self._order()
+            for start in range(0, n, chunksize):
+                yield self._frame(order[start:start + chunksize], n)
@@ -0,0 +1,192 @@
+"""
+Columnar, partitioned result store.
+
+Results are written as compressed Parquet under a Hive-style directory layout,
+partitioned by `experiment-id` and `model`:
+
+    <root>/experiment-id=EXP00/model=phi3%3Alatest/part-<uuid>-0.parquet
+
+Repeated text (system/base/final prompts) is dictionary-encoded by Parquet, the
+llm_* counters and durations keep integer types, and every write adds new files
+instead of rewriting old ones, so results can be appended batch by batch without
+holding the whole run in memory. Reading back a single model only opens that
+model's partition files.
+"""
+
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import pandas as pd
+
+PARTITION_COLUMNS = ("experiment-id", "model")
+
+# Result columns with a fixed type, whatever the pandas inference of a batch says.
+RESULT_INT_COLUMNS = [
+    "llm_eval_count",
+    "llm_eval_duration_ns",
+    "llm_prompt_eval_count",
+    "llm_prompt_eval_duration_ns",
+    "llm_load_duration_ns",
+    "llm_total_duration_ns",
+    "llm_client_wall_ns",
+    "llm_queue_wait_ns",
+    "llm_tokens_saved",
+    "llm_attempts",
+]
+RESULT_BOOL_COLUMNS = ["llm_done", "llm_cache_hit"]
+
+# Long strings repeated on most rows; read back as categoricals.
+REPEATED_TEXT_COLUMNS = ["system-prompt", "base-prompt", "final-prompt"]
+
+
+class ParquetResultStore:
+    """
+    Append-only Parquet dataset of trial results.
+
+    Args:
+        root (Path): Dataset directory; created on first write.
+        compression (str): Parquet codec, e.g. "zstd" or "snappy".
+        buffer_rows (int): Rows buffered by `append` before they are flushed to disk.
+    """
+
+    def __init__(self, root: Path, compression: str = "zstd", buffer_rows: int = 50_000):
+        self.root = Path(root)
+        self.compression = compression
+        self.buffer_rows = buffer_rows
+        self._buffer: List[Dict[str, Any]] = []
+
+    # --- Writing ---
+
+    def _to_table(self, results_df: pd.DataFrame):
+        import pyarrow as pa
+
+        df = results_df.copy(deep=False)
+        for col in PARTITION_COLUMNS:
+            if col not in df.columns:
+                df[col] = None
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype(object)
+        for col in RESULT_INT_COLUMNS:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
+        for col in RESULT_BOOL_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].astype("boolean")
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+    def write(self, results_df: pd.DataFrame) -> None:
+        """Writes one batch of results as new files in their partitions."""
+        if results_df is None or results_df.empty:
+            return
+        import pyarrow.dataset as ds
+
+        table = self._to_table(results_df)
+        partition_schema = table.select(list(PARTITION_COLUMNS)).schema
+        ds.write_dataset(
+            table,
+            self.root,
+            format="parquet",
+            partitioning=ds.partitioning(partition_schema, flavor="hive"),
+            basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            file_options=ds.ParquetFileFormat().make_write_options(compression=self.compression,
+                                                                   use_dictionary=True),
+        )
+
+    def append(self, pos: int, result: Dict[str, Any]) -> None:
+        """Buffers one result; flushes a batch every `buffer_rows` results."""
+        self._buffer.append(result)
+        if len(self._buffer) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._buffer:
+            batch, self._buffer = self._buffer, []
+            self.write(pd.DataFrame(batch))
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> "ParquetResultStore":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    # --- Reading ---
+
+    def _dataset(self, model: Optional[str], experiment_id: Optional[str]):
+        """The dataset of partition files matching the filters, or None if there are none."""
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        if not self.root.exists():
+            return None
+
+        partitioning = ds.partitioning(pa.schema([(c, pa.string()) for c in PARTITION_COLUMNS]), flavor="hive")
+        dataset = ds.dataset(self.root, format="parquet", partitioning=partitioning)
+        expr = None
+        for col, value in zip(PARTITION_COLUMNS, (experiment_id, model)):
+            if value is not None:
+                cond = ds.field(col) == value
+                expr = cond if expr is None else expr & cond
+
+        # Batches can differ slightly (e.g. llm_error only where a trial failed), so
+        # unify the schemas of just the matching files before reading them.
+        fragments = list(dataset.get_fragments(filter=expr))
+        if not fragments:
+            return None
+        schema = pa.unify_schemas([f.physical_schema for f in fragments] + [partitioning.schema],
+                                  promote_options="permissive")
+        return ds.dataset([f.path for f in fragments], schema=schema, format="parquet",
+                          partitioning=partitioning, partition_base_dir=str(self.root))
+
+    def read(self,
+             model: Optional[str] = None,
+             experiment_id: Optional[str] = None,
+             columns: Optional[Sequence[str]] = None,
+             categorical: bool = True) -> pd.DataFrame:
+        """
+        Reads results back, opening only the partitions that match the filters.
+
+        Args:
+            model (str, optional): Only this model's results.
+            experiment_id (str, optional): Only this experiment's results.
+            columns (Sequence[str], optional): Columns to read; all by default.
+            categorical (bool): Return the repeated prompt text as categoricals.
+
+        Returns:
+            pd.DataFrame: The matching results.
+        """
+        matching = self._dataset(model, experiment_id)
+        if matching is None:
+            return pd.DataFrame(columns=list(columns or []))
+        table = matching.to_table(columns=list(columns) if columns else None)
+
+        if categorical:
+            for col in REPEATED_TEXT_COLUMNS:
+                if col in table.column_names:
+                    idx = table.column_names.index(col)
+                    table = table.set_column(idx, col, table.column(col).dictionary_encode())
+        return table.to_pandas()
+
+    def iter_chunks(self,
+                    columns: Optional[Sequence[str]] = None,
+                    chunksize: int = 100_000,
+                    model: Optional[str] = None,
+                    experiment_id: Optional[str] = None) -> Iterator[pd.DataFrame]:
+        """
+        Yields the matching results as DataFrames of at most `chunksize` rows, one
+        partition file at a time, so memory stays bounded for any dataset size.
+        Columns missing from a file come back as nulls.
+        """
+        matching = self._dataset(model, experiment_id)
+        if matching is None:
+            return
+        names = [c for c in columns if c in matching.schema.names] if columns else None
+        for batch in matching.to_batches(columns=names, batch_size=chunksize):
+            if batch.num_rows:
+                df = batch.to_pandas()
+                yield df.reindex(columns=list(columns)) if columns else df
@@ -0,0 +1,160 @@
+"""
+Per-trial retries.
+
+A failed generate call is classified before anything is retried:
+
+    transient  - the server could not answer right now: refused or dropped
+                 connections, HTTP 5xx (including a model runner that crashed
+                 or is still loading, or an error inside a stream) and 429
+                 (Ollama's request queue is full)
+    timeout    - no response within the per-trial timeout (a hung request)
+    permanent  - the request itself is wrong: other 4xx (e.g. unknown model),
+                 missing fields, bad option values
+
+Transient and timed-out calls are retried with exponential backoff and full
+jitter (a random delay between 0 and base * 2^attempt, capped), so many trials
+that failed together do not all come back at the same moment. Permanent errors
+fail at once. Every retry is paid from a `RetryBudget` shared by the whole run:
+each trial adds a fraction of a retry to it, so when a server is down for good
+the run stops hammering it and records the failures instead of retrying every
+trial `max_attempts` times.
+"""
+
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+import ollama
+
+TRANSIENT = "transient"
+TIMEOUT = "timeout"
+PERMANENT = "permanent"
+RETRYABLE_KINDS = (TRANSIENT, TIMEOUT)
+
+
+def classify_error(error: BaseException) -> str:
+    """TRANSIENT, TIMEOUT or PERMANENT for an exception raised by a generate call."""
+    if isinstance(error, (httpx.TimeoutException, TimeoutError)):
+        return TIMEOUT
+    if isinstance(error, ollama.ResponseError):
+        # A negative status is an error reported inside a stream, i.e. by the runner
+        status = error.status_code
+        return TRANSIENT if status >= 500 or status < 0 or status in (408, 429) else PERMANENT
+    if isinstance(error, (ConnectionError, httpx.TransportError)):
+        return TRANSIENT
+    return PERMANENT
+
+
+class TrialFailed(Exception):
+    """Raised by RetryPolicy.call once a trial will not be retried; carries the last error."""
+
+    def __init__(self, error: BaseException, kind: str, attempts: int, budget_exhausted: bool = False):
+        super().__init__(str(error))
+        self.error = error
+        self.kind = kind
+        self.attempts = attempts
+        self.budget_exhausted = budget_exhausted
+
+
+class RetryBudget:
+    """
+    Retries allowed across a run: `min_retries` to start with, plus `ratio` of a
+    retry for every trial started. Thread-safe.
+
+    Args:
+        ratio (float): Retries earned per trial, e.g. 0.2 lets a fifth of the
+                       trials be retried once on average.
+        min_retries (int): Retries available before any trial has run.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10):
+        self.ratio = ratio
+        self._lock = threading.Lock()
+        self._balance = float(min_retries)
+        self.trials = 0
+        self.retries = 0
+        self.denied = 0
+
+    def deposit(self) -> None:
+        with self._lock:
+            self.trials += 1
+            self._balance += self.ratio
+
+    def withdraw(self) -> bool:
+        """Takes one retry from the budget; False (and counted as denied) if it is spent."""
+        with self._lock:
+            if self._balance < 1:
+                self.denied += 1
+                return False
+            self._balance -= 1
+            self.retries += 1
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"trials": self.trials, "retries": self.retries, "denied": self.denied,
+                    "remaining": round(self._balance, 2)}
+
+
+class RetryPolicy:
+    """
+    How trials are timed out and retried.
+
+    Args:
+        max_attempts (int): Attempts per trial, the first one included.
+        base_delay_s (float): Backoff cap before the first retry; doubles per retry.
+        max_delay_s (float): Largest backoff between two attempts.
+        timeout_s (float, optional): Seconds a request may wait for the server
+                                     before it is abandoned as hung. This is the
+                                     HTTP read timeout: the whole response for
+                                     non-streamed calls, the next token for
+                                     streamed ones. None waits forever.
+        budget (RetryBudget, optional): Shared retry budget; a fresh default one if omitted.
+        sleep (Callable[[float], None]): Used to wait between attempts.
+    """
+
+    def __init__(self, max_attempts: int = 4,
+                 base_delay_s: float = 0.5,
+                 max_delay_s: float = 30.0,
+                 timeout_s: Optional[float] = 300.0,
+                 budget: Optional[RetryBudget] = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        if max_attempts < 1:
+            raise ValueError(f"max_attempts must be >= 1, got {max_attempts}")
+        self.max_attempts = max_attempts
+        self.base_delay_s = base_delay_s
+        self.max_delay_s = max_delay_s
+        self.timeout_s = timeout_s
+        self.budget = budget if budget is not None else RetryBudget()
+        self.sleep = sleep
+
+    def backoff_s(self, attempt: int) -> float:
+        """Delay before attempt `attempt + 1`: full jitter over an exponentially growing cap."""
+        return random.uniform(0.0, min(self.max_delay_s, self.base_delay_s * 2 ** (attempt - 1)))
+
+    def call(self, generate: Callable[[], Any]) -> Tuple[Any, int]:
+        """
+        Runs `generate`, retrying retryable failures.
+
+        Returns:
+            Tuple[Any, int]: What `generate` returned and the attempts it took.
+
+        Raises:
+            TrialFailed: A permanent error, or a retryable one after the last
+                         attempt or once the budget is spent.
+        """
+        self.budget.deposit()
+        attempt = 1
+        while True:
+            try:
+                return generate(), attempt
+            except Exception as e:
+                kind = classify_error(e)
+                if kind not in RETRYABLE_KINDS or attempt >= self.max_attempts:
+                    raise TrialFailed(e, kind, attempt) from e
+                if not self.budget.withdraw():
+                    raise TrialFailed(e, kind, attempt, budget_exhausted=True) from e
+            self.sleep(self.backoff_s(attempt))
+            attempt += 1
@@ -0,0 +1,325 @@
+"""
+Model-aware trial scheduling.
+
+Sits between `engine.build_prompts_df` and execution. Trials are grouped by model
+and the settings that force Ollama to reload it (`num_ctx`, `use_mmap`), each group
+runs back to back, and the next group's model is preloaded while the last wave of
+the current group is still in flight. Results are returned in the original order;
+what each group did (preload, load time paid) goes to a `ScheduleLog`.
+
+With `order_by_prefix`, trials within a group are also sorted by system prompt
+and prompt, so trials whose prompts start the same way run back to back and
+Ollama can reuse the evaluated prefix it still holds from the previous request
+instead of evaluating the whole prompt again. `prefix_reuse` estimates how many
+prompt tokens an order shares with the preceding trial, for comparing it with
+the input order. The `context` returned by a generate call is not reused: it
+carries the previous prompt and answer, so the next trial would see them.
+"""
+
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+import numpy as np
+import ollama
+import pandas as pd
+
+import engine
+from adaptive_concurrency import AdaptiveConcurrency
+from dead_letter import DeadLetterFile
+from endpoint_pool import EndpointPool
+from journal import TrialJournal
+from metrics import TrialMetrics
+from response_cache import ResponseCache
+from retries import RetryPolicy
+
+# Columns that identify one loaded model instance on the Ollama server.
+MODEL_GROUP_COLUMNS = ["model", "num_ctx", "use_mmap"]
+
+# Text sent before the trial's answer, in the order Ollama evaluates it.
+PREFIX_COLUMNS = ["system-prompt", "final-prompt"]
+
+
+def plan_model_groups(trials_df: pd.DataFrame) -> pd.Series:
+    """
+    Assigns every trial a group number; trials in the same group share a model
+    and load settings. Groups are numbered in order of first appearance.
+
+    Args:
+        trials_df (pd.DataFrame): The trials, e.g. the output of build_prompts_df.
+
+    Returns:
+        pd.Series: Integer group number per trial, aligned to trials_df.index.
+    """
+    keys = [c for c in MODEL_GROUP_COLUMNS if c in trials_df.columns]
+    if not keys:
+        return pd.Series(0, index=trials_df.index, name="sched_group")
+    return trials_df.groupby(keys, sort=False, dropna=False, observed=True).ngroup().rename("sched_group")
+
+
+def _text_codes(series: pd.Series) -> Tuple[np.ndarray, List[str]]:
+    """Codes into the column's distinct values (missing as ""), numbered in sorted order."""
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    texts = ["" if pd.isna(u) else str(u) for u in uniques]
+    order = sorted(range(len(texts)), key=texts.__getitem__)
+    ranks = np.empty(len(texts), dtype=np.int64)
+    ranks[order] = np.arange(len(texts))
+    return ranks[codes], [texts[i] for i in order]
+
+
+def plan_prefix_order(trials_df: pd.DataFrame) -> np.ndarray:
+    """
+    Orders trials so that, within each model group, trials sharing a prompt prefix
+    are adjacent: groups keep their order of first appearance, and inside a group
+    trials are sorted by system prompt, then prompt (ties keep the input order).
+
+    Args:
+        trials_df (pd.DataFrame): The trials, e.g. the output of build_prompts_df.
+
+    Returns:
+        np.ndarray: Positions into trials_df, in the order to run them.
+    """
+    keys = [np.arange(len(trials_df))]
+    for col in reversed(PREFIX_COLUMNS):
+        if col in trials_df.columns:
+            keys.append(_text_codes(trials_df[col])[0])
+    keys.append(plan_model_groups(trials_df).to_numpy())
+    return np.lexsort(keys)
+
+
+def prefix_reuse(trials_df: pd.DataFrame, order: Optional[np.ndarray] = None) -> Dict[str, int]:
+    """
+    Estimates how much prompt evaluation an order saves on a server that keeps the
+    previous prompt of each model: the prompt tokens (whitespace-separated words
+    of the system prompt and prompt) each trial shares at the start with the
+    trial before it in the same model group.
+
+    Args:
+        trials_df (pd.DataFrame): The trials, e.g. the output of build_prompts_df.
+        order (np.ndarray, optional): Positions in run order; defaults to input order.
+
+    Returns:
+        Dict[str, int]: `prompt_tokens` in total and `shared_tokens` with the previous trial.
+    """
+    if order is None:
+        order = np.arange(len(trials_df))
+    cols = [col for col in PREFIX_COLUMNS if col in trials_df.columns]
+    # Tokenize each distinct (system prompt, prompt) pair once
+    per_column = [_text_codes(trials_df[col]) for col in cols]
+    codes = np.zeros(len(trials_df), dtype=np.int64)
+    for col_codes, texts in per_column:
+        codes = codes * len(texts) + col_codes
+    combos, first, combo_index = np.unique(codes, return_index=True, return_inverse=True)
+    words = [tuple(w for col_codes, texts in per_column for w in texts[col_codes[row]].split()) for row in first]
+
+    groups = plan_model_groups(trials_df).to_numpy()
+    shared_cache: Dict[Tuple[int, int], int] = {}
+    total = shared_total = 0
+    previous: Dict[int, int] = {}
+    for pos in order:
+        combo = int(combo_index[pos])
+        tokens = words[combo]
+        total += len(tokens)
+        before = previous.get(groups[pos])
+        previous[groups[pos]] = combo
+        if before is None:
+            continue
+        shared = shared_cache.get((before, combo))
+        if shared is None:
+            shared = 0
+            for a, b in zip(words[before], tokens):
+                if a != b:
+                    break
+                shared += 1
+            shared = shared_cache[(before, combo)] = min(shared, max(len(tokens) - 1, 0))
+        shared_total += shared
+    return {"prompt_tokens": total, "shared_tokens": shared_total}
+
+
+def _load_options(row: Dict[str, Any]) -> Dict[str, Any]:
+    """The subset of a trial's options that affects how the model is loaded."""
+    opts = engine._build_options(row)
+    return {k: opts[k] for k in ("num_ctx", "use_mmap") if k in opts}
+
+
+def _warm_model(client: engine.OllamaClient, row: Dict[str, Any], keep_alive: Union[str, float]) -> Dict[str, Any]:
+    """
+    Loads a group's model with an empty generate call and returns how long it took.
+    Failures are recorded rather than raised; the trials will load the model anyway.
+    """
+    try:
+        options = _load_options(row)
+        response = client.generate(model=row["model"], prompt="", keep_alive=keep_alive,
+                                   options=options if options else None)
+        return {"sched_warmup_status": "ok", "sched_warmup_load_ns": response.get("load_duration")}
+    except Exception as e:
+        return {"sched_warmup_status": f"error: {e}", "sched_warmup_load_ns": None}
+
+
+def _load_ns(value: Any) -> int:
+    """A result's llm_load_duration_ns as an int; 0 if it has none."""
+    value = pd.to_numeric(value, errors="coerce")
+    return 0 if pd.isna(value) else int(value)
+
+
+class _LoadTally:
+    """Passes results on to the journal, adding up the model load time they paid."""
+
+    def __init__(self, journal: TrialJournal):
+        self.journal = journal
+        self.load_ns = 0
+        self._lock = threading.Lock()
+
+    def completed_ids(self) -> Set[str]:
+        return self.journal.completed_ids()
+
+    def append(self, pos: int, result: Dict[str, Any]) -> None:
+        self.journal.append(pos, result)
+        with self._lock:
+            self.load_ns += _load_ns(result.get("llm_load_duration_ns"))
+
+
+SCHEDULE_COLUMNS = ["sched_call", "sched_group", "model", "trials", "sched_warmup_status",
+                    "sched_warmup_load_ns", "sched_group_load_ns"]
+
+
+class ScheduleLog:
+    """
+    What run_scheduled_trials did, one row per model group: the call (e.g. input
+    chunk) and group number, model, trials, the preload's status and load time, and
+    the load time the group paid in total (preload plus any reloads its trials still
+    paid). Kept apart from the results, so every runner saves the same columns.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.rows: List[Dict[str, Any]] = []
+
+    def report(self) -> pd.DataFrame:
+        return pd.DataFrame(self.rows, columns=SCHEDULE_COLUMNS)
+
+
+def run_scheduled_trials(trials_with_prompts_df: pd.DataFrame,
+                         concurrency: int = 1,
+                         model_concurrency: Optional[Dict[str, int]] = None,
+                         host: Optional[str] = None,
+                         keep_alive: Union[str, float] = "5m",
+                         cache: Optional[ResponseCache] = None,
+                         journal: Optional[TrialJournal] = None,
+                         pool: Optional[EndpointPool] = None,
+                         metrics: Optional[TrialMetrics] = None,
+                         early_stop_tail: Optional[int] = None,
+                         limiter: Optional[AdaptiveConcurrency] = None,
+                         retry: Optional[RetryPolicy] = None,
+                         dead_letter: Optional[DeadLetterFile] = None,
+                         order_by_prefix: bool = False,
+                         schedule_log: Optional[ScheduleLog] = None) -> Optional[pd.DataFrame]:
+    """
+    Runs trials grouped by model, preloading each next model before the current
+    group finishes.
+
+    Args:
+        trials_with_prompts_df (pd.DataFrame): The output of build_prompts_df.
+        concurrency (int): Passed through to run_ollama_trials.
+        model_concurrency (Dict[str, int], optional): Passed through to run_ollama_trials.
+        host (str, optional): Ollama server URL.
+        keep_alive (str | float): How long Ollama keeps each preloaded model resident.
+        cache (ResponseCache, optional): Passed through to run_ollama_trials.
+        journal (TrialJournal, optional): Passed through to run_ollama_trials. Results
+                                          are streamed to the journal in original
+                                          positions.
+        pool (EndpointPool, optional): Passed through to run_ollama_trials. Preloads
+                                       go through the pool too, so the group's
+                                       trials are routed to the endpoint it warmed.
+        metrics (TrialMetrics, optional): Passed through to run_ollama_trials.
+        early_stop_tail (int, optional): Passed through to run_ollama_trials.
+        limiter (AdaptiveConcurrency, optional): Passed through to run_ollama_trials;
+                                                 one limiter spans every group.
+        retry (RetryPolicy, optional): Passed through to run_ollama_trials. Its timeout
+                                       also bounds each preload.
+        dead_letter (DeadLetterFile, optional): Passed through to run_ollama_trials.
+        order_by_prefix (bool): Run each group's trials in plan_prefix_order, so
+                                consecutive trials share their prompt prefix.
+        schedule_log (ScheduleLog, optional): Gets a row per group run; pass the same
+                                              log to every call of one run.
+
+    Returns:
+        pd.DataFrame: The run_ollama_trials results in the original trial order.
+                      None when a journal is given.
+    """
+    def _run(part: pd.DataFrame, part_journal: Optional[TrialJournal]) -> Optional[pd.DataFrame]:
+        return engine.run_ollama_trials(part, concurrency, model_concurrency, host, cache, part_journal, pool, metrics,
+                                        early_stop_tail, limiter, retry, dead_letter)
+
+    # Integer labels are positions in the whole input (iter_input_chunks continues them
+    # across chunks), so keep them: they are what the journal records
+    df = trials_with_prompts_df
+    if not pd.api.types.is_integer_dtype(df.index):
+        df = df.reset_index(drop=True)
+    if df.empty:
+        return _run(df, journal)
+
+    groups = plan_model_groups(df)
+    # A preload that hangs would block the next group's join, so it gets the trials' timeout
+    client: engine.OllamaClient = pool if pool is not None else ollama.Client(host=host, timeout=engine._timeout(retry))
+    if order_by_prefix:
+        order = plan_prefix_order(df)
+        group_frames = [frame for _, frame in df.iloc[order].groupby(groups.to_numpy()[order], sort=False)]
+    else:
+        group_frames = [df.loc[idx] for idx in groups.groupby(groups, sort=False).groups.values()]
+
+    def _first_row(frame: pd.DataFrame) -> Dict[str, Any]:
+        return frame.iloc[0].to_dict()
+
+    def _can_warm(frame: pd.DataFrame) -> bool:
+        model = frame.iloc[0].get("model")
+        return isinstance(model, str) and bool(model)
+
+    warmups: List[Optional[Dict[str, Any]]] = [None] * len(group_frames)
+    if _can_warm(group_frames[0]):
+        warmups[0] = _warm_model(client, _first_row(group_frames[0]), keep_alive)
+
+    call = 0
+    if schedule_log is not None:
+        call, schedule_log.calls = schedule_log.calls, schedule_log.calls + 1
+
+    outputs: List[pd.DataFrame] = []
+    for g, frame in enumerate(group_frames):
+        group_journal = _LoadTally(journal) if journal is not None else None
+
+        # Run all but the last wave, then preload the next model alongside that wave
+        wave = concurrency if limiter is None else limiter.model_limit(_first_row(frame).get("model"))
+        tail = min(len(frame), wave)
+        head_df, tail_df = frame.iloc[:-tail], frame.iloc[-tail:]
+        parts = []
+        if not head_df.empty:
+            parts.append(_run(head_df, group_journal))
+
+        preload: Optional[threading.Thread] = None
+        if g + 1 < len(group_frames) and _can_warm(group_frames[g + 1]):
+            def _preload(nxt: int = g + 1) -> None:
+                warmups[nxt] = _warm_model(client, _first_row(group_frames[nxt]), keep_alive)
+            preload = threading.Thread(target=_preload, name="ollama-preload", daemon=True)
+            preload.start()
+
+        parts.append(_run(tail_df, group_journal))
+        if preload is not None:
+            preload.join()
+
+        if journal is not None:
+            trial_load_ns = group_journal.load_ns
+        else:
+            # run_ollama_trials returns each part in index order, whatever order it ran in
+            result = pd.concat(parts, ignore_index=True)
+            result.index = np.concatenate([np.sort(part.index.to_numpy()) for part in (head_df, tail_df)
+                                           if not part.empty])
+            outputs.append(result)
+            trial_load_ns = sum(_load_ns(v) for v in result.get("llm_load_duration_ns", []))
+        if schedule_log is not None:
+            warm = warmups[g] or {"sched_warmup_status": "skipped", "sched_warmup_load_ns": None}
+            schedule_log.rows.append({"sched_call": call, "sched_group": g, "model": _first_row(frame).get("model"),
+                                      "trials": len(frame), **warm,
+                                      "sched_group_load_ns": (warm["sched_warmup_load_ns"] or 0) + trial_load_ns})
+
+    if journal is not None:
+        return None
+    return pd.concat(outputs).sort_index()
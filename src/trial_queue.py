@@ -0,0 +1,418 @@
+"""
+Durable trial queue for running one sweep on several worker processes.
+
+The input trials are loaded into a SQLite file in batches. Workers, on one host
+or on several hosts that share the file's directory, each talking to their own
+Ollama, lease a batch at a time, build its prompts and run it with the usual
+engine functions, and record every result back in the queue:
+
+    python -m trial_queue enqueue --queue sweep.sqlite --input data/Experiment-SAMPLE-IN.csv
+    python -m trial_queue worker  --queue sweep.sqlite --host http://gpu-1:11434   # one per Ollama
+    python -m trial_queue status  --queue sweep.sqlite
+    python -m trial_queue merge   --queue sweep.sqlite --output data/Experiment-SAMPLE-OUT.csv
+
+A worker renews its lease with a heartbeat while it runs a batch. If it dies,
+the lease expires and another worker takes the batch over. Results are keyed by
+`trial-id` and only the first one recorded is kept, so a taken-over batch skips
+the trials already done, and a late result from a worker that lost its lease is
+dropped. `merge` writes the results in input order through the same journal and
+save_results path as a single-process run, so the output is the same.
+
+The queue file needs a filesystem with working file locks (local disks, most
+NFSv4 and SMB mounts), since SQLite relies on them between processes.
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+import pandas as pd
+
+import engine
+import scheduler
+from dead_letter import DeadLetterFile
+from journal import TrialJournal
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_LEASE_S = 60.0
+
+
+class BatchResults:
+    """
+    Records one leased batch's results in the queue. Has the journal methods
+    run_ollama_trials uses (`append`, `completed_ids`), so it can be passed as its
+    journal.
+    """
+
+    def __init__(self, trial_queue: "TrialQueue", batch_id: int, worker_id: str):
+        self.queue = trial_queue
+        self.batch_id = batch_id
+        self.worker_id = worker_id
+
+    def append(self, pos: int, result: Dict[str, Any]) -> None:
+        self.queue.record_result(pos, result, self.worker_id)
+
+    def completed_ids(self) -> Set[str]:
+        return self.queue.completed_ids(self.batch_id)
+
+
+class TrialQueue:
+    """
+    SQLite-backed queue of trial batches and their results, safe to share between
+    threads and processes.
+
+    Args:
+        path (Path): The queue file; created if missing.
+        timeout_s (float): How long to wait for another process's write lock.
+    """
+
+    def __init__(self, path: Path, timeout_s: float = 60.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Autocommit; multi-statement updates open their own transactions
+        self._conn = sqlite3.connect(str(self.path), timeout=timeout_s, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS trials ("
+            " pos INTEGER PRIMARY KEY, trial_id TEXT NOT NULL, batch_id INTEGER NOT NULL, row TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS trials_batch ON trials (batch_id);"
+            "CREATE TABLE IF NOT EXISTS batches ("
+            " batch_id INTEGER PRIMARY KEY, status TEXT NOT NULL DEFAULT 'pending',"
+            " lease_owner TEXT, lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0, finished_at REAL);"
+            "CREATE TABLE IF NOT EXISTS results ("
+            " trial_id TEXT PRIMARY KEY, pos INTEGER NOT NULL, result TEXT NOT NULL,"
+            " worker TEXT NOT NULL, recorded_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS results_pos ON results (pos);"
+        )
+
+    # --- Filling the queue ---
+
+    def enqueue(self, input_path: Path, batch_size: int = DEFAULT_BATCH_SIZE, chunksize: int = 100_000) -> int:
+        """
+        Adds every trial of an input file, `batch_size` trials per batch. Re-running
+        it on the same file adds nothing new, so it is safe to repeat.
+
+        Returns:
+            int: Trials in the queue.
+        """
+        for chunk in engine.iter_input_chunks(Path(input_path), chunksize):
+            # pandas' JSON keeps numpy ints/floats as numbers and NaN as null
+            records = json.loads(chunk.to_json(orient="records", double_precision=15))
+            rows = [(int(pos), str(record.get("trial-id")), int(pos) // batch_size, json.dumps(record))
+                    for pos, record in zip(chunk.index, records)]
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._conn.executemany("INSERT OR IGNORE INTO trials (pos, trial_id, batch_id, row) "
+                                       "VALUES (?, ?, ?, ?)", rows)
+                self._conn.executemany("INSERT OR IGNORE INTO batches (batch_id) VALUES (?)",
+                                       [(batch_id,) for batch_id in sorted({row[2] for row in rows})])
+                self._conn.execute("COMMIT")
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM trials").fetchone()[0]
+
+    # --- Leasing ---
+
+    def lease(self, worker_id: str, lease_s: float = DEFAULT_LEASE_S) -> Optional[int]:
+        """
+        Takes the first pending batch, or one whose lease has expired, for
+        `lease_s` seconds. Returns its batch_id, or None if there is none right now.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT batch_id FROM batches WHERE status = 'pending' "
+                    "OR (status = 'leased' AND lease_expires < ?) ORDER BY batch_id LIMIT 1", (now,)).fetchone()
+                if row is not None:
+                    self._conn.execute("UPDATE batches SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                                       "attempts = attempts + 1 WHERE batch_id = ?", (worker_id, now + lease_s, row[0]))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row[0] if row is not None else None
+
+    def heartbeat(self, batch_id: int, worker_id: str, lease_s: float = DEFAULT_LEASE_S) -> bool:
+        """Extends the lease. False if the worker no longer holds it (it expired and was taken over)."""
+        with self._lock:
+            cur = self._conn.execute("UPDATE batches SET lease_expires = ? WHERE batch_id = ? AND "
+                                     "status = 'leased' AND lease_owner = ?", (time.time() + lease_s, batch_id, worker_id))
+        return cur.rowcount > 0
+
+    def complete(self, batch_id: int, worker_id: str) -> bool:
+        """
+        Marks the batch done if every trial in it has a result; otherwise releases it
+        for a retry. False too if the worker no longer holds the lease (it expired and
+        was taken over): the batch is then left to its new owner.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                missing = self._conn.execute(
+                    "SELECT COUNT(*) FROM trials t LEFT JOIN results r ON r.trial_id = t.trial_id "
+                    "WHERE t.batch_id = ? AND r.trial_id IS NULL", (batch_id,)).fetchone()[0]
+                status = "done" if missing == 0 else "pending"
+                cur = self._conn.execute("UPDATE batches SET status = ?, lease_owner = NULL, lease_expires = NULL, "
+                                         "finished_at = ? WHERE batch_id = ? AND lease_owner = ?",
+                                         (status, time.time() if missing == 0 else None, batch_id, worker_id))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return missing == 0 and cur.rowcount > 0
+
+    def batch_trials(self, batch_id: int) -> pd.DataFrame:
+        """The batch's input rows, indexed by input position, with the input dtypes."""
+        with self._lock:
+            rows = self._conn.execute("SELECT pos, row FROM trials WHERE batch_id = ? ORDER BY pos",
+                                      (batch_id,)).fetchall()
+        df = pd.DataFrame([json.loads(row) for _, row in rows], index=pd.Index([pos for pos, _ in rows]))
+        return engine._apply_input_dtypes(df)
+
+    # --- Results ---
+
+    def record_result(self, pos: int, result: Dict[str, Any], worker_id: str) -> bool:
+        """Stores a trial's result unless its trial-id already has one. Returns whether it was stored."""
+        payload = json.dumps(result, default=str)
+        with self._lock:
+            cur = self._conn.execute("INSERT OR IGNORE INTO results (trial_id, pos, result, worker, recorded_at) "
+                                     "VALUES (?, ?, ?, ?, ?)",
+                                     (str(result.get("trial-id")), int(pos), payload, worker_id, time.time()))
+        return cur.rowcount > 0
+
+    def completed_ids(self, batch_id: Optional[int] = None) -> Set[str]:
+        """trial-ids with a recorded result, in one batch or overall."""
+        with self._lock:
+            if batch_id is None:
+                rows = self._conn.execute("SELECT trial_id FROM results").fetchall()
+            else:
+                rows = self._conn.execute("SELECT r.trial_id FROM results r JOIN trials t ON t.trial_id = r.trial_id "
+                                          "WHERE t.batch_id = ?", (batch_id,)).fetchall()
+        return {trial_id for (trial_id,) in rows}
+
+    def iter_results(self, chunksize: int = 10_000) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Yields (pos, result) in input order, reading `chunksize` rows at a time."""
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute("SELECT pos, result FROM results WHERE pos > ? ORDER BY pos LIMIT ?",
+                                          (last, chunksize)).fetchall()
+            if not rows:
+                return
+            for pos, result in rows:
+                yield pos, json.loads(result)
+            last = rows[-1][0]
+
+    def export_journal(self, journal_path: Path) -> TrialJournal:
+        """Writes the results, in input order, to a fresh journal (replacing any file there)."""
+        journal_path = Path(journal_path)
+        if journal_path.exists():
+            journal_path.unlink()
+        journal = TrialJournal(journal_path)
+        try:
+            for pos, result in self.iter_results():
+                journal.append(pos, result)
+        finally:
+            journal.close()
+        return journal
+
+    def merge(self, output_path: Path) -> int:
+        """
+        Saves the results like run_pipeline does: CSV, or a Parquet dataset for a
+        .parquet path. Trials that failed after their retries also go to a fresh
+        dead-letter file next to it (X-OUT.dead-letter.csv).
+
+        Returns:
+            int: Trials written to the dead-letter file.
+        """
+        output_path = Path(output_path)
+        journal = self.export_journal(output_path.with_suffix(".queue.journal.jsonl"))
+        engine.save_results(journal, output_path)
+        dead_letter_path = output_path.with_suffix(".dead-letter.csv")
+        dead_letter_path.unlink(missing_ok=True)
+        with DeadLetterFile(dead_letter_path) as dead_letter:
+            for _, result in journal.iter_entries():
+                if engine.is_dead_letter(result):
+                    dead_letter.append(result)
+        return dead_letter.count
+
+    # --- Reporting / lifecycle ---
+
+    def status(self) -> Dict[str, Any]:
+        """Batch counts by status, trials, results recorded and expired leases."""
+        with self._lock:
+            batches = dict(self._conn.execute("SELECT status, COUNT(*) FROM batches GROUP BY status").fetchall())
+            trials = self._conn.execute("SELECT COUNT(*) FROM trials").fetchone()[0]
+            results = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            expired = self._conn.execute("SELECT COUNT(*) FROM batches WHERE status = 'leased' AND lease_expires < ?",
+                                         (time.time(),)).fetchone()[0]
+            retried = self._conn.execute("SELECT COUNT(*) FROM batches WHERE attempts > 1").fetchone()[0]
+        return {"trials": trials, "results": results, "pending": batches.get("pending", 0),
+                "leased": batches.get("leased", 0), "done": batches.get("done", 0),
+                "expired_leases": expired, "retried_batches": retried}
+
+    def active_leases(self) -> Dict[int, str]:
+        """batch_id -> worker for every batch currently leased."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT batch_id, lease_owner FROM batches WHERE status = 'leased'"))
+
+    def unfinished(self) -> int:
+        """Batches not done yet, leased or not."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM batches WHERE status != 'done'").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "TrialQueue":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+def _heartbeat_loop(trial_queue: TrialQueue, batch_id: int, worker_id: str, lease_s: float,
+                    stop: threading.Event) -> None:
+    while not stop.wait(lease_s / 3):
+        if not trial_queue.heartbeat(batch_id, worker_id, lease_s):
+            # Taken over; keep running, the other worker's results for the same trials win or ours are dropped
+            return
+
+
+def run_worker(queue_path: Path,
+               host: Optional[str] = None,
+               worker_id: Optional[str] = None,
+               concurrency: int = 1,
+               lease_s: float = DEFAULT_LEASE_S,
+               poll_s: float = 2.0,
+               use_cache: bool = True) -> int:
+    """
+    Leases and runs batches until the queue is finished.
+
+    Prompts, options, the response cache, early stopping, timeouts and retries
+    are configured as in main.py (one retry budget per worker); each batch runs through build_prompts_df and,
+    like a single-process run, run_scheduled_trials with SCHEDULE_BY_MODEL (run_ollama_trials otherwise).
+
+    Args:
+        queue_path (Path): The queue file.
+        host (str, optional): This worker's Ollama server. Defaults to OLLAMA_HOST / localhost.
+        worker_id (str, optional): Name recorded on leases and results; defaults to host:pid.
+        concurrency (int): Requests in flight.
+        lease_s (float): Lease length; the heartbeat renews it every lease_s / 3.
+        poll_s (float): Wait between lease attempts while other workers hold the last batches.
+        use_cache (bool): Use the response cache configured in main.py.
+
+    Returns:
+        int: Batches this worker completed.
+    """
+    import main
+    from response_cache import ResponseCache
+
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:4]}"
+    cache = None
+    if use_cache and main.USE_RESPONSE_CACHE:
+        cache = ResponseCache(main.RESPONSE_CACHE_PATH, max_age_s=main.RESPONSE_CACHE_MAX_AGE_S,
+                              max_bytes=main.RESPONSE_CACHE_MAX_BYTES)
+    retry = main.retry_policy()
+    completed = 0
+    with TrialQueue(queue_path) as trial_queue:
+        try:
+            while True:
+                batch_id = trial_queue.lease(worker_id, lease_s)
+                if batch_id is None:
+                    if trial_queue.unfinished() == 0:
+                        return completed
+                    time.sleep(poll_s)
+                    continue
+
+                stop = threading.Event()
+                heartbeat = threading.Thread(target=_heartbeat_loop, name=f"lease-{batch_id}",
+                                             args=(trial_queue, batch_id, worker_id, lease_s, stop), daemon=True)
+                heartbeat.start()
+                try:
+                    trials = engine.build_prompts_df(trial_queue.batch_trials(batch_id), preview=False)
+                    batch_results = BatchResults(trial_queue, batch_id, worker_id)
+                    if main.SCHEDULE_BY_MODEL:
+                        scheduler.run_scheduled_trials(trials,
+                                                       concurrency=concurrency,
+                                                       model_concurrency=main.OLLAMA_MODEL_CONCURRENCY,
+                                                       host=host,
+                                                       keep_alive=main.OLLAMA_KEEP_ALIVE,
+                                                       cache=cache,
+                                                       journal=batch_results,
+                                                       early_stop_tail=main.EARLY_STOP_TAIL_TOKENS,
+                                                       retry=retry,
+                                                       order_by_prefix=main.ORDER_BY_PREFIX)
+                    else:
+                        engine.run_ollama_trials(trials,
+                                                 concurrency=concurrency,
+                                                 model_concurrency=main.OLLAMA_MODEL_CONCURRENCY,
+                                                 host=host,
+                                                 cache=cache,
+                                                 journal=batch_results,
+                                                 early_stop_tail=main.EARLY_STOP_TAIL_TOKENS,
+                                                 retry=retry)
+                finally:
+                    stop.set()
+                    heartbeat.join()
+                if trial_queue.complete(batch_id, worker_id):
+                    completed += 1
+                    print(f"[{worker_id}] batch {batch_id} done ({len(trials)} trials)")
+        finally:
+            if cache is not None:
+                cache.close()
+
+
+def main_cli(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run a trial sweep on several worker processes.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = sub.add_parser("enqueue", help="Load an input file into the queue.")
+    enqueue.add_argument("--queue", type=Path, required=True)
+    enqueue.add_argument("--input", type=Path, required=True)
+    enqueue.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    worker = sub.add_parser("worker", help="Run batches until the queue is finished.")
+    worker.add_argument("--queue", type=Path, required=True)
+    worker.add_argument("--host", help="Ollama server for this worker (default: OLLAMA_HOST / localhost).")
+    worker.add_argument("--worker-id")
+    worker.add_argument("--concurrency", type=int, default=1)
+    worker.add_argument("--lease-s", type=float, default=DEFAULT_LEASE_S)
+    worker.add_argument("--no-cache", action="store_true", help="Skip the response cache.")
+
+    status = sub.add_parser("status", help="Show batch and result counts.")
+    status.add_argument("--queue", type=Path, required=True)
+
+    merge = sub.add_parser("merge", help="Write the results in input order.")
+    merge.add_argument("--queue", type=Path, required=True)
+    merge.add_argument("--output", type=Path, required=True)
+
+    args = parser.parse_args(argv)
+    if args.command == "worker":
+        done = run_worker(args.queue, args.host, args.worker_id, args.concurrency, args.lease_s,
+                          use_cache=not args.no_cache)
+        print(f"Worker finished after {done} batches.")
+        return
+    with TrialQueue(args.queue) as trial_queue:
+        if args.command == "enqueue":
+            print(f"{trial_queue.enqueue(args.input, args.batch_size)} trials queued in {args.queue}")
+        elif args.command == "status":
+            print(json.dumps(trial_queue.status(), indent=2))
+        else:
+            failed = trial_queue.merge(args.output)
+            if failed:
+                print(f"{failed} trials failed after retries; re-run them from "
+                      f"{args.output.with_suffix('.dead-letter.csv')}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,42 @@
+import pandas as pd
+import pytest
+
+import analysis
+from decisions import detect_decision
+
+CASES = [
+    ("receiver", "If I accept, I walk away with very little. I reject the offer.", "reject"),
+    ("receiver", "Should I accept this? Something beats nothing, but the split is unfair. Decision: Reject.", "reject"),
+    ("receiver", "**Decision:** ACCEPT. I would reject a lower offer.", "accept"),
+    ("receiver", "I will accept the offer.", "accept"),
+    ("proposer", "I propose to keep $60 and give $40 to the receiver.", "40"),
+    ("proposer", "Offer: $45. I keep the remaining $55.", "45"),
+    ("proposer", "I could offer $50, but I offer $30 instead.", "30"),
+]
+
+
+@pytest.mark.parametrize("role, text, expected", CASES)
+def test_detect_decision(role, text, expected):
+    assert detect_decision(role, text).value == expected
+
+
+@pytest.mark.parametrize("role, text, expected", CASES)
+def test_extract_decisions_agrees(role, text, expected):
+    row = pd.DataFrame({"role": [role], "pot": [100], "offer": [40], "llm_response": [text]})
+    out = analysis.extract_decisions(row).iloc[0]
+    if role == "receiver":
+        assert out["decision"] == expected
+    else:
+        assert out["proposed_offer"] == float(expected)
+
+
+def test_streaming_only_stops_on_marker():
+    assert detect_decision("receiver", "If I accept, I walk away with very little. ", final=False) is None
+    assert detect_decision("receiver", "Hmm. Decision: Reject. ", final=False).value == "reject"
+    assert detect_decision("proposer", "I propose to keep $60 and give ", final=False) is None
+    assert detect_decision("proposer", "Offer: $40. ", final=False).value == "40"
+
+
+def test_streaming_ignores_marker_still_growing():
+    assert detect_decision("proposer", "Offer: $4", final=False) is None
+    assert detect_decision("receiver", "Decision: accept", final=False) is None
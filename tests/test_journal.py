@@ -0,0 +1,70 @@
+import pandas as pd
+
+import engine
+from fake_ollama import FakeOllamaServer
+from journal import TrialJournal
+
+
+def _result(trial_id, **columns):
+    return {"trial-id": trial_id, "llm_status": "ok", **columns}
+
+
+def test_completed_ids_survive_reopen(tmp_path):
+    path = tmp_path / "run.journal.jsonl"
+    with TrialJournal(path) as journal:
+        journal.append(0, _result("t0"))
+        journal.append(1, _result("t1"))
+    assert TrialJournal(path).completed_ids() == {"t0", "t1"}
+
+
+def test_truncated_last_line_is_skipped_and_appends_continue(tmp_path):
+    path = tmp_path / "run.journal.jsonl"
+    with TrialJournal(path) as journal:
+        journal.append(0, _result("t0"))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"pos": 1, "result": {"trial-id": "t1"')  # killed mid-write
+
+    with TrialJournal(path) as journal:
+        assert journal.completed_ids() == {"t0"}
+        journal.append(1, _result("t1"))
+    assert [result["trial-id"] for _, result in TrialJournal(path).iter_entries()] == ["t0", "t1"]
+
+
+def test_iter_ordered_sorts_across_spilled_runs(tmp_path):
+    journal = TrialJournal(tmp_path / "run.journal.jsonl")
+    for pos in [5, 2, 7, 0, 3, 6, 1, 4]:
+        journal.append(pos, _result(f"t{pos}"))
+    journal.close()
+    # chunksize 3 spills three sorted runs that have to be merged
+    assert [r["trial-id"] for r in journal.iter_ordered(chunksize=3)] == [f"t{pos}" for pos in range(8)]
+
+
+def test_iter_ordered_keeps_last_entry_per_position_across_runs(tmp_path):
+    journal = TrialJournal(tmp_path / "run.journal.jsonl")
+    journal.append(1, _result("t1", llm_status="skipped"))
+    journal.append(0, _result("t0"))
+    journal.append(2, _result("t2"))
+    journal.append(1, _result("t1", llm_status="ok"))  # lands in a later run than the first entry
+    journal.close()
+
+    for chunksize in (1, 2, 100):
+        results = list(journal.iter_ordered(chunksize=chunksize))
+        assert [r["trial-id"] for r in results] == ["t0", "t1", "t2"]
+        assert results[1]["llm_status"] == "ok"
+
+
+def test_run_resumes_from_journal(tmp_path):
+    trials = pd.DataFrame({"trial-id": [f"t{i}" for i in range(6)], "model": "phi3:latest",
+                           "role": "receiver", "final-prompt": "Decision?", "system-prompt": "s"})
+    path = tmp_path / "run.journal.jsonl"
+    with FakeOllamaServer(latency_s=0.0) as server:
+        with TrialJournal(path) as journal:
+            engine.run_ollama_trials(trials.iloc[:4], host=server.url, journal=journal)
+        with TrialJournal(path) as journal:
+            assert engine.run_ollama_trials(trials, host=server.url, journal=journal) is None
+        assert server.request_count == 6
+
+    saved = pd.concat(TrialJournal(path).iter_chunks())
+    assert list(saved["trial-id"]) == list(trials["trial-id"])
+    assert (saved["llm_status"] == "ok").all()
+
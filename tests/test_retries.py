@@ -0,0 +1,90 @@
+import httpx
+import ollama
+import pytest
+
+from retries import PERMANENT, TIMEOUT, TRANSIENT, RetryBudget, RetryPolicy, TrialFailed, classify_error
+
+
+class Flaky:
+    """A generate call that raises the given errors in turn, then answers."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"response": "ok"}
+
+
+def _policy(max_attempts=4, budget=None):
+    return RetryPolicy(max_attempts=max_attempts, budget=budget or RetryBudget(ratio=0.0, min_retries=100),
+                       sleep=lambda s: None)
+
+
+@pytest.mark.parametrize("error, kind", [
+    (httpx.ConnectError("refused"), TRANSIENT),
+    (ollama.ResponseError("overloaded", 503), TRANSIENT),
+    (ollama.ResponseError("queue full", 429), TRANSIENT),
+    (httpx.ReadTimeout("hung"), TIMEOUT),
+    (ollama.ResponseError("model not found", 404), PERMANENT),
+    (KeyError("response"), PERMANENT),
+])
+def test_classify_error(error, kind):
+    assert classify_error(error) == kind
+
+
+def test_transient_errors_are_retried():
+    generate = Flaky(httpx.ConnectError("refused"), httpx.ReadTimeout("hung"))
+    response, attempts = _policy().call(generate)
+    assert response == {"response": "ok"}
+    assert attempts == 3
+
+
+@pytest.mark.parametrize("error", [ollama.ResponseError("model not found", 404), ValueError("bad option")])
+def test_permanent_error_is_not_retried(error):
+    generate = Flaky(error)
+    budget = RetryBudget(ratio=0.0, min_retries=100)
+    with pytest.raises(TrialFailed) as failed:
+        _policy(budget=budget).call(generate)
+    assert generate.calls == 1
+    assert (failed.value.kind, failed.value.attempts, failed.value.error) == (PERMANENT, 1, error)
+    assert budget.stats()["retries"] == 0
+
+
+def test_gives_up_after_max_attempts():
+    generate = Flaky(*[httpx.ConnectError("refused")] * 5)
+    with pytest.raises(TrialFailed) as failed:
+        _policy(max_attempts=3).call(generate)
+    assert generate.calls == 3
+    assert failed.value.attempts == 3
+    assert not failed.value.budget_exhausted
+
+
+def test_spent_budget_stops_retries():
+    policy = _policy(budget=RetryBudget(ratio=0.0, min_retries=1))
+    assert policy.call(Flaky(httpx.ConnectError("refused")))[1] == 2  # uses the one retry
+
+    generate = Flaky(httpx.ConnectError("refused"))
+    with pytest.raises(TrialFailed) as failed:
+        policy.call(generate)
+    assert generate.calls == 1
+    assert failed.value.budget_exhausted
+    assert policy.budget.stats() == {"trials": 2, "retries": 1, "denied": 1, "remaining": 0.0}
+
+
+def test_budget_earns_retries_per_trial():
+    budget = RetryBudget(ratio=0.5, min_retries=0)
+    assert not budget.withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+
+def test_backoff_stays_under_its_cap():
+    policy = RetryPolicy(base_delay_s=0.5, max_delay_s=2.0)
+    for attempt in range(1, 8):
+        assert 0.0 <= policy.backoff_s(attempt) <= min(2.0, 0.5 * 2 ** (attempt - 1))
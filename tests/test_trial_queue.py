@@ -0,0 +1,71 @@
+import time
+
+import pandas as pd
+import pytest
+
+from trial_queue import TrialQueue
+
+
+@pytest.fixture
+def trial_queue(tmp_path):
+    """A queue with one batch of two trials."""
+    input_path = tmp_path / "sweep.csv"
+    pd.DataFrame({"trial-id": ["t0", "t1"], "model": "phi3:latest", "role": "receiver", "pot": 10,
+                  "offer": 5, "base-prompt": "Pot ${pot}, offer ${offer}"}).to_csv(input_path, index=False)
+    with TrialQueue(tmp_path / "sweep.sqlite") as q:
+        q.enqueue(input_path, batch_size=2)
+        yield q
+
+
+def _expire(trial_queue, worker_id):
+    """Leases the batch to `worker_id` with a lease that has already run out."""
+    batch_id = trial_queue.lease(worker_id, lease_s=0.01)
+    time.sleep(0.02)
+    return batch_id
+
+
+def _record_all(trial_queue, worker_id):
+    return [trial_queue.record_result(pos, {"trial-id": f"t{pos}", "worker": worker_id}, worker_id)
+            for pos in (0, 1)]
+
+
+def test_lease_is_exclusive_until_it_expires(trial_queue):
+    batch_id = trial_queue.lease("w1", lease_s=60)
+    assert trial_queue.lease("w2") is None
+    assert trial_queue.heartbeat(batch_id, "w1")
+
+
+def test_expired_lease_is_taken_over(trial_queue):
+    batch_id = _expire(trial_queue, "w1")
+    assert trial_queue.lease("w2") == batch_id
+    assert trial_queue.active_leases() == {batch_id: "w2"}
+    assert not trial_queue.heartbeat(batch_id, "w1")
+    assert trial_queue.status()["retried_batches"] == 1
+
+
+def test_worker_that_lost_its_lease_does_not_complete_the_batch(trial_queue):
+    batch_id = _expire(trial_queue, "w1")
+    trial_queue.lease("w2")
+    _record_all(trial_queue, "w1")
+
+    assert not trial_queue.complete(batch_id, "w1")
+    assert trial_queue.active_leases() == {batch_id: "w2"}
+    assert trial_queue.complete(batch_id, "w2")
+    assert trial_queue.unfinished() == 0
+
+
+def test_first_result_per_trial_wins(trial_queue):
+    batch_id = _expire(trial_queue, "w1")
+    trial_queue.lease("w2")
+    assert _record_all(trial_queue, "w2") == [True, True]
+    assert _record_all(trial_queue, "w1") == [False, False]  # late results of the old owner
+    assert [result["worker"] for _, result in trial_queue.iter_results()] == ["w2", "w2"]
+    assert trial_queue.completed_ids(batch_id) == {"t0", "t1"}
+
+
+def test_incomplete_batch_is_released(trial_queue):
+    batch_id = trial_queue.lease("w1")
+    trial_queue.record_result(0, {"trial-id": "t0"}, "w1")
+    assert not trial_queue.complete(batch_id, "w1")
+    assert trial_queue.status()["pending"] == 1
+    assert trial_queue.lease("w2") == batch_id